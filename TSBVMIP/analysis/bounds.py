@@ -0,0 +1,52 @@
+# -*- coding: utf-8  -*-
+"""
+array bounds check elimination
+
+finds array loads and stores whose index is provably in 0..arraylength-1 from the
+interval analysis, engines skip the index check at those instructions
+"""
+from . import intervals
+from .. import opcodes
+
+
+ACCESSES = {
+    opcodes.IALOAD, opcodes.FALOAD,
+    opcodes.IASTORE, opcodes.FASTORE,
+    opcodes.IALOAD_LOCALS, opcodes.FALOAD_LOCALS,
+}
+
+
+def in_bounds(array, index):
+    """
+    True when index value is provably a valid index of array value
+    """
+    if index.lo is None or index.lo < 0:
+        return False
+    if array.key is not None:
+        bound = index.bound(array.key)
+        if bound is not None and bound <= -1:
+            return True
+    return index.hi is not None and array.lo is not None and index.hi < array.lo
+
+
+def operands(ins, frame):
+    """
+    array and index values accessed by ins, frame is the analysis frame before it
+    """
+    op = ins.opcode
+    if op in (opcodes.IALOAD_LOCALS, opcodes.FALOAD_LOCALS):
+        return frame.locals[ins.array_index], frame.locals[ins.index]
+    if op in (opcodes.IASTORE, opcodes.FASTORE):
+        return frame.stack[-3], frame.stack[-2]
+    return frame.stack[-2], frame.stack[-1]
+
+
+def safe_accesses(method):
+    """
+    pcs of array loads and stores of verified method, which never access index out of bounds
+    """
+    if not any(ins.opcode in ACCESSES for ins in method.code):
+        return frozenset()
+    frames = intervals.analyze(method)
+    return frozenset(pc for pc, ins in enumerate(method.code)
+                     if ins.opcode in ACCESSES and frames[pc] is not None and in_bounds(*operands(ins, frames[pc])))
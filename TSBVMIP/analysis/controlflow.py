@@ -6,6 +6,7 @@ from ..instructions import InsBranch, InsGoto, InsReturn
 
 
 class BasicBlock():
+    __slots__ = ('instruction_indexes', 'sucessors', 'predecessors')
 
     def __init__(self, instruction_indexes=None, sucessors=None, predecessors=None):
         if not predecessors:
@@ -45,6 +46,12 @@ class BasicBlock():
     def start_inst_index(self):
         return self.instruction_indexes[0]
 
+    def cost(self, code):
+        """
+        number of instructions executed by the block, superinstructions count as the instructions they stand for
+        """
+        return sum(len(code[i].expand()) for i in self.instruction_indexes)
+
 
 class ControlFlowAnalyzer():
 
@@ -79,6 +86,9 @@ class ControlFlowAnalyzer():
                     bb.predecessors.append(bb_prev)
                     bb_prev.sucessors.append(bb)
                 bb.append(i)
+                if i in self.jump_source or isinstance(ins, InsReturn):
+                    self.basic_blocks.append(bb)
+                    bb = BasicBlock()
             elif i in self.jump_source or isinstance(ins, InsReturn):
                 bb.append(i)
                 self.basic_blocks.append(bb)
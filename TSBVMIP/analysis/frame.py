@@ -2,10 +2,12 @@
 
 import itertools
 from ..exceptions import VerifyException
+from ..instructions import InsFused
 from .. import opcodes
 
 
 class Frame():
+    __slots__ = ('locals', 'local_types', 'stack', 'return_value')
 
     def __init__(self):
         self.locals = []
@@ -47,6 +49,10 @@ class Frame():
         self.local_types.append(t)
 
     def execute(self, insn, interpreter):
+        if isinstance(insn, InsFused):
+            for part in insn.parts:
+                self.execute(part, interpreter)
+            return
         op = insn.opcode
         if op in [opcodes.IPUSH, opcodes.FPUSH]:
             self.push(interpreter.new_operation(insn))
@@ -97,18 +103,30 @@ class Frame():
         else:
             raise VerifyException('trying to execute unknown instruction %s' % insn)
 
-    def merge(self, frame, interpreter):
+    def merge(self, frame, interpreter, widen=False):
+        """
+        merge frame into this one, returns True when this frame changed
+        slots holding one value object hold the same runtime value, they keep sharing
+        the merged value only when they share a value in both frames
+        """
         if self.stack_size != frame.stack_size:
             raise VerifyException('incompatible stack heights %s %s' % (self.stack_size, frame.stack_size))
+        operation = interpreter.widen if widen else interpreter.merge
         changes = False
+        merged = {}
+        shared = {}
         for i, (v1, v2) in enumerate(zip(self.values, frame.values)):
-            v = interpreter.merge(v1, v2)
-            if not v.equals(v1):
+            key = (id(v1), id(v2))
+            v = merged.get(key)
+            if v is None:
+                v = merged[key] = operation(v1, v2)
+            if shared.setdefault(id(v1), v) is not v or not v.equals(v1):
+                changes = True
+            if v is not v1:
                 if i < len(self.locals):
                     self.locals[i] = v
                 else:
-                    self.stack[i] = v
-                changes = True
+                    self.stack[i - len(self.locals)] = v
         return changes
 
     def copy(self):
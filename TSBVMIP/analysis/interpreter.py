@@ -32,6 +32,19 @@ class InterpreterBase():
     def merge(self, v1, v2):
         raise NotImplementedError()
 
+    def widen(self, v1, v2):
+        """
+        merge at loop heads, has to reach a fixed point after finite number of merges
+        """
+        return self.merge(v1, v2)
+
+    def branch_operation(self, ins, before, after, taken):
+        """
+        frame after conditional jump ins on taken or not taken path, before is the frame before ins,
+        None when the path is never taken
+        """
+        return after
+
 
 class BasicInterpreter(InterpreterBase):
 
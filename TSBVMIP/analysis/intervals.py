@@ -0,0 +1,361 @@
+# -*- coding: utf-8  -*-
+"""
+interval analysis of integer values
+
+ints are tracked as an interval <lo, hi> and upper bounds relative to array lengths,
+value <= length of array key + offset. arrays carry an interval of their length and,
+when they are method arguments, a key identifying them. lengths of arrays never
+change, so relations to them stay valid wherever the values move.
+
+the analysis runs on the Verifier worklist, conditional int jumps refine compared
+values on both paths and loop heads are widened, so every loop reaches a fixed point.
+slots holding one value object hold the same runtime value, refining a compared
+value refines every slot it is stored in.
+"""
+import itertools
+
+from . import values
+from .interpreter import BasicVerifier
+from .verifier import Verifier
+from .. import opcodes
+from .. import value_types
+from ..instructions import InsFused
+
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+# relation of value1 to value2 when int conditional jump is taken and when it is not
+RELATIONS = {
+    opcodes.IF_ICMPEQ: ('eq', 'ne'),
+    opcodes.IF_ICMPNE: ('ne', 'eq'),
+    opcodes.IF_ICMPGE: ('ge', 'lt'),
+    opcodes.IF_ICMPGT: ('gt', 'le'),
+    opcodes.IF_ICMPLE: ('le', 'gt'),
+    opcodes.IF_ICMPLT: ('lt', 'ge'),
+}
+
+
+class IntervalValue(values.BasicValue):
+
+    """
+    basic value with bounds, None bound is unbounded
+    ints use lo, hi, bounds {array key: offset} and length_of, the key of array whose length the value is
+    arrays use lo, hi for their length and key
+    """
+    __slots__ = ('lo', 'hi', 'bounds', 'key', 'length_of')
+
+    def __init__(self, type, lo=None, hi=None, bounds=None, key=None, length_of=None):
+        super().__init__(type)
+        self.lo = lo
+        self.hi = hi
+        self.bounds = bounds or {}
+        self.key = key
+        self.length_of = length_of
+
+    def __str__(self):
+        return "IntervalValue %s <%s, %s> %s" % (self.type, self.lo, self.hi, self.relations)
+
+    @property
+    def relations(self):
+        parts = ['<= len(%s) %+d' % item for item in sorted(self.bounds.items())]
+        if self.key is not None:
+            parts.append('array %s' % self.key)
+        if self.length_of is not None:
+            parts.append('== len(%s)' % self.length_of)
+        return ', '.join(parts)
+
+    def equals(self, value):
+        return super().equals(value) and isinstance(value, IntervalValue) and \
+            (self.lo, self.hi, self.bounds, self.key, self.length_of) == \
+            (value.lo, value.hi, value.bounds, value.key, value.length_of)
+
+    @property
+    def is_int(self):
+        return self.type is value_types.INT
+
+    @property
+    def is_constant(self):
+        return self.lo is not None and self.lo == self.hi
+
+    def bound(self, key):
+        """
+        smallest known offset of value to length of array key, None when unknown
+        """
+        candidates = [self.bounds.get(key), 0 if self.length_of == key else None, self.hi]
+        candidates = [c for c in candidates if c is not None]
+        return min(candidates) if candidates else None
+
+    @property
+    def bound_keys(self):
+        keys = set(self.bounds)
+        if self.length_of is not None:
+            keys.add(self.length_of)
+        return keys
+
+
+def _add(a, b):
+    return None if a is None or b is None else a + b
+
+
+def _min(a, b):
+    # None is unbounded, lower of two upper bounds
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _max(a, b):
+    # None is unbounded, higher of two lower bounds
+    return b if a is None else a if b is None else max(a, b)
+
+
+def new_int(lo=None, hi=None, bounds=None, length_of=None):
+    """
+    int value without bounds implied by its interval, None when the interval is empty
+    """
+    if lo is not None and hi is not None and lo > hi:
+        return None
+    bounds = dict((key, offset) for key, offset in (bounds or {}).items()
+                  if (hi is None or offset < hi) and not (key == length_of and offset >= 0))
+    return IntervalValue(value_types.INT, lo, hi, bounds, length_of=length_of)
+
+
+def fits_int64(value):
+    """
+    True when int value provably fits into signed 64 bit integer
+    """
+    return value.lo is not None and value.hi is not None and INT64_MIN <= value.lo and value.hi <= INT64_MAX
+
+
+def _divide(lo1, hi1, lo2, hi2):
+    """
+    interval of floor division, divisor interval does not contain zero
+    """
+    if None not in (lo1, hi1, lo2, hi2):
+        corners = [a // b for a in (lo1, hi1) for b in (lo2, hi2)]
+        return min(corners), max(corners)
+    if None not in (lo1, hi1):
+        # |a // b| <= |a| for |b| >= 1
+        m = max(abs(lo1), abs(hi1))
+        return -m, m
+    return None, None
+
+
+class IntervalInterpreter(BasicVerifier):
+
+    """
+    verifier tracking intervals of ints and lengths of arrays
+    """
+
+    def __init__(self):
+        self.keys = itertools.count()
+
+    def new_value(self, v):
+        if v is None:
+            return IntervalValue(None)
+        elif v == value_types.INT:
+            return new_int()
+        elif v == value_types.FLOAT:
+            return IntervalValue(value_types.FLOAT)
+        elif v in (value_types.INT_ARRAY, value_types.FLOAT_ARRAY):
+            # arguments never change their length, each gets its own key
+            return IntervalValue(v, 0, INT64_MAX, key=next(self.keys))
+        return super().new_value(v)
+
+    def new_operation(self, ins):
+        if ins.opcode == opcodes.IPUSH:
+            return new_int(ins.argument.value, ins.argument.value)
+        return IntervalValue(super().new_operation(ins).type)
+
+    def unary_operation(self, ins, value):
+        result = super().unary_operation(ins, value)
+        op = ins.opcode
+        if op == opcodes.NEWARRAY:
+            # newarray fails on sizes below 1
+            hi = INT64_MAX if value.hi is None else min(max(value.hi, 1), INT64_MAX)
+            return IntervalValue(result.type, _max(value.lo, 1), hi)
+        elif op == opcodes.ARRAYLENGTH:
+            return new_int(value.lo, value.hi, length_of=value.key)
+        elif result is None or op in (opcodes.IRETURN, opcodes.FRETURN, opcodes.ARETURN):
+            return result
+        return IntervalValue(result.type) if result.type is not value_types.INT else new_int()
+
+    def binary_operation(self, ins, value1, value2):
+        result = super().binary_operation(ins, value1, value2)
+        op = ins.opcode
+        if op == opcodes.IADD:
+            return self.add(value1, value2)
+        elif op == opcodes.ISUB:
+            return self.sub(value1, value2)
+        elif op == opcodes.IMUL:
+            return self.mul(value1, value2)
+        elif op == opcodes.IDIV:
+            return self.div(value1, value2)
+        elif op == opcodes.IALOAD:
+            return new_int(INT64_MIN, INT64_MAX)
+        elif result is None:
+            return None
+        return IntervalValue(result.type)
+
+    def add(self, value1, value2):
+        bounds = {}
+        for a, b in ((value1, value2), (value2, value1)):
+            for key in a.bound_keys:
+                offset = _add(a.bound(key), b.hi)
+                if offset is not None:
+                    bounds[key] = _min(bounds.get(key), offset)
+        return new_int(_add(value1.lo, value2.lo), _add(value1.hi, value2.hi), bounds)
+
+    def sub(self, value1, value2):
+        bounds = {}
+        if value2.lo is not None:
+            bounds = dict((key, value1.bound(key) - value2.lo) for key in value1.bound_keys)
+        lo = None if value1.lo is None or value2.hi is None else value1.lo - value2.hi
+        hi = None if value1.hi is None or value2.lo is None else value1.hi - value2.lo
+        return new_int(lo, hi, bounds)
+
+    def mul(self, value1, value2):
+        ends = (value1.lo, value1.hi, value2.lo, value2.hi)
+        if None not in ends:
+            corners = [a * b for a in ends[:2] for b in ends[2:]]
+            return new_int(min(corners), max(corners))
+        if value1.lo is not None and value2.lo is not None and value1.lo >= 0 and value2.lo >= 0:
+            return new_int(value1.lo * value2.lo)
+        return new_int()
+
+    def div(self, value1, value2):
+        # division by zero fails, only negative and positive divisors give a result
+        parts = []
+        if value2.hi is None or value2.hi >= 1:
+            parts.append(_divide(value1.lo, value1.hi, _max(value2.lo, 1), value2.hi))
+        if value2.lo is None or value2.lo <= -1:
+            parts.append(_divide(value1.lo, value1.hi, value2.lo, _min(value2.hi, -1)))
+        if not parts:
+            return new_int()
+        lo = None if any(p[0] is None for p in parts) else min(p[0] for p in parts)
+        hi = None if any(p[1] is None for p in parts) else max(p[1] for p in parts)
+        return new_int(lo, hi)
+
+    def return_operation(self, ins, value, expected):
+        # expected values are types only, intervals do not take part in the check
+        super().return_operation(ins, values.BasicValue(value.type), expected)
+
+    def merge(self, v1, v2):
+        if v1 is v2:
+            return v1
+        if not values.BasicValue(v1.type).equals(v2):
+            return IntervalValue(None)
+        if v1.is_int:
+            bounds = dict((key, max(v1.bound(key), v2.bound(key))) for key in v1.bound_keys | v2.bound_keys
+                          if v1.bound(key) is not None and v2.bound(key) is not None)
+            return new_int(None if v1.lo is None or v2.lo is None else min(v1.lo, v2.lo),
+                           None if v1.hi is None or v2.hi is None else max(v1.hi, v2.hi),
+                           bounds, v1.length_of if v1.length_of == v2.length_of else None)
+        if v1.is_array_reference:
+            return IntervalValue(v1.type, min(v1.lo, v2.lo), max(v1.hi, v2.hi),
+                                 key=v1.key if v1.key == v2.key else None)
+        return IntervalValue(v1.type)
+
+    def widen(self, v1, v2):
+        """
+        bounds growing since the last merge are dropped
+        """
+        merged = self.merge(v1, v2)
+        if merged is v1:
+            return merged
+        if merged.is_array_reference:
+            return IntervalValue(merged.type, merged.lo if merged.lo == v1.lo else 0,
+                                 merged.hi if merged.hi == v1.hi else INT64_MAX, key=merged.key)
+        if not merged.is_int:
+            return merged
+        bounds = dict((key, offset) for key, offset in merged.bounds.items()
+                      if v1.bound(key) is not None and offset <= v1.bound(key))
+        return new_int(merged.lo if merged.lo == v1.lo else None,
+                       merged.hi if merged.hi == v1.hi else None,
+                       bounds, merged.length_of)
+
+    def branch_operation(self, ins, before, after, taken):
+        if isinstance(ins, InsFused):
+            # fused compare and branch, compared values are pushed by the parts before the branch
+            before = before.copy()
+            for part in ins.parts[:-1]:
+                before.execute(part, self)
+            ins = ins.parts[-1]
+        relations = RELATIONS.get(ins.opcode)
+        if relations is None:
+            return after
+        value1, value2 = before.stack[-2:]
+        if value1 is value2:
+            return after
+        refined = refine(value1, value2, relations[0 if taken else 1])
+        if refined is None:
+            return None
+        frame = after.copy()
+        replacements = {id(value1): refined[0], id(value2): refined[1]}
+        frame.locals = [replacements.get(id(v), v) for v in frame.locals]
+        frame.stack = [replacements.get(id(v), v) for v in frame.stack]
+        return frame
+
+
+def _less(value1, value2, offset):
+    """
+    value1 and value2 refined by value1 <= value2 + offset
+    """
+    bounds = dict(value1.bounds)
+    for key in value2.bound_keys:
+        bounds[key] = _min(value1.bound(key), value2.bound(key) + offset)
+    r1 = new_int(value1.lo, _min(value1.hi, _add(value2.hi, offset)), bounds, value1.length_of)
+    r2 = new_int(_max(value2.lo, _add(value1.lo, -offset)), value2.hi, value2.bounds, value2.length_of)
+    if r1 is None or r2 is None:
+        return None
+    return r1, r2
+
+
+def _not_equal(value1, value2):
+    """
+    value1 refined by value1 != value2
+    """
+    lo, hi = value1.lo, value1.hi
+    bounds = dict(value1.bounds)
+    if value2.is_constant:
+        lo = lo + 1 if lo == value2.lo else lo
+        hi = hi - 1 if hi == value2.lo else hi
+    if value2.length_of is not None and value1.bound(value2.length_of) == 0:
+        bounds[value2.length_of] = -1
+    return new_int(lo, hi, bounds, value1.length_of)
+
+
+def refine(value1, value2, relation):
+    """
+    pair of int values refined by value1 <relation> value2, None when the relation cannot hold
+    """
+    if not value1.is_int or not value2.is_int:
+        return None
+    if relation == 'lt':
+        return _less(value1, value2, -1)
+    elif relation == 'le':
+        return _less(value1, value2, 0)
+    elif relation in ('gt', 'ge'):
+        refined = refine(value2, value1, 'lt' if relation == 'gt' else 'le')
+        return refined and (refined[1], refined[0])
+    elif relation == 'eq':
+        bounds = dict((key, _min(value1.bound(key), value2.bound(key)))
+                      for key in value1.bound_keys | value2.bound_keys)
+        equal = new_int(_max(value1.lo, value2.lo), _min(value1.hi, value2.hi), bounds,
+                        value1.length_of if value1.length_of is not None else value2.length_of)
+        # both slots hold the same runtime value, they share it
+        return equal and (equal, equal)
+    r1 = _not_equal(value1, value2)
+    r2 = _not_equal(value2, value1)
+    if r1 is None or r2 is None:
+        return None
+    return r1, r2
+
+
+def analyze(method):
+    """
+    frames with interval values of locals and stack before every instruction of verified method,
+    None for unreachable instructions
+    """
+    verifier = Verifier(IntervalInterpreter())
+    verifier.verify(method)
+    return verifier.frames
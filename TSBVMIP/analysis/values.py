@@ -4,6 +4,7 @@ from .. import value_types
 
 
 class BasicValue():
+    __slots__ = ('type',)
 
     def __init__(self, type):
         self.type = type
@@ -4,9 +4,21 @@ from ..instructions import InsReturn, InsGoto, InsBranch
 from .. import opcodes
 from ..exceptions import VerifyException
 from .frame import Frame
+from .interpreter import BasicVerifier
 from .controlflow import ControlFlowAnalyzer
 
 
+def verify_method(method):
+    """
+    verify method unless it was verified and not changed since, verified method is frozen
+    returns the method
+    """
+    if not method.verified:
+        Verifier(BasicVerifier()).verify(method)
+        method.freeze()
+    return method
+
+
 class Verifier():
 
     def __init__(self, interpreter):
@@ -15,6 +27,7 @@ class Verifier():
         self.frames = None
         self.queue = []
         self.method = None
+        self.loop_heads = None
 
     def verify(self, method):
         self.verify_jump_points(method)
@@ -32,7 +45,7 @@ class Verifier():
         return True
 
     def verify_load_store_vars(self, method):
-        for inst in method.code:
+        for inst in (part for ins in method.code for part in ins.expand()):
             if inst.opcode in [opcodes.ISTORE, opcodes.FSTORE, opcodes.ASTORE]:
                 pos = inst.argument.value
                 lv = method.variables[pos]
@@ -53,6 +66,9 @@ class Verifier():
         self.method = method
         self.changed = [False for _ in method.code]
         self.frames = [None for _ in method.code]
+        # targets of backward jumps, every loop in code has one
+        self.loop_heads = set(ins.argument.value for i, ins in enumerate(method.code)
+                              if isinstance(ins, (InsGoto, InsBranch)) and ins.argument.value <= i)
 
         current = Frame()
         current.set_return(self.interpreter.new_value(method.return_type.vtype))
@@ -74,11 +90,15 @@ class Verifier():
 
             current = frame.copy()
             current.execute(ins, self.interpreter)
-            if not isinstance(ins, InsReturn) and not isinstance(ins, InsGoto):
+            taken = current
+            if isinstance(ins, InsBranch):
+                taken = self.interpreter.branch_operation(ins, frame, current, True)
+                current = self.interpreter.branch_operation(ins, frame, current, False)
+            if not isinstance(ins, InsReturn) and not isinstance(ins, InsGoto) and current is not None:
                 self.merge(ins_int + 1, current)
 
-            if isinstance(ins, InsGoto) or isinstance(ins, InsBranch):
-                self.merge(ins.argument.value, current)
+            if (isinstance(ins, InsGoto) or isinstance(ins, InsBranch)) and taken is not None:
+                self.merge(ins.argument.value, taken)
 
         return True
 
@@ -90,7 +110,7 @@ class Verifier():
             self.frames[i] = frame.copy()
             changes = True
         else:
-            changes = old_frame.merge(frame, self.interpreter)
+            changes = old_frame.merge(frame, self.interpreter, i in self.loop_heads)
 
         if changes and not self.changed[i]:
             self.changed[i] = True
@@ -0,0 +1,223 @@
+# -*- coding: utf-8  -*-
+"""
+basic block closure engine
+
+every basic block found by ControlFlowAnalyzer becomes one python function,
+which runs the straight-line instructions of the block on the unboxed stack
+and returns the index of the next block, the engine dispatches once per block
+instead of once per instruction. instructions are translated one by one from
+fixed templates, no stack analysis is done, so compiling is cheap.
+array accesses check the index unless analysis.bounds proved them safe
+"""
+from . import dispatch
+from . import opcodes
+from .analysis.controlflow import ControlFlowAnalyzer
+from .compiler import COMPARE, MATH, EAGER_MATH
+from .exceptions import RuntimeException
+from .instructions import InsArgument, InsBranch, InsJump, InsReturn
+from .value_containers import array_types, element_error, index_error, new_raw_array
+
+
+FINISHED = dispatch.FINISHED
+
+TEMPLATES = {
+    opcodes.IPUSH: ['push({const})'],
+    opcodes.FPUSH: ['push({const})'],
+    opcodes.ILOAD: ['push(variables[{arg}])'],
+    opcodes.FLOAD: ['push(variables[{arg}])'],
+    opcodes.ALOAD: ['push(variables[{arg}])'],
+    opcodes.ISTORE: ['variables[{arg}] = pop()'],
+    opcodes.FSTORE: ['variables[{arg}] = pop()'],
+    opcodes.ASTORE: ['variables[{arg}] = pop()'],
+    opcodes.GOTO: ['return {target}'],
+    opcodes.IRETURN: ['return %d' % FINISHED],
+    opcodes.FRETURN: ['return %d' % FINISHED],
+    opcodes.ARETURN: ['return %d' % FINISHED],
+    opcodes.NOP: [],
+    opcodes.POP: ['pop()'],
+    opcodes.DUP: ['push(stack[-1])'],
+    opcodes.SWAP: ['stack[-1], stack[-2] = stack[-2], stack[-1]'],
+    opcodes.IFNULL: ['if pop() is None:', '    return {target}', 'return {next}'],
+    opcodes.IFNONNULL: ['if pop() is not None:', '    return {target}', 'return {next}'],
+    opcodes.F2I: ['stack[-1] = int(stack[-1])'],
+    opcodes.I2F: ['stack[-1] = float(stack[-1])'],
+    opcodes.NEWARRAY: ['stack[-1] = new_raw_array(array_types[{arg}], stack[-1])'],
+    opcodes.IALOAD: ['value2 = pop()', 'stack[-1] = stack[-1][value2]'],
+    opcodes.FALOAD: ['value2 = pop()', 'stack[-1] = stack[-1][value2]'],
+    opcodes.ARRAYLENGTH: ['stack[-1] = len(stack[-1])'],
+    opcodes.IASTORE: ['value3 = pop()', 'value2 = pop()', 'try:', '    pop()[value2] = value3',
+                      'except (OverflowError, ValueError):', '    raise element_error(value3)'],
+    opcodes.FASTORE: ['value3 = pop()', 'value2 = pop()', 'pop()[value2] = value3'],
+}
+
+# array accesses with the index check, used at pcs not proven safe
+CHECKED_TEMPLATES = {
+    opcodes.IALOAD: ['value2 = pop()', 'if not 0 <= value2 < len(stack[-1]):',
+                     '    raise index_error(value2, stack[-1])', 'stack[-1] = stack[-1][value2]'],
+    opcodes.IASTORE: ['value3 = pop()', 'value2 = pop()', 'value1 = pop()', 'if not 0 <= value2 < len(value1):',
+                      '    raise index_error(value2, value1)', 'try:', '    value1[value2] = value3',
+                      'except (OverflowError, ValueError):', '    raise element_error(value3)'],
+    opcodes.FASTORE: ['value3 = pop()', 'value2 = pop()', 'value1 = pop()', 'if not 0 <= value2 < len(value1):',
+                      '    raise index_error(value2, value1)', 'value1[value2] = value3'],
+}
+CHECKED_TEMPLATES[opcodes.FALOAD] = CHECKED_TEMPLATES[opcodes.IALOAD]
+
+for _op, _sign in COMPARE.items():
+    TEMPLATES[_op] = ['value2 = pop()', 'if pop() %s value2:' % _sign, '    return {target}', 'return {next}']
+for _op, _sign in list(MATH.items()) + list(EAGER_MATH.items()):
+    TEMPLATES[_op] = ['value2 = pop()', 'stack[-1] = stack[-1] %s value2' % _sign]
+
+
+class BlockCode():
+
+    """
+    compiled blocks with block index of every pc, fuel cost and leader pc of every block
+    """
+
+    def __init__(self, blocks, block_index, sizes, leaders, source=None):
+        self.blocks = blocks
+        self.block_index = block_index
+        self.sizes = sizes
+        self.leaders = leaders
+        self.source = source
+
+    def __len__(self):
+        return len(self.blocks)
+
+
+def generate_source(method, bbs, block_index, safe=()):
+    """
+    python source of one function per basic block, named block0..blockN,
+    and constants used by the source, array accesses at pcs in safe are not checked
+    """
+    lines = []
+    constants = {}
+    for i, bb in enumerate(bbs):
+        lines.append('def block%d(stack, variables):' % i)
+        lines.append('    push = stack.append')
+        lines.append('    pop = stack.pop')
+        for pc in bb.instruction_indexes:
+            # superinstructions are translated through the instructions they stand for
+            for part in method.code[pc].expand():
+                try:
+                    template = TEMPLATES[part.opcode] if pc in safe else \
+                        CHECKED_TEMPLATES.get(part.opcode, TEMPLATES[part.opcode])
+                except KeyError:
+                    raise RuntimeException('cannot compile instruction %s' % part)
+                fields = {'next': block_index[pc + 1]}
+                if isinstance(part, (InsJump, InsBranch)):
+                    fields['target'] = block_index[part.argument.value]
+                elif part.opcode in (opcodes.IPUSH, opcodes.FPUSH):
+                    fields['const'] = 'const%d' % len(constants)
+                    constants[fields['const']] = part.argument.value
+                elif isinstance(part, InsArgument):
+                    fields['arg'] = part.argument.value
+                lines.extend('    ' + line.format(**fields) for line in template)
+        if not isinstance(method.code[bb.end_inst_index], (InsJump, InsBranch, InsReturn)):
+            lines.append('    return %d' % block_index[bb.end_inst_index + 1])
+    return '\n'.join(lines) + '\n', constants
+
+
+def decode(method, safe=()):
+    """
+    compile method code into list of block functions
+    array accesses at pcs in safe, as from analysis.bounds.safe_accesses, are not checked
+    """
+    bbs = ControlFlowAnalyzer().analyze(method)
+    # pc to index of the block starting there, the extra last item maps
+    # dispatch.FINISHED (-1) to finished block index
+    block_index = [FINISHED] * (len(method.code) + 1)
+    for i, bb in enumerate(bbs):
+        block_index[bb.start_inst_index] = i
+    source, namespace = generate_source(method, bbs, block_index, safe)
+    namespace['new_raw_array'] = new_raw_array
+    namespace['index_error'] = index_error
+    namespace['element_error'] = element_error
+    namespace['array_types'] = array_types
+    exec(compile(source, '<tsbvmip blocks %s>' % method.function_name, 'exec'), namespace)
+    blocks = [namespace['block%d' % i] for i in range(len(bbs))]
+    return BlockCode(blocks, block_index, [bb.cost(method.code) for bb in bbs],
+                     [bb.start_inst_index for bb in bbs], source)
+
+
+def block_table(method):
+    """
+    number of instructions and fuel cost of the rest of the basic block from every pc,
+    a frame stopped inside a block is charged only for the instructions it has left
+    """
+    code = method.code
+    lengths = [0] * len(code)
+    costs = [0] * len(code)
+    for bb in ControlFlowAnalyzer().analyze(method):
+        length = cost = 0
+        for pc in reversed(bb.instruction_indexes):
+            length += 1
+            cost += len(code[pc].expand())
+            lengths[pc] = length
+            costs[pc] = cost
+    return lengths, costs
+
+
+def execute(code, frame):
+    """
+    run compiled blocks on frame, frame.pc has to point at the start of a block
+    """
+    stack = frame.stack
+    variables = frame.variables
+    blocks = code.blocks
+    b = code.block_index[frame.pc]
+    while b >= 0:
+        b = blocks[b](stack, variables)
+    frame.pc = FINISHED
+    frame.finished = True
+    frame.return_value = stack.pop()
+
+
+def execute_metered(code, frame, fuel):
+    """
+    same as execute, charges fuel cost of every block before it runs
+    raises OutOfFuelException when the block costs more than the rest of fuel,
+    the frame is then left at the start of the block and can be continued
+    """
+    stack = frame.stack
+    variables = frame.variables
+    blocks = code.blocks
+    sizes = code.sizes
+    remaining = fuel
+    b = code.block_index[frame.pc]
+    try:
+        while b >= 0:
+            cost = sizes[b]
+            if cost > remaining:
+                frame.pc = code.leaders[b]
+                raise dispatch.out_of_fuel(remaining, frame.pc, cost)
+            remaining -= cost
+            b = blocks[b](stack, variables)
+    finally:
+        frame.fuel_used += fuel - remaining
+    frame.pc = FINISHED
+    frame.finished = True
+    frame.return_value = stack.pop()
+
+
+def execute_steps(code, frame, steps):
+    """
+    run at most steps blocks on frame, returns True when the frame finished
+    unfinished frame is left at the start of the next block and can be continued
+    """
+    if frame.finished:
+        return True
+    stack = frame.stack
+    variables = frame.variables
+    blocks = code.blocks
+    b = code.block_index[frame.pc]
+    while b >= 0 and steps > 0:
+        b = blocks[b](stack, variables)
+        steps -= 1
+    if b >= 0:
+        frame.pc = code.leaders[b]
+        return False
+    frame.pc = FINISHED
+    frame.finished = True
+    frame.return_value = stack.pop()
+    return True
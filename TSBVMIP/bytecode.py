@@ -0,0 +1,280 @@
+# -*- coding: utf-8  -*-
+"""
+binary bytecode files (.tsbc)
+
+compact versioned form of a parsed method, loaded without YAML and without
+the two parser passes. layout, all numbers little endian:
+
+    header      magic b'TSBC', version, return type, number of arguments,
+                length of function name, number of variables, labels,
+                constants and instructions
+    name        utf-8 function name
+    variables   type code byte of every local variable, arguments first
+    labels      index, name length and utf-8 name of every label,
+                labels of variables first, in order of definition
+    constants   tag byte and payload of every ipush/fpush argument
+    code        opcode byte and 32 bit operand of every instruction, operand is
+                index into constants for pushes, variable index, jump target
+                or array type for other instructions with argument, 0 otherwise
+
+files are memory mapped by load and all instructions are decoded at once from
+the mapped code, equal records share one immutable Instruction object decoded
+once. superinstructions are not stored, code is dumped before fusion
+"""
+import mmap
+import struct
+
+from . import instructions
+from . import opcodes
+from .exceptions import BytecodeException
+from .method import Method
+from .value_containers import ValueInt, ValueFloat, ValueIntArrayRef, ValueFloatArrayRef, float_value, int_value
+
+
+MAGIC = b'TSBC'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHBxIIIIII')
+LABEL = struct.Struct('<II')
+CODE = struct.Struct('<BI')
+
+# constant tags
+INT = 1
+FLOAT = 2
+BIGINT = 3
+
+INT64 = struct.Struct('<q')
+FLOAT64 = struct.Struct('<d')
+LENGTH = struct.Struct('<I')
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+OPERAND_MAX = 2 ** 32 - 1
+
+# Value* classes of variables and return type
+TYPES = [ValueInt, ValueFloat, ValueIntArrayRef, ValueFloatArrayRef]
+TYPE_CODES = dict((c, i) for i, c in enumerate(TYPES))
+
+# how operand of an instruction is stored
+NO_ARGUMENT = 0
+CONSTANT = 1
+OPERAND = 2
+
+INSTRUCTIONS = dict((cls.opcode, cls) for cls in instructions.keywords.values())
+
+
+def argument_kind(cls):
+    if issubclass(cls, instructions.InsNoArgument):
+        return NO_ARGUMENT
+    if cls in (instructions.InsIPush, instructions.InsFPush):
+        return CONSTANT
+    return OPERAND
+
+
+KINDS = dict((opcode, argument_kind(cls)) for opcode, cls in INSTRUCTIONS.items())
+
+
+class Writer():
+
+    def __init__(self):
+        self.constants = bytearray()
+        self.constant_ids = {}
+
+    def constant(self, v):
+        if isinstance(v, float):
+            key = (FLOAT, FLOAT64.pack(v))
+        else:
+            key = (INT, v)
+        if key not in self.constant_ids:
+            self.constant_ids[key] = len(self.constant_ids)
+            out = self.constants
+            if isinstance(v, float):
+                out.append(FLOAT)
+                out += key[1]
+            elif INT64_MIN <= v <= INT64_MAX:
+                out.append(INT)
+                out += INT64.pack(v)
+            else:
+                data = v.to_bytes((v.bit_length() + 8) // 8, 'little', signed=True)
+                out.append(BIGINT)
+                out += LENGTH.pack(len(data)) + data
+        return self.constant_ids[key]
+
+    def code(self, code):
+        out = bytearray()
+        for ins in code:
+            kind = KINDS.get(ins.opcode)
+            if kind is None:
+                raise BytecodeException('instruction %s cannot be stored, dump code before fusion' % ins)
+            if kind == NO_ARGUMENT:
+                operand = 0
+            elif kind == CONSTANT:
+                operand = self.constant(ins.argument.value)
+            else:
+                operand = ins.argument.value
+                if not 0 <= operand <= OPERAND_MAX:
+                    raise BytecodeException('argument of instruction %s cannot be stored' % ins)
+            out += CODE.pack(ins.opcode, operand)
+        return out
+
+
+def type_code(value):
+    try:
+        return TYPE_CODES[value.__class__]
+    except KeyError:
+        raise BytecodeException('type %s cannot be stored' % value)
+
+
+def dumps(method):
+    """
+    bytecode of parsed method as bytes
+    """
+    writer = Writer()
+    code = writer.code(method.code)
+    name = str(method.function_name).encode('utf-8')
+    labels = bytearray()
+    for label, index in method.labels.items():
+        data = label.encode('utf-8')
+        labels += LABEL.pack(index, len(data)) + data
+    header = HEADER.pack(MAGIC, VERSION, type_code(method.return_type), method.argument_count, len(name),
+                         len(method.variables), len(method.labels), len(writer.constant_ids), len(method.code))
+    variables = bytes(type_code(v) for v in method.variables)
+    return header + name + variables + bytes(labels) + bytes(writer.constants) + bytes(code)
+
+
+def dump(method, fname):
+    """
+    write bytecode of parsed method into file fname
+    """
+    with open(fname, 'wb') as f:
+        f.write(dumps(method))
+
+
+class Bytecode():
+
+    """
+    method stored in bytecode data, any buffer, the header, variables, labels and
+    constants are read at once, instructions by method
+    """
+
+    def __init__(self, data):
+        self.data = data
+        if len(data) < HEADER.size:
+            raise BytecodeException('bytecode is truncated')
+        magic, version, return_type, self.argument_count, name_length, n_variables, n_labels, n_constants, \
+            self.length = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise BytecodeException('not a bytecode file')
+        if version != VERSION:
+            raise BytecodeException('unsupported bytecode version %d, expected %d' % (version, VERSION))
+        self.offset = HEADER.size
+        self.return_type = self.value_type(return_type)
+        self.function_name = self.take(name_length).decode('utf-8')
+        self.variables = [self.value_type(code) for code in self.take(n_variables)]
+        self.labels = {}
+        for _ in range(n_labels):
+            index, length = self.unpack(LABEL)
+            self.labels[self.take(length).decode('utf-8')] = index
+        self.constants = [self.constant() for _ in range(n_constants)]
+        self.code_offset = self.offset
+        if self.code_offset + self.length * CODE.size != len(data):
+            raise BytecodeException('bytecode is truncated' if self.code_offset + self.length * CODE.size > len(data)
+                                    else 'unexpected data after bytecode')
+        self.decoded = {}
+
+    def take(self, size):
+        if self.offset + size > len(self.data):
+            raise BytecodeException('bytecode is truncated')
+        chunk = bytes(self.data[self.offset:self.offset + size])
+        self.offset += size
+        return chunk
+
+    def unpack(self, fmt):
+        return fmt.unpack(self.take(fmt.size))
+
+    @staticmethod
+    def value_type(code):
+        if code >= len(TYPES):
+            raise BytecodeException('unknown type code %d' % code)
+        return TYPES[code]
+
+    def constant(self):
+        tag = self.take(1)[0]
+        if tag == INT:
+            return int_value(self.unpack(INT64)[0])
+        if tag == FLOAT:
+            return float_value(self.unpack(FLOAT64)[0])
+        if tag == BIGINT:
+            return int_value(int.from_bytes(self.take(self.unpack(LENGTH)[0]), 'little', signed=True))
+        raise BytecodeException('unknown constant tag %d' % tag)
+
+    def instruction(self, opcode, operand):
+        """
+        instruction of the code record, decoded once for all equal records
+        """
+        key = (opcode, operand)
+        ins = self.decoded.get(key)
+        if ins is None:
+            kind = KINDS.get(opcode)
+            if kind is None:
+                raise BytecodeException('unknown opcode %d' % opcode)
+            cls = INSTRUCTIONS[opcode]
+            if kind == NO_ARGUMENT:
+                ins = cls()
+            elif kind == CONSTANT:
+                if operand >= len(self.constants):
+                    raise BytecodeException('constant %d is not in bytecode' % operand)
+                argument = self.constants[operand]
+                if argument.__class__ is not (ValueInt if opcode == opcodes.IPUSH else ValueFloat):
+                    raise BytecodeException('instruction %s cannot push %s' % (cls.__name__, argument))
+                ins = cls(argument)
+            else:
+                if issubclass(cls, (instructions.InsJump, instructions.InsBranch)):
+                    if operand >= self.length:
+                        raise BytecodeException('jump target %d is not in code' % operand)
+                elif cls is instructions.InsNewArray:
+                    if operand not in (0, 1):
+                        raise BytecodeException('unknown array type %d' % operand)
+                elif operand >= len(self.variables):
+                    raise BytecodeException('variable %d is not in bytecode' % operand)
+                ins = cls(int_value(operand))
+            self.decoded[key] = ins
+        return ins
+
+    def method(self):
+        """
+        new Method with all instructions decoded
+        """
+        m = Method()
+        m.function_name = self.function_name
+        m.argument_count = self.argument_count
+        m.return_type = self.return_type()
+        m.variables = [cls() for cls in self.variables]
+        m.labels = dict(self.labels)
+        decoded = self.decoded
+        instruction = self.instruction
+        # one copy of the code, no buffer of mapped file stays exported when decoding fails
+        records = CODE.iter_unpack(self.data[self.code_offset:])
+        m.code = [decoded.get(record) or instruction(*record) for record in records]
+        return m
+
+
+def loads(data):
+    """
+    Method stored in bytecode made by dumps
+    """
+    return Bytecode(data).method()
+
+
+def load(fname):
+    """
+    Method stored in bytecode file fname, the file is memory mapped while it is decoded
+    """
+    with open(fname, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file cannot be mapped
+            raise BytecodeException('bytecode is truncated')
+    with data:
+        return Bytecode(data).method()
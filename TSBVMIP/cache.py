@@ -0,0 +1,230 @@
+# -*- coding: utf-8  -*-
+"""
+caches of loaded programs
+
+DiskCache is a persistent cache shared by processes, its entries are content
+addressed, the key is sha256 of the source code, package and bytecode versions
+and the load options, so a changed source or an upgraded package never hits
+a stale entry. an entry is the method parsed, verified and optionally
+optimized, stored as .tsbc bytecode. entries are written to a temporary file
+and renamed, readers never see a partial entry and concurrent writers of the
+same key are harmless. evict removes entries older than max_age and then the
+least recently used ones until the directory fits max_bytes
+
+ProgramCache is a bounded LRU of verified programs in memory of one process,
+keyed by path and modification time of a code file or by hash of a source
+string, it keeps the method and its decoded Program for every engine
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from . import __version__
+from . import bytecode
+from .analysis.verifier import verify_method
+from .program import Program
+
+
+ENTRY_SUFFIX = '.tsbc'
+TEMPORARY_SUFFIX = '.tmp'
+
+MAX_BYTES = 256 * 2 ** 20
+MAX_AGE = 30 * 24 * 3600
+
+
+def default_directory():
+    """
+    $TSBVMIP_CACHE_DIR, or tsbvmip directory in $XDG_CACHE_HOME or ~/.cache
+    """
+    if os.environ.get('TSBVMIP_CACHE_DIR'):
+        return os.environ['TSBVMIP_CACHE_DIR']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'tsbvmip')
+
+
+class DiskCache():
+
+    """
+    directory of cached methods, safe to share by many processes
+    """
+
+    def __init__(self, directory=None, max_bytes=MAX_BYTES, max_age=MAX_AGE):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(source, optimize=False):
+        """
+        hex digest identifying source code as str or bytes loaded with the options
+        """
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        h = hashlib.sha256()
+        h.update(('%s\0%d\0%d\0' % (__version__, bytecode.VERSION, bool(optimize))).encode('ascii'))
+        h.update(source)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """
+        cached method of key verified again or None, unreadable or invalid entries are removed
+        """
+        fname = self.path(key)
+        try:
+            method = verify_method(bytecode.load(fname))
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # whatever fails to load or verify is a corrupt entry, the source is parsed again
+            self.remove(fname)
+            return None
+        try:
+            # modification time orders entries for eviction
+            os.utime(fname)
+        except OSError:
+            pass
+        return method
+
+    def put(self, key, method):
+        """
+        store verified method under key, then evict old entries
+        """
+        data = bytecode.dumps(method)
+        fd, temporary = tempfile.mkstemp(suffix=TEMPORARY_SUFFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            self.remove(temporary)
+            raise
+        self.evict()
+
+    @staticmethod
+    def remove(fname):
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
+
+    def entries(self):
+        """
+        (modification time, size, path) of every file in the cache directory, oldest first
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((ENTRY_SUFFIX, TEMPORARY_SUFFIX)):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """
+        remove entries older than max_age, then the oldest ones until the cache fits max_bytes
+        temporary files of unfinished writes are removed only when too old
+        """
+        now = time.time()
+        kept = []
+        for mtime, size, fname in self.entries():
+            if now - mtime > self.max_age:
+                self.remove(fname)
+            else:
+                kept.append((mtime, size, fname))
+        total = sum(size for _, size, _ in kept)
+        for mtime, size, fname in kept:
+            if total <= self.max_bytes:
+                break
+            if fname.endswith(ENTRY_SUFFIX):
+                self.remove(fname)
+                total -= size
+
+    def clear(self):
+        for _, _, fname in self.entries():
+            self.remove(fname)
+
+
+class CachedProgram():
+
+    """
+    verified method and Program decoded from it for every (engine, arrays) used so far
+    """
+    __slots__ = ('method', 'programs')
+
+    def __init__(self, method):
+        verify_method(method)
+        self.method = method
+        self.programs = {}
+
+    def program(self, engine, arrays):
+        key = (engine, arrays)
+        program = self.programs.get(key)
+        if program is None:
+            program = self.programs[key] = Program(self.method, engine, arrays, verify=False)
+        return program
+
+
+class ProgramCache():
+
+    """
+    bounded LRU of CachedProgram, safe to share by VMs of many threads
+    cached methods and programs are shared and must not be changed
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def file_key(fname, *options):
+        stat = os.stat(fname)
+        return ('file', os.path.abspath(fname), stat.st_mtime_ns, stat.st_size) + options
+
+    @staticmethod
+    def source_key(source, *options):
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        return ('source', hashlib.sha256(source).hexdigest()) + options
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """
+        cache entry under key, least recently used entries over maxsize are evicted, returns entry
+        """
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -1,12 +1,30 @@
 # -*- coding: utf-8  -*-
+"""
+parser of the code format, a YAML document with func, lvars and ins sections
+
+code written in the usual block style (plain scalars, one instruction per line)
+is parsed by a native single pass parser building the Method directly, jump
+and variable labels are resolved by a backpatch list at the end. anything else,
+and every invalid code, goes through YAML (libyaml CSafeLoader when available)
+and process_yaml, so results and error messages are the same for both paths
+"""
+import io
+import re
+
 import yaml
 
+from . import bytecode
 from . import instructions
 from . import value_containers
 from .exceptions import ParserException
 from .method import Method
 
 
+BYTECODE_SUFFIX = '.tsbc'
+
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
 def _process_func(method, func):
     if not func or not isinstance(func, dict):
         raise ParserException('"func" not defined')
@@ -104,11 +122,460 @@ def process_yaml(structure):
     return m
 
 
+# plain scalars resolved exactly as by the YAML SafeLoader, other scalars are left to YAML
+INT_SCALAR = re.compile(r'[-+]?(?:0|[1-9][0-9]*)$')
+FLOAT_SCALAR = re.compile(r'(?:[-+]?[0-9]+\.[0-9]*|\.[0-9]+)(?:[eE][-+][0-9]+)?$')
+WORD_SCALAR = re.compile(r'[A-Za-z_][A-Za-z0-9_.\- ]*$')
+YAML_WORDS = {'yes', 'Yes', 'YES', 'no', 'No', 'NO', 'true', 'True', 'TRUE', 'false', 'False', 'FALSE',
+              'on', 'On', 'ON', 'off', 'Off', 'OFF', 'null', 'Null', 'NULL'}
+NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*$')
+# tabs, line breaks other than \n and \r\n and characters YAML does not accept or treats specially
+SPECIAL_CHARACTERS = re.compile('\r(?!\n)|[^\r\n\x20-\x7e\xa0-\u2027\u202a-\ud7ff\ue000-\ufefe\uff00-\ufffd'
+                                '\U00010000-\U0010ffff]')
+
+# argument kinds of instruction classes
+NO_ARGUMENT = 0
+LABEL_ARGUMENT = 1
+INTEGER_ARGUMENT = 2
+FLOAT_ARGUMENT = 3
+
+
+def _argument_kind(inst):
+    if issubclass(inst, instructions.InsNoArgument):
+        return NO_ARGUMENT
+    if issubclass(inst, instructions.InsArgILabel):
+        return LABEL_ARGUMENT
+    if issubclass(inst, instructions.InsArgInteger):
+        return INTEGER_ARGUMENT
+    return FLOAT_ARGUMENT
+
+
+ARGUMENT_KINDS = dict((inst, _argument_kind(inst)) for inst in instructions.keywords.values())
+
+
+class NotNative(Exception):
+
+    """
+    code outside of the native format, it is parsed by YAML
+    """
+
+
+def _scalar(text):
+    if INT_SCALAR.match(text):
+        return int(text)
+    if FLOAT_SCALAR.match(text):
+        return float(text)
+    if WORD_SCALAR.match(text) and text not in YAML_WORDS:
+        return text
+    raise NotNative(text)
+
+
+def _lines(lines):
+    """
+    (indent, text) of lines with content, comments removed
+    """
+    for line in lines:
+        if line[-1:] == '\n':
+            line = line[:-1]
+        if line[-1:] == '\r':
+            line = line[:-1]
+        special = SPECIAL_CHARACTERS.search(line)
+        if special:
+            raise NotNative(special.group())
+        text = line.lstrip(' ')
+        if not text or text[0] == '#':
+            continue
+        indent = len(line) - len(text)
+        cut = text.find(' #')
+        if cut >= 0:
+            text = text[:cut]
+        yield indent, text.rstrip(' ')
+
+
+def _key_value(text):
+    """
+    key and scalar value of mapping line, value is None for key of nested block
+    """
+    colon = text.find(':')
+    key = text[:colon]
+    if colon < 1 or not NAME.match(key):
+        raise NotNative(text)
+    rest = text[colon + 1:]
+    if not rest:
+        return key, None
+    if rest[0] != ' ':
+        raise NotNative(text)
+    rest = rest.strip(' ')
+    if rest == '[]':
+        return key, []
+    return key, _scalar(rest)
+
+
+# instruction given without argument
+NO_VALUE = object()
+
+
+class CodeBuilder():
+
+    """
+    appends instructions of the ins section to method code one by one, labels pointing
+    ahead are resolved by finish, equal instructions with integer or no argument share one object
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self.label = None
+        self.code_labels = []
+        self.fixups = []
+        self.shared = {}
+
+    def add_item(self, i):
+        """
+        add instruction or label as given by YAML, a string or a single item dict
+        """
+        if isinstance(i, str):
+            self.add(i)
+        elif isinstance(i, dict):
+            if not len(i) == 1:
+                raise ParserException('bad syntax for data %s' % i)
+            (kw, value), = i.items()
+            if kw == 'label' and value:
+                self.add_label(value)
+            else:
+                self.add(kw, value)
+        else:
+            raise ParserException('unknown instruction format %s' % i)
+
+    def add_label(self, label):
+        if self.label is not None:
+            raise ParserException('label cannot follow label: %s, %s' % (self.label, label))
+        _add_label(self.method, label, len(self.method.code))
+        self.code_labels.append(label)
+        self.label = label
+
+    def add(self, kw, value=NO_VALUE):
+        self.label = None
+        code = self.method.code
+        inst = instructions.keywords[kw.lower()]
+        kind = ARGUMENT_KINDS[inst]
+        if value is NO_VALUE:
+            if kind != NO_ARGUMENT:
+                raise ParserException('instruction %s requires argument' % kw)
+            code.append(self.instruction(inst))
+        elif kind == NO_ARGUMENT:
+            raise ParserException('instruction %s takes no argument' % {kw: value})
+        elif kind == LABEL_ARGUMENT:
+            if not isinstance(value, str):
+                raise ParserException('instruction %s requires label as argument' % {kw: value})
+            self.fixups.append((len(code), inst, value))
+            code.append(None)
+        elif kind == INTEGER_ARGUMENT:
+            if value != int(value):
+                raise ParserException('instruction %s requires integer argument' % {kw: value})
+            code.append(self.instruction(inst, int(value)))
+        else:
+            if value != float(value):
+                raise ParserException('instruction %s requires float argument' % {kw: value})
+            code.append(inst(instructions.contain_value(inst, value)))
+
+    def instruction(self, inst, value=None):
+        key = (inst, value)
+        ins = self.shared.get(key)
+        if ins is None:
+            ins = self.shared[key] = inst() if value is None else inst(instructions.contain_value(inst, value))
+        return ins
+
+    def finish(self):
+        """
+        resolve labels of instructions, code is complete
+        """
+        if self.label is not None:
+            raise ParserException('label cannot be as last instruction %s' % {'label': self.label})
+        labels = self.method.labels
+        code = self.method.code
+        for index, inst, name in self.fixups:
+            try:
+                code[index] = self.instruction(inst, labels[name])
+            except KeyError:
+                raise ParserException('label %s is not defined' % name)
+        self.fixups = []
+
+
+class NativeParser():
+
+    """
+    single pass parser of code in block style read line by line,
+    raises NotNative for anything else
+    """
+
+    def __init__(self, lines):
+        self.lines = _lines(lines)
+        self.advance()
+
+    def advance(self):
+        self.line = next(self.lines, None)
+
+    def parse(self):
+        m = Method()
+        sections = []
+        while self.line is not None:
+            indent, text = self.line
+            key, value = _key_value(text)
+            if indent != 0 or key in sections or (value is not None and value != []):
+                raise NotNative(text)
+            self.advance()
+            if key == 'func' and not sections and value is None:
+                _process_func(m, self.mapping(0))
+            elif key == 'lvars' and sections == ['func']:
+                _process_vars(m, value if value is not None else self.sequence(0))
+            elif key == 'ins' and sections and value is None:
+                self.instructions(m, 0)
+            elif key == 'ins' and sections and value == []:
+                pass
+            else:
+                raise NotNative(text)
+            sections.append(key)
+        if not sections:
+            raise NotNative('empty code')
+        return m
+
+    def block_indent(self, key_indent, sequence):
+        """
+        indent of block nested in key, sequences may start at the indent of the key
+        """
+        if self.line is None:
+            raise NotNative('empty block')
+        indent, text = self.line
+        if indent < key_indent or (indent == key_indent and not (sequence and text[:2] == '- ')):
+            raise NotNative(text)
+        return indent
+
+    def mapping(self, key_indent):
+        indent = self.block_indent(key_indent, False)
+        result = {}
+        while self.line is not None:
+            line_indent, text = self.line
+            if line_indent < indent:
+                break
+            key, value = _key_value(text)
+            if line_indent != indent or key in result:
+                raise NotNative(text)
+            self.advance()
+            result[key] = value if value is not None else self.sequence(indent)
+        return result
+
+    def sequence(self, key_indent):
+        """
+        list of flat mappings
+        """
+        indent = self.block_indent(key_indent, True)
+        result = []
+        while self.line is not None:
+            line_indent, text = self.line
+            if line_indent < indent or (line_indent == key_indent and text[:2] != '- '):
+                break
+            if line_indent != indent or text[:2] != '- ':
+                raise NotNative(text)
+            item = text[2:].lstrip(' ')
+            column = indent + len(text) - len(item)
+            key, value = _key_value(item)
+            mapping = {key: value}
+            self.advance()
+            while self.line is not None and self.line[0] > indent:
+                line_indent, text = self.line
+                key, value = _key_value(text)
+                if line_indent != column or key in mapping:
+                    raise NotNative(text)
+                mapping[key] = value
+                self.advance()
+            if None in mapping.values():
+                raise NotNative(item)
+            result.append(mapping)
+        return result
+
+    def instructions(self, method, key_indent):
+        """
+        instructions appended to method code, labels pointing ahead are resolved at the end
+        """
+        indent = self.block_indent(key_indent, True)
+        builder = CodeBuilder(method)
+        lines = self.lines
+        line = self.line
+        while line is not None:
+            line_indent, text = line
+            if line_indent < indent or (line_indent == key_indent and text[:2] != '- '):
+                break
+            if line_indent != indent or text[:2] != '- ':
+                raise NotNative(text)
+            item = text[2:].lstrip(' ')
+            if ':' in item:
+                kw, value = _key_value(item)
+                if value is None or value == []:
+                    raise NotNative(item)
+                if kw == 'label' and value:
+                    builder.add_label(value)
+                else:
+                    builder.add(kw, value)
+            elif NAME.match(item):
+                builder.add(item)
+            else:
+                raise NotNative(item)
+            line = next(lines, None)
+        self.line = line
+        builder.finish()
+
+
+class EventParser():
+
+    """
+    parser of any YAML code reading events one by one, instructions are processed
+    as they are read, so the document tree is never built
+    """
+
+    def __init__(self, stream):
+        self.loader = YAML_LOADER(stream)
+
+    def parse(self):
+        try:
+            return self.document()
+        finally:
+            self.loader.dispose()
+
+    def document(self):
+        loader = self.loader
+        loader.get_event()
+        if loader.check_event(yaml.StreamEndEvent):
+            return process_yaml(None)
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            structure = self.value()
+            self.end()
+            return process_yaml(structure)
+        loader.get_event()
+        m = Method()
+        structure = {}
+        builder = None
+        variables = False
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = self.value()
+            if key == 'ins' and builder is None and 'func' in structure and \
+                    loader.check_event(yaml.SequenceStartEvent):
+                _process_func(m, structure['func'])
+                variables = 'lvars' in structure
+                _process_vars(m, structure.get('lvars', []))
+                builder = CodeBuilder(m)
+                loader.get_event()
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    builder.add_item(self.value())
+                loader.get_event()
+            elif builder is not None and key in ('func', 'lvars', 'ins') and (key in structure or key == 'ins'):
+                raise ParserException('"%s" defined twice' % key)
+            else:
+                structure[key] = self.value()
+        loader.get_event()
+        self.end()
+        if builder is None:
+            return process_yaml(structure)
+        if 'lvars' in structure and not variables:
+            # variables defined after instructions, their labels go before labels in code
+            code_labels = [(label, m.labels.pop(label)) for label in builder.code_labels]
+            _process_vars(m, structure['lvars'])
+            for label, index in code_labels:
+                _add_label(m, label, index)
+        builder.finish()
+        return m
+
+    def end(self):
+        self.loader.get_event()
+        if not self.loader.check_event(yaml.StreamEndEvent):
+            raise ParserException('code has to be a single YAML document')
+
+    def value(self):
+        """
+        python value of the next node, as constructed by yaml.safe_load
+        """
+        loader = self.loader
+        event = loader.get_event()
+        if isinstance(event, yaml.ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+            node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, event.style)
+            value = loader.construct_object(node, deep=True)
+            loader.constructed_objects.clear()
+            return value
+        if isinstance(event, yaml.SequenceStartEvent):
+            items = []
+            while not loader.check_event(yaml.SequenceEndEvent):
+                items.append(self.value())
+            loader.get_event()
+            return items
+        if isinstance(event, yaml.MappingStartEvent):
+            mapping = {}
+            while not loader.check_event(yaml.MappingEndEvent):
+                key = self.value()
+                mapping[key] = self.value()
+            loader.get_event()
+            return mapping
+        raise ParserException('anchors and aliases are not supported, found %s' % event)
+
+
+def parse_native(data):
+    """
+    Method of code in the native block style, raises NotNative for other code
+    """
+    return NativeParser(io.StringIO(data)).parse()
+
+
 def parse_string(data):
-    structure = yaml.safe_load(data)
+    if isinstance(data, bytes):
+        try:
+            data = data.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    if isinstance(data, str):
+        try:
+            return parse_native(data)
+        except Exception:
+            # not native or invalid, YAML parses it again and reports the error
+            pass
+    structure = yaml.load(data, Loader=YAML_LOADER)
     return process_yaml(structure)
 
 
+def parse_stream(stream):
+    """
+    Method of code read incrementally from text stream, peak memory is proportional to the
+    resulting code, not to the document. code in other than native format is read again
+    from the start through YAML events, the stream has to be seekable for it.
+    code the streaming parsers reject is read again as a whole YAML document, so errors are
+    the same as of parse_string, only a stream which is not seekable reports the first error found
+    """
+    start = stream.tell() if stream.seekable() else None
+    try:
+        return NativeParser(stream).parse()
+    except NotNative:
+        if start is None:
+            raise ParserException('code is not in the native format and the stream cannot be read again')
+    except Exception:
+        if start is None:
+            raise
+        return _parse_document(stream, start)
+    stream.seek(start)
+    try:
+        return EventParser(stream).parse()
+    except Exception:
+        # invalid code, or valid YAML not streamed such as a repeated key where the last one wins
+        return _parse_document(stream, start)
+
+
+def _parse_document(stream, start):
+    stream.seek(start)
+    return process_yaml(yaml.load(stream, Loader=YAML_LOADER))
+
+
 def parse_file(fname):
+    if fname.endswith(BYTECODE_SUFFIX):
+        return bytecode.load(fname)
     with open(fname, 'r') as f:
-        return parse_string(f)
+        return parse_stream(f)
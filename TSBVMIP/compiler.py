@@ -0,0 +1,307 @@
+# -*- coding: utf-8  -*-
+"""
+ahead of time translation of a verified method into python source
+
+local variables become python locals v0..vN, the operand stack is resolved at
+compile time into expressions and temporaries, values living on the stack
+across basic block boundaries are kept in locals s0..sN.
+basic blocks from ControlFlowAnalyzer are dispatched by a loop over the index
+of the current block. the generated function takes and returns raw (unboxed)
+python values. array accesses check the index unless analysis.bounds proved
+them safe
+"""
+import math
+
+from . import dispatch
+from . import opcodes
+from .analysis import bounds
+from .analysis.controlflow import ControlFlowAnalyzer
+from .analysis.interpreter import BasicVerifier
+from .analysis.verifier import Verifier
+from .exceptions import RuntimeException
+from .value_containers import array_types, element_error, index_error, new_raw_array
+
+
+FUNCTION_NAME = '_compiled'
+
+MATH = {
+    opcodes.IADD: '+',
+    opcodes.ISUB: '-',
+    opcodes.IMUL: '*',
+    opcodes.FADD: '+',
+    opcodes.FSUB: '-',
+    opcodes.FMUL: '*',
+}
+
+# operations that can raise, these are evaluated in place and never deferred
+EAGER_MATH = {
+    opcodes.IDIV: '//',
+    opcodes.FDIV: '/',
+}
+
+COMPARE = {
+    opcodes.IF_ICMPEQ: '==',
+    opcodes.IF_ICMPNE: '!=',
+    opcodes.IF_ICMPGE: '>=',
+    opcodes.IF_ICMPGT: '>',
+    opcodes.IF_ICMPLE: '<=',
+    opcodes.IF_ICMPLT: '<',
+    opcodes.IF_FCMPEQ: '==',
+    opcodes.IF_FCMPNE: '!=',
+    opcodes.IF_FCMPGE: '>=',
+    opcodes.IF_FCMPGT: '>',
+    opcodes.IF_FCMPLE: '<=',
+    opcodes.IF_FCMPLT: '<',
+}
+
+
+class Expression():
+
+    """
+    python expression of a stack value together with names of locals it reads
+    """
+
+    def __init__(self, code, names=()):
+        self.code = code
+        self.names = frozenset(names)
+
+    def __str__(self):
+        return self.code
+
+    @property
+    def is_simple(self):
+        return self.code.isidentifier() or not self.names
+
+
+def _name(code):
+    return Expression(code, [code])
+
+
+def _literal(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return Expression("float('%r')" % value)
+    return Expression(repr(value))
+
+
+class SourceGenerator():
+
+    def __init__(self, method, metered=False, safe=()):
+        self.method = method
+        self.metered = metered
+        self.safe = safe
+        self.lines = []
+        self.temp_count = 0
+        self.block_index = {}
+        self.stack = None
+        self.indent = 0
+
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def temp(self):
+        self.temp_count += 1
+        return 't%d' % self.temp_count
+
+    def materialize(self, i):
+        name = self.temp()
+        self.emit('%s = %s' % (name, self.stack[i]))
+        self.stack[i] = _name(name)
+
+    def spill(self, name):
+        """
+        evaluate stack expressions reading the local, before the local is overwritten
+        """
+        for i, e in enumerate(self.stack):
+            if name in e.names:
+                self.materialize(i)
+
+    def push_eager(self, code):
+        name = self.temp()
+        self.emit('%s = %s' % (name, code))
+        self.stack.append(_name(name))
+
+    def check_index(self, arr, index):
+        """
+        emit index check of array access, returns index expression evaluated once
+        """
+        if not index.is_simple:
+            name = self.temp()
+            self.emit('%s = %s' % (name, index))
+            index = _name(name)
+        self.emit('if not 0 <= %s < len(%s):' % (index, arr))
+        self.emit('    raise index_error(%s, %s)' % (index, arr))
+        return index
+
+    def slot_assignments(self):
+        targets = []
+        sources = []
+        for i, e in enumerate(self.stack):
+            slot = 's%d' % i
+            if e.code != slot:
+                targets.append(slot)
+                sources.append(e.code)
+        return targets, sources
+
+    def flush(self):
+        """
+        move stack expressions to slot locals s0..sN, at the end of every block
+        """
+        targets, sources = self.slot_assignments()
+        if targets:
+            self.emit('%s = %s' % (', '.join(targets), ', '.join(sources)))
+
+    def jump(self, target):
+        self.emit('block = %d' % self.block_index[target])
+
+    def branch(self, condition, target, fallthrough):
+        targets, _ = self.slot_assignments()
+        if condition.names.intersection(targets):
+            name = self.temp()
+            self.emit('%s = %s' % (name, condition))
+            condition = _name(name)
+        self.flush()
+        self.emit('if %s:' % condition)
+        self.indent += 1
+        self.jump(target)
+        self.indent -= 1
+        self.emit('else:')
+        self.indent += 1
+        self.jump(fallthrough)
+        self.indent -= 1
+
+    def block(self, bb, height):
+        code = self.method.code
+        self.stack = [_name('s%d' % i) for i in range(height)]
+        stack = self.stack
+        if self.metered:
+            cost = bb.cost(code)
+            self.emit('if fuel < %d:' % cost)
+            self.emit('    raise out_of_fuel(fuel, %d, %d)' % (bb.start_inst_index, cost))
+            self.emit('fuel -= %d' % cost)
+        # superinstructions are translated through the instructions they stand for
+        for pc, ins in ((pc, part) for pc in bb.instruction_indexes for part in code[pc].expand()):
+            op = ins.opcode
+            if op in (opcodes.IPUSH, opcodes.FPUSH):
+                stack.append(_literal(ins.argument.value))
+            elif op in (opcodes.ILOAD, opcodes.FLOAD, opcodes.ALOAD):
+                stack.append(_name('v%d' % ins.argument.value))
+            elif op in (opcodes.ISTORE, opcodes.FSTORE, opcodes.ASTORE):
+                name = 'v%d' % ins.argument.value
+                value = stack.pop()
+                self.spill(name)
+                self.emit('%s = %s' % (name, value))
+            elif op == opcodes.GOTO:
+                self.flush()
+                self.jump(ins.argument.value)
+                return
+            elif op in (opcodes.IRETURN, opcodes.FRETURN, opcodes.ARETURN):
+                self.emit('return %s%s' % (stack.pop(), ', fuel' if self.metered else ''))
+                return
+            elif op == opcodes.NOP:
+                pass
+            elif op == opcodes.POP:
+                stack.pop()
+            elif op == opcodes.DUP:
+                if not stack[-1].is_simple:
+                    self.materialize(len(stack) - 1)
+                stack.append(stack[-1])
+            elif op == opcodes.SWAP:
+                stack[-1], stack[-2] = stack[-2], stack[-1]
+            elif op in COMPARE:
+                value2 = stack.pop()
+                value1 = stack.pop()
+                condition = Expression('%s %s %s' % (value1, COMPARE[op], value2), value1.names | value2.names)
+                self.branch(condition, ins.argument.value, pc + 1)
+                return
+            elif op in (opcodes.IFNULL, opcodes.IFNONNULL):
+                value1 = stack.pop()
+                test = 'is' if op == opcodes.IFNULL else 'is not'
+                self.branch(Expression('%s %s None' % (value1, test), value1.names), ins.argument.value, pc + 1)
+                return
+            elif op in MATH:
+                value2 = stack.pop()
+                value1 = stack.pop()
+                stack.append(Expression('(%s %s %s)' % (value1, MATH[op], value2), value1.names | value2.names))
+            elif op in EAGER_MATH:
+                value2 = stack.pop()
+                value1 = stack.pop()
+                self.push_eager('%s %s %s' % (value1, EAGER_MATH[op], value2))
+            elif op == opcodes.F2I:
+                self.push_eager('int(%s)' % stack.pop())
+            elif op == opcodes.I2F:
+                self.push_eager('float(%s)' % stack.pop())
+            elif op == opcodes.NEWARRAY:
+                self.push_eager('new_raw_array(array_types[%d], %s)' % (ins.argument.value, stack.pop()))
+            elif op in (opcodes.IALOAD, opcodes.FALOAD):
+                index = stack.pop()
+                arr = stack.pop()
+                if pc not in self.safe:
+                    index = self.check_index(arr, index)
+                self.push_eager('%s[%s]' % (arr, index))
+            elif op == opcodes.ARRAYLENGTH:
+                arr = stack.pop()
+                stack.append(Expression('len(%s)' % arr, arr.names))
+            elif op in (opcodes.IASTORE, opcodes.FASTORE):
+                value = stack.pop()
+                index = stack.pop()
+                arr = stack.pop()
+                if pc not in self.safe:
+                    index = self.check_index(arr, index)
+                if op == opcodes.IASTORE:
+                    # int arrays hold 64 bit elements, memoryview of numpy array raises ValueError
+                    self.emit('try:')
+                    self.emit('    %s[%s] = %s' % (arr, index, value))
+                    self.emit('except (OverflowError, ValueError):')
+                    self.emit('    raise element_error(%s)' % value)
+                else:
+                    self.emit('%s[%s] = %s' % (arr, index, value))
+            else:
+                raise RuntimeException('cannot compile instruction %s' % ins)
+        self.flush()
+        self.jump(bb.end_inst_index + 1)
+
+    def generate(self, blocks, frames):
+        method = self.method
+        blocks = [bb for bb in blocks if frames[bb.start_inst_index] is not None]
+        self.block_index = dict((bb.start_inst_index, i) for i, bb in enumerate(blocks))
+        args = ['v%d' % i for i in range(method.argument_count)]
+        if self.metered:
+            args.append('fuel')
+        self.emit('def %s(%s):' % (FUNCTION_NAME, ', '.join(args)))
+        self.indent += 1
+        for i in range(method.argument_count, len(method.variables)):
+            self.emit('v%d = None' % i)
+        self.emit('block = 0')
+        self.emit('while True:')
+        self.indent += 1
+        for i, bb in enumerate(blocks):
+            self.emit('%s block == %d:' % ('if' if i == 0 else 'elif', i))
+            self.indent += 1
+            self.block(bb, frames[bb.start_inst_index].stack_size)
+            self.indent -= 1
+        return '\n'.join(self.lines) + '\n'
+
+
+def generate_source(method, metered=False):
+    """
+    verify method and return python source of its translation
+    """
+    ver = Verifier(BasicVerifier())
+    ver.verify(method)
+    blocks = ControlFlowAnalyzer().analyze(method)
+    return SourceGenerator(method, metered, bounds.safe_accesses(method)).generate(blocks, ver.frames)
+
+
+def compile_method(method, metered=False):
+    """
+    translate method into python function accepting and returning raw values
+    metered function takes fuel as the last argument, charges it per basic block
+    and returns tuple of the result and fuel left
+    """
+    source = generate_source(method, metered)
+    namespace = {'new_raw_array': new_raw_array, 'array_types': array_types, 'out_of_fuel': dispatch.out_of_fuel,
+                 'index_error': index_error, 'element_error': element_error}
+    exec(compile(source, '<tsbvmip %s>' % method.function_name, 'exec'), namespace)
+    function = namespace[FUNCTION_NAME]
+    function.source = source
+    return function
@@ -0,0 +1,741 @@
+# -*- coding: utf-8  -*-
+"""
+pre-decoded dispatch table engine
+
+a verified method is decoded once into a flat list of handlers, one per
+instruction, with operands unboxed and bound into the handler.
+every handler is called as handler(stack, variables) and returns the pc of the
+next instruction, return instructions leave the result on the stack and
+return -1
+
+the unboxed table relies on the verifier proof of static types and keeps raw
+python int/float values on the stack and in local variables, arrays are the
+raw array.array storage
+
+array loads and stores check the index, decode skips the check at the pcs
+proven safe by analysis.bounds
+"""
+from . import opcodes
+from .value_containers import element_error, float_value, index_error, int_value, new_raw_array
+from .exceptions import OutOfFuelException, RuntimeException
+
+
+FINISHED = -1
+
+
+def _push(ins, pc):
+    value = ins.argument
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(value)
+        return nxt
+    return handler
+
+
+def _load(ins, pc):
+    index = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(variables[index])
+        return nxt
+    return handler
+
+
+def _store(ins, pc):
+    index = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        variables[index] = stack.pop()
+        return nxt
+    return handler
+
+
+def _goto(ins, pc):
+    target = ins.argument.value
+
+    def handler(stack, variables):
+        return target
+    return handler
+
+
+def _return(ins, pc):
+
+    def handler(stack, variables):
+        return FINISHED
+    return handler
+
+
+def _nop(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        return nxt
+    return handler
+
+
+def _pop(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.pop()
+        return nxt
+    return handler
+
+
+def _dup(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(stack[-1])
+        return nxt
+    return handler
+
+
+def _swap(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack[-1], stack[-2] = stack[-2], stack[-1]
+        return nxt
+    return handler
+
+
+def _compare(ins, pc):
+    opr = ins.opr
+    target = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        val2 = stack.pop()
+        if opr(stack.pop().value, val2.value):
+            return target
+        return nxt
+    return handler
+
+
+def _ifnonnull(ins, pc):
+    target = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        if stack.pop().value is not None:
+            return target
+        return nxt
+    return handler
+
+
+def _ifnull(ins, pc):
+    target = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        if stack.pop().value is None:
+            return target
+        return nxt
+    return handler
+
+
+def _math(ins, pc):
+    opr = ins.opr
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        val2 = stack.pop()
+        stack.append(opr(stack.pop(), val2))
+        return nxt
+    return handler
+
+
+def _f2i(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(int_value(int(stack.pop().value)))
+        return nxt
+    return handler
+
+
+def _i2f(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(float_value(float(stack.pop().value)))
+        return nxt
+    return handler
+
+
+def _newarray(ins, pc):
+    array_type = ins.array_type
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(array_type(new_raw_array(array_type, stack.pop().value)))
+        return nxt
+    return handler
+
+
+def _array_load(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        index = stack.pop().value
+        stack.append(stack.pop()[index])
+        return nxt
+    return handler
+
+
+def _array_load_unchecked(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        index = stack.pop().value
+        arr = stack.pop()
+        stack.append(arr.element_value(arr.value[index]))
+        return nxt
+    return handler
+
+
+def _array_store(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        value = stack.pop()
+        index = stack.pop().value
+        stack.pop()[index] = value
+        return nxt
+    return handler
+
+
+def _array_store_unchecked(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        value = stack.pop()
+        index = stack.pop().value
+        try:
+            stack.pop().value[index] = value.value
+        except (OverflowError, ValueError):
+            raise element_error(value.value)
+        return nxt
+    return handler
+
+
+def _arraylength(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(int_value(stack.pop().length))
+        return nxt
+    return handler
+
+
+def _iinc_dup(ins, pc):
+    index = ins.index
+    increment = ins.increment
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        val = variables[index] + increment
+        variables[index] = val
+        stack.append(val)
+        return nxt
+    return handler
+
+
+def _iload_add(ins, pc):
+    index = ins.index
+    increment = ins.increment
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(variables[index] + increment)
+        return nxt
+    return handler
+
+
+def _array_load_locals(ins, pc):
+    array_index = ins.array_index
+    index = ins.index
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(variables[array_index][variables[index].value])
+        return nxt
+    return handler
+
+
+def _array_load_locals_unchecked(ins, pc):
+    array_index = ins.array_index
+    index = ins.index
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        arr = variables[array_index]
+        stack.append(arr.element_value(arr.value[variables[index].value]))
+        return nxt
+    return handler
+
+
+def _if_icmp_locals(ins, pc):
+    opr = ins.opr
+    index1 = ins.index1
+    index2 = ins.index2
+    target = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        if opr(variables[index1].value, variables[index2].value):
+            return target
+        return nxt
+    return handler
+
+
+def _if_icmp_load(ins, pc):
+    opr = ins.opr
+    index = ins.index
+    target = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        if opr(stack.pop().value, variables[index].value):
+            return target
+        return nxt
+    return handler
+
+
+handlers = {
+    opcodes.IPUSH: _push,
+    opcodes.FPUSH: _push,
+    opcodes.ILOAD: _load,
+    opcodes.FLOAD: _load,
+    opcodes.ISTORE: _store,
+    opcodes.FSTORE: _store,
+    opcodes.GOTO: _goto,
+    opcodes.IRETURN: _return,
+    opcodes.FRETURN: _return,
+    opcodes.NOP: _nop,
+    opcodes.POP: _pop,
+    opcodes.DUP: _dup,
+    opcodes.SWAP: _swap,
+    opcodes.IF_ICMPEQ: _compare,
+    opcodes.IF_ICMPNE: _compare,
+    opcodes.IF_ICMPGE: _compare,
+    opcodes.IF_ICMPGT: _compare,
+    opcodes.IF_ICMPLE: _compare,
+    opcodes.IF_ICMPLT: _compare,
+    opcodes.IF_FCMPEQ: _compare,
+    opcodes.IF_FCMPNE: _compare,
+    opcodes.IF_FCMPGE: _compare,
+    opcodes.IF_FCMPGT: _compare,
+    opcodes.IF_FCMPLE: _compare,
+    opcodes.IF_FCMPLT: _compare,
+    opcodes.IFNONNULL: _ifnonnull,
+    opcodes.IFNULL: _ifnull,
+    opcodes.IADD: _math,
+    opcodes.ISUB: _math,
+    opcodes.IMUL: _math,
+    opcodes.IDIV: _math,
+    opcodes.FADD: _math,
+    opcodes.FSUB: _math,
+    opcodes.FMUL: _math,
+    opcodes.FDIV: _math,
+    opcodes.F2I: _f2i,
+    opcodes.I2F: _i2f,
+    opcodes.NEWARRAY: _newarray,
+    opcodes.ALOAD: _load,
+    opcodes.ASTORE: _store,
+    opcodes.IALOAD: _array_load,
+    opcodes.FALOAD: _array_load,
+    opcodes.ARRAYLENGTH: _arraylength,
+    opcodes.IASTORE: _array_store,
+    opcodes.FASTORE: _array_store,
+    opcodes.ARETURN: _return,
+    opcodes.IINC_DUP: _iinc_dup,
+    opcodes.ILOAD_ADD: _iload_add,
+    opcodes.IALOAD_LOCALS: _array_load_locals,
+    opcodes.FALOAD_LOCALS: _array_load_locals,
+    opcodes.IF_ICMP_LOCALS: _if_icmp_locals,
+    opcodes.IF_ICMP_LOAD: _if_icmp_load,
+}
+
+
+def _unboxed_push(ins, pc):
+    value = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(value)
+        return nxt
+    return handler
+
+
+def _unboxed_dup(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(stack[-1])
+        return nxt
+    return handler
+
+
+def _unboxed_compare(ins, pc):
+    opr = ins.opr
+    target = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        val2 = stack.pop()
+        if opr(stack.pop(), val2):
+            return target
+        return nxt
+    return handler
+
+
+def _unboxed_ifnonnull(ins, pc):
+    target = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        if stack.pop() is not None:
+            return target
+        return nxt
+    return handler
+
+
+def _unboxed_ifnull(ins, pc):
+    target = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        if stack.pop() is None:
+            return target
+        return nxt
+    return handler
+
+
+def _unboxed_f2i(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(int(stack.pop()))
+        return nxt
+    return handler
+
+
+def _unboxed_i2f(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(float(stack.pop()))
+        return nxt
+    return handler
+
+
+def _unboxed_newarray(ins, pc):
+    array_type = ins.array_type
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(new_raw_array(array_type, stack.pop()))
+        return nxt
+    return handler
+
+
+def _unboxed_array_load(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        index = stack.pop()
+        arr = stack.pop()
+        if not 0 <= index < len(arr):
+            raise index_error(index, arr)
+        stack.append(arr[index])
+        return nxt
+    return handler
+
+
+def _unboxed_array_load_unchecked(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        index = stack.pop()
+        stack.append(stack.pop()[index])
+        return nxt
+    return handler
+
+
+def _unboxed_array_store(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        value = stack.pop()
+        index = stack.pop()
+        arr = stack.pop()
+        if not 0 <= index < len(arr):
+            raise index_error(index, arr)
+        try:
+            arr[index] = value
+        except (OverflowError, ValueError):
+            raise element_error(value)
+        return nxt
+    return handler
+
+
+def _unboxed_array_store_unchecked(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        value = stack.pop()
+        index = stack.pop()
+        try:
+            stack.pop()[index] = value
+        except (OverflowError, ValueError):
+            raise element_error(value)
+        return nxt
+    return handler
+
+
+def _unboxed_arraylength(ins, pc):
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(len(stack.pop()))
+        return nxt
+    return handler
+
+
+def _unboxed_iinc_dup(ins, pc):
+    index = ins.index
+    increment = ins.increment.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        val = variables[index] + increment
+        variables[index] = val
+        stack.append(val)
+        return nxt
+    return handler
+
+
+def _unboxed_iload_add(ins, pc):
+    index = ins.index
+    increment = ins.increment.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(variables[index] + increment)
+        return nxt
+    return handler
+
+
+def _unboxed_array_load_locals(ins, pc):
+    array_index = ins.array_index
+    index = ins.index
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        arr = variables[array_index]
+        i = variables[index]
+        if not 0 <= i < len(arr):
+            raise index_error(i, arr)
+        stack.append(arr[i])
+        return nxt
+    return handler
+
+
+def _unboxed_array_load_locals_unchecked(ins, pc):
+    array_index = ins.array_index
+    index = ins.index
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        stack.append(variables[array_index][variables[index]])
+        return nxt
+    return handler
+
+
+def _unboxed_if_icmp_locals(ins, pc):
+    opr = ins.opr
+    index1 = ins.index1
+    index2 = ins.index2
+    target = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        if opr(variables[index1], variables[index2]):
+            return target
+        return nxt
+    return handler
+
+
+def _unboxed_if_icmp_load(ins, pc):
+    opr = ins.opr
+    index = ins.index
+    target = ins.argument.value
+    nxt = pc + 1
+
+    def handler(stack, variables):
+        if opr(stack.pop(), variables[index]):
+            return target
+        return nxt
+    return handler
+
+
+unboxed_handlers = dict(handlers)
+unboxed_handlers.update({
+    opcodes.IPUSH: _unboxed_push,
+    opcodes.FPUSH: _unboxed_push,
+    opcodes.DUP: _unboxed_dup,
+    opcodes.IF_ICMPEQ: _unboxed_compare,
+    opcodes.IF_ICMPNE: _unboxed_compare,
+    opcodes.IF_ICMPGE: _unboxed_compare,
+    opcodes.IF_ICMPGT: _unboxed_compare,
+    opcodes.IF_ICMPLE: _unboxed_compare,
+    opcodes.IF_ICMPLT: _unboxed_compare,
+    opcodes.IF_FCMPEQ: _unboxed_compare,
+    opcodes.IF_FCMPNE: _unboxed_compare,
+    opcodes.IF_FCMPGE: _unboxed_compare,
+    opcodes.IF_FCMPGT: _unboxed_compare,
+    opcodes.IF_FCMPLE: _unboxed_compare,
+    opcodes.IF_FCMPLT: _unboxed_compare,
+    opcodes.IFNONNULL: _unboxed_ifnonnull,
+    opcodes.IFNULL: _unboxed_ifnull,
+    opcodes.F2I: _unboxed_f2i,
+    opcodes.I2F: _unboxed_i2f,
+    opcodes.NEWARRAY: _unboxed_newarray,
+    opcodes.IALOAD: _unboxed_array_load,
+    opcodes.FALOAD: _unboxed_array_load,
+    opcodes.ARRAYLENGTH: _unboxed_arraylength,
+    opcodes.IASTORE: _unboxed_array_store,
+    opcodes.FASTORE: _unboxed_array_store,
+    opcodes.IINC_DUP: _unboxed_iinc_dup,
+    opcodes.ILOAD_ADD: _unboxed_iload_add,
+    opcodes.IALOAD_LOCALS: _unboxed_array_load_locals,
+    opcodes.FALOAD_LOCALS: _unboxed_array_load_locals,
+    opcodes.IF_ICMP_LOCALS: _unboxed_if_icmp_locals,
+    opcodes.IF_ICMP_LOAD: _unboxed_if_icmp_load,
+})
+
+# array access handlers without the index check
+unchecked = {
+    _array_load: _array_load_unchecked,
+    _array_store: _array_store_unchecked,
+    _array_load_locals: _array_load_locals_unchecked,
+    _unboxed_array_load: _unboxed_array_load_unchecked,
+    _unboxed_array_store: _unboxed_array_store_unchecked,
+    _unboxed_array_load_locals: _unboxed_array_load_locals_unchecked,
+}
+
+
+def decode(method, table=None, safe=()):
+    """
+    decode method code into a list of handlers, index in the list is the pc
+    array accesses at pcs in safe, as from analysis.bounds.safe_accesses, are not checked
+    """
+    if table is None:
+        table = handlers
+    code = []
+    for pc, ins in enumerate(method.code):
+        try:
+            factory = table[ins.opcode]
+        except KeyError:
+            raise RuntimeException('cannot decode instruction %s' % ins)
+        if pc in safe:
+            factory = unchecked.get(factory, factory)
+        code.append(factory(ins, pc))
+    return code
+
+
+def execute(code, frame, tracer=None):
+    """
+    run decoded code on frame until a return instruction finishes it
+    """
+    if tracer is not None:
+        return execute_traced(code, frame, tracer)
+    stack = frame.stack
+    variables = frame.variables
+    pc = frame.pc
+    while pc >= 0:
+        pc = code[pc](stack, variables)
+    frame.pc = pc
+    frame.finished = True
+    frame.return_value = stack.pop()
+
+
+def execute_traced(code, frame, tracer):
+    """
+    same as execute, calls tracer(pc, ins, stack) before every instruction
+    """
+    stack = frame.stack
+    variables = frame.variables
+    instructions = frame.instructions
+    pc = frame.pc
+    while pc >= 0:
+        tracer(pc, instructions[pc], stack)
+        pc = code[pc](stack, variables)
+    frame.pc = pc
+    frame.finished = True
+    frame.return_value = stack.pop()
+
+
+def out_of_fuel(remaining, pc, cost):
+    e = OutOfFuelException('out of fuel, %d left and block at pc %d costs %d' % (remaining, pc, cost))
+    e.remaining = remaining
+    return e
+
+
+def execute_metered(code, frame, table, fuel, tracer=None):
+    """
+    same as execute, charges fuel cost of every basic block before it runs
+    table is (lengths, costs) of the rest of the block from every pc as from blocks.block_table
+    raises OutOfFuelException when the block costs more than the rest of fuel,
+    the frame is then left before the block, or before the rest of it, and can be continued
+    """
+    stack = frame.stack
+    variables = frame.variables
+    instructions = frame.instructions
+    lengths, costs = table
+    remaining = fuel
+    pc = frame.pc
+    try:
+        while pc >= 0:
+            cost = costs[pc]
+            if cost > remaining:
+                raise out_of_fuel(remaining, pc, cost)
+            remaining -= cost
+            if tracer is None:
+                for _ in range(lengths[pc]):
+                    pc = code[pc](stack, variables)
+            else:
+                for _ in range(lengths[pc]):
+                    tracer(pc, instructions[pc], stack)
+                    pc = code[pc](stack, variables)
+    finally:
+        frame.pc = pc
+        frame.fuel_used += fuel - remaining
+    frame.finished = True
+    frame.return_value = stack.pop()
+
+
+def execute_steps(code, frame, steps):
+    """
+    run at most steps instructions on frame, returns True when the frame finished
+    unfinished frame can be continued by another call
+    """
+    if frame.finished:
+        return True
+    stack = frame.stack
+    variables = frame.variables
+    pc = frame.pc
+    while pc >= 0 and steps > 0:
+        pc = code[pc](stack, variables)
+        steps -= 1
+    frame.pc = pc
+    if pc >= 0:
+        return False
+    frame.finished = True
+    frame.return_value = stack.pop()
+    return True
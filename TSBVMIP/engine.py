@@ -3,82 +3,278 @@ import sys
 if sys.version_info[0] != 3:
     raise Exception('need Python 3k to run')
 
-import itertools
 import logging as log
+import time
 
 from . import value_containers
-from .code_parser import parse_file, parse_string
-from .exceptions import RuntimeException
-from .analysis.verifier import Verifier
-from .analysis.interpreter import BasicVerifier
+from . import compiler
+from .cache import CachedProgram
+from . import fusion
+from . import optimizer
+from .code_parser import BYTECODE_SUFFIX, parse_file, parse_string
+from .exceptions import OutOfFuelException, RuntimeException
+from .analysis.verifier import verify_method
 from .frame import Frame
+from .program import Program, ENGINES, UNBOXED_ENGINES, check_arguments_count, check_options, contain_arguments
 
 
-log.basicConfig(format='%(levelname)s %(message)s', level=log.DEBUG)
+class BatchStats():
+
+    """
+    counters of one VM.run_batch call, seconds count only time spent executing
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.seconds = 0.0
+
+    @property
+    def throughput(self):
+        """
+        runs per second
+        """
+        return self.runs / self.seconds if self.seconds else 0.0
 
 
 class VM:
 
-    def __init__(self):
+    def __init__(self, engine='interpreter', superinstructions=False, arrays='array', optimize=False, cache=None,
+                 memory_cache=None):
+        """
+        cache, when given, is a cache.DiskCache reused by load_file_code and load_string_code
+        memory_cache, when given, is a cache.ProgramCache consulted by them first, it can be shared by many VMs
+        """
+        check_options(engine, arrays)
+        self.engine = engine
+        self.superinstructions = superinstructions
+        self.optimize = optimize
+        self.arrays = arrays
+        self.cache = cache
+        self.memory_cache = memory_cache
+        self.entry = None
         self.method = None
+        self.decoded = None
         self.frame = None
+        self.batch_stats = None
 
     def verify(self):
-        ver = Verifier(BasicVerifier())
-        ver.verify(self.method)
+        """
+        verify loaded method, once until its code is replaced
+        """
+        if self.entry is not None:
+            # programs of the memory cache are verified when they are cached
+            return
+        verify_method(self.method)
 
     def load_file_code(self, fname):
-        self.method = parse_file(fname)
+        if self.memory_cache is None:
+            self.use_method(self.read_file(fname))
+        else:
+            self.load_entry(self.memory_cache.file_key(fname, self.optimize, self.superinstructions),
+                            lambda: self.read_file(fname))
 
     def load_string_code(self, data):
-        self.method = parse_string(data)
+        if self.memory_cache is None:
+            self.use_method(self.read_string(data))
+        else:
+            self.load_entry(self.memory_cache.source_key(data, self.optimize, self.superinstructions),
+                            lambda: self.read_string(data))
+
+    def read_file(self, fname):
+        """
+        method of code file, optimized when the VM optimizes
+        """
+        if self.cache is None or fname.endswith(BYTECODE_SUFFIX):
+            return self.optimized(parse_file(fname))
+        with open(fname, 'rb') as f:
+            return self.disk_cached(f.read())
+
+    def read_string(self, data):
+        if self.cache is None:
+            return self.optimized(parse_string(data))
+        return self.disk_cached(data)
+
+    def disk_cached(self, source):
+        """
+        method of source code from the disk cache, a missing entry is parsed, verified
+        and optimized and stored for the next load
+        """
+        key = self.cache.key(source, self.optimize)
+        method = self.cache.get(key)
+        if method is None:
+            method = parse_string(source)
+            if self.optimize:
+                optimizer.optimize(method)
+            else:
+                verify_method(method)
+            self.cache.put(key, method)
+        return method
+
+    def optimized(self, method):
+        if self.optimize:
+            optimizer.optimize(method)
+        return method
+
+    def load_entry(self, key, parse):
+        """
+        load program of key from the memory cache, a missing one is parsed by parse(),
+        fused, verified and cached
+        """
+        entry = self.memory_cache.get(key)
+        if entry is None:
+            method = parse()
+            if self.superinstructions:
+                fusion.fuse(method)
+            entry = self.memory_cache.put(key, CachedProgram(method))
+        self.method = entry.method
+        self.entry = entry
+
+    def load_method(self, method):
+        self.use_method(self.optimized(method))
+
+    def use_method(self, method):
+        """
+        load method which is already optimized when the VM optimizes
+        """
+        if self.superinstructions:
+            fusion.fuse(method)
+        self.method = method
+        self.entry = None
+
+    def program(self, verify=True):
+        """
+        loaded method verified and decoded for the engine of VM
+        returned Program can be run from many threads at once, it is decoded again only when
+        another method is loaded or the code of the method is replaced
+        """
+        if self.entry is not None:
+            return self.entry.program(self.engine, self.arrays)
+        if verify:
+            self.verify()
+        method = self.method
+        if self.decoded is None or self.decoded[0] is not method or self.decoded[1] is not method.code:
+            self.decoded = (method, method.code, Program(method, self.engine, self.arrays, verify=False))
+        return self.decoded[2]
 
     def contain_arguments(self, args):
         """
         assign values from argument received to actual variables inside VM
         """
-        self.check_arguments_count(args)
-        variables = []
-        for arg_value, loc_var in itertools.zip_longest(args, self.method.variables):
-            if loc_var is None:
-                raise RuntimeException('more args than local vars')
-            lv = loc_var.copy()
-            lv.set_value(arg_value)
-            variables.append(lv)
-        return variables
+        return contain_arguments(self.method, value_containers.array_backends[self.arrays](), args)
 
-    def run(self, *args):
+    def run(self, *args, tracer=None, fuel=None, verify=True):
         """
         main run loop
         expects ready arguments as produced from VM.convert_args
         iterates the instruction list and executes instruction on index self.pc
+        tracer, when given, is called as tracer(pc, ins, stack) before every instruction
+        fuel, when given, is the maximum number of instructions to execute, it is charged per basic block
+        and OutOfFuelException is raised before a block which does not fit, see VM.fuel_used
+        method is verified by the first run, verify=False skips even that for trusted code
+        """
+        log.info('%-15s%s', 'args', len(args))
+        log.info('%-15s%s', 'local vars', len(self.method.variables))
+        log.info('%-15s%s', 'instructions', len(self.method.code))
+        if verify:
+            self.verify()
+        return self.executor(tracer, fuel)(args)
+
+    def run_batch(self, args_iterable, tracer=None, fuel=None, verify=True):
+        """
+        run loaded method for every tuple of arguments from args_iterable, yields results in order
+        method is verified and decoded once for the whole batch and one frame is reused by all runs
+        fuel is the limit of every single run
+        counters of the batch are kept in self.batch_stats
+        """
+        if verify:
+            self.verify()
+        execute = self.executor(tracer, fuel)
+        stats = self.batch_stats = BatchStats()
+        clock = time.perf_counter
+        try:
+            for args in args_iterable:
+                start = clock()
+                result = execute(args)
+                stats.seconds += clock() - start
+                stats.runs += 1
+                yield result
+        finally:
+            log.info('%-15s%s runs in %.4fs, %.1f runs/s', 'batch', stats.runs, stats.seconds, stats.throughput)
+
+    async def run_async(self, *args, slice=10000, verify=True):
+        """
+        same as run, yields to the event loop after every slice of executed instructions
+        (basic blocks for blocks engine), the task can be cancelled between slices
         """
-        log.info('{!s:<15}{}'.format('args', len(args)))
-        log.info('{!s:<15}{}'.format('local vars', len(self.method.variables)))
-        log.info(
-            '{!s:<15}{}'.format('instructions', len(self.method.code)))
-        self.verify()
-        arguments = self.contain_arguments(args)
-        self.frame = Frame(self.method, arguments)
-        while not self.frame.finished:
-            ins = self.frame.instructions[self.frame.pc]
-            log.info(
-                "pc {!s:<7}{!s:<28}stack {}".format(self.frame.pc, ins, self.frame.stack))
-            self.exec_frame(self.frame, ins)
-        return self.frame.return_value
+        if verify:
+            self.verify()
+        return await self.program(verify=False).run_async(*args, slice=slice)
+
+    def executor(self, tracer=None, fuel=None):
+        """
+        return function running decoded loaded method on a tuple of arguments
+        the function reuses single frame, loaded method has to be verified before
+        """
+        prog = self.program(verify=False)
+        frame = self.frame = Frame(self.method, None)
+
+        def execute(args):
+            frame.reset(prog.arguments(args))
+            prog.execute(frame, tracer, fuel)
+            return prog.result(frame)
+        return execute
+
+    @property
+    def fuel_used(self):
+        """
+        fuel charged by the last run, also when it ran out of fuel
+        """
+        return self.frame.fuel_used if self.frame is not None else 0
+
+    def compile(self, metered=False):
+        """
+        translate loaded method into python function
+        returned callable accepts the same arguments as VM.run and returns the same Value* result
+        metered callable requires fuel keyword argument and sets its fuel_used attribute after the run,
+        also when it ran out of fuel
+        """
+        method = self.method
+        arrays = value_containers.array_backends[self.arrays]()
+        function = compiler.compile_method(method, metered)
+
+        def compiled(*args, fuel=None):
+            check_arguments_count(method, args)
+            raw = [arrays.import_value(lv, arg) for lv, arg in zip(method.variables, args)]
+            if metered:
+                if fuel is None:
+                    raise RuntimeException('metered function needs fuel')
+                remaining = fuel
+                try:
+                    result, remaining = function(*raw, fuel)
+                except OutOfFuelException as e:
+                    remaining = e.remaining
+                    raise
+                finally:
+                    compiled.fuel_used = fuel - remaining
+            else:
+                result = function(*raw)
+            return value_containers.box(method.return_type, arrays.export_value(method.return_type, result))
+        compiled.source = function.source
+        compiled.fuel_used = 0
+        return compiled
 
     @classmethod
     def exec_frame(cls, frame, ins):
         ins.execute(frame)
         frame.pc += 1
 
-    def run_cmd(self, cmd_args):
+    def run_cmd(self, cmd_args, tracer=None):
         pargs = []
         for i, _ in enumerate(self.args_types):
             name = 'arg%d' % i
             pargs.append(getattr(cmd_args, name))
         cargs = self.convert_args(pargs)
-        return self.run(*cargs)
+        return self.run(*cargs, tracer=tracer)
 
     @property
     def args_types(self):
@@ -90,9 +286,7 @@ class VM:
             yield self.method.variables[i].vtype
 
     def check_arguments_count(self, args):
-        if len(args) != self.method.argument_count:
-            raise RuntimeException('number of function arguments (%s) does not match number of passed arguments (%s)' %
-                                   (self.method.argument_count, len(args)))
+        check_arguments_count(self.method, args)
 
     def convert_args(self, args):
         """
@@ -102,7 +296,6 @@ class VM:
         cargs = []
         for i in range(self.method.argument_count):
             lv = self.method.variables[i]
-            print(i, lv)
             try:
                 cargs.append(value_containers.convert_values(lv, args[i]))
             except ValueError:
@@ -27,3 +27,23 @@ class RuntimeException(VirtualMachineException):
 
 class InstructionException(RuntimeException):
     pass
+
+
+class OutOfFuelException(RuntimeException):
+    pass
+
+
+class SnapshotException(VirtualMachineException):
+    pass
+
+
+class ArrayIndexException(RuntimeException):
+    pass
+
+
+class ArrayValueException(RuntimeException):
+    pass
+
+
+class BytecodeException(VirtualMachineException):
+    pass
@@ -2,6 +2,7 @@
 
 
 class Frame:
+    __slots__ = ('method', 'instructions', 'variables', 'stack', 'pc', 'finished', 'return_value', 'fuel_used')
 
     def __init__(self, _method, _arguments):
         self.method = _method
@@ -11,3 +12,15 @@ class Frame:
         self.pc = 0
         self.finished = False
         self.return_value = None
+        self.fuel_used = 0
+
+    def reset(self, _arguments):
+        """
+        prepare frame for a new run of the same method
+        """
+        self.variables = _arguments
+        self.stack.clear()
+        self.pc = 0
+        self.finished = False
+        self.return_value = None
+        self.fuel_used = 0
@@ -0,0 +1,104 @@
+# -*- coding: utf-8  -*-
+"""
+superinstruction fusion pass
+
+rewrites frequent fixed instruction sequences into single superinstructions,
+sequences are never fused across a jump target or a label
+"""
+from . import opcodes
+from . import instructions
+
+
+def _iinc_dup(code, i):
+    seq = code[i:i + 5]
+    if [ins.opcode for ins in seq[2:]] != [opcodes.IADD, opcodes.DUP, opcodes.ISTORE]:
+        return None
+    first, second = seq[0].opcode, seq[1].opcode
+    if (first, second) == (opcodes.ILOAD, opcodes.IPUSH):
+        index = seq[0].argument.value
+    elif (first, second) == (opcodes.IPUSH, opcodes.ILOAD):
+        index = seq[1].argument.value
+    else:
+        return None
+    if seq[4].argument.value != index:
+        return None
+    return instructions.InsIIncDup(seq)
+
+
+def _iload_add(code, i):
+    ops = [ins.opcode for ins in code[i:i + 3]]
+    if ops in ([opcodes.ILOAD, opcodes.IPUSH, opcodes.IADD],
+               [opcodes.ILOAD, opcodes.IPUSH, opcodes.ISUB],
+               [opcodes.IPUSH, opcodes.ILOAD, opcodes.IADD]):
+        return instructions.InsILoadAdd(code[i:i + 3])
+    return None
+
+
+def _array_load_locals(code, i):
+    seq = code[i:i + 3]
+    ops = [ins.opcode for ins in seq]
+    if ops == [opcodes.ALOAD, opcodes.ILOAD, opcodes.IALOAD]:
+        return instructions.InsIALoadLocals(seq)
+    elif ops == [opcodes.ALOAD, opcodes.ILOAD, opcodes.FALOAD]:
+        return instructions.InsFALoadLocals(seq)
+    return None
+
+
+def _if_icmp_locals(code, i):
+    seq = code[i:i + 3]
+    if [ins.opcode for ins in seq[:2]] != [opcodes.ILOAD, opcodes.ILOAD] or \
+            len(seq) < 3 or not opcodes.IF_ICMPEQ <= seq[2].opcode <= opcodes.IF_ICMPLT:
+        return None
+    return instructions.InsIfICmpLocals(seq)
+
+
+def _if_icmp_load(code, i):
+    seq = code[i:i + 2]
+    if len(seq) < 2 or seq[0].opcode != opcodes.ILOAD or not opcodes.IF_ICMPEQ <= seq[1].opcode <= opcodes.IF_ICMPLT:
+        return None
+    return instructions.InsIfICmpLoad(seq)
+
+
+# longest sequences first
+PATTERNS = [
+    _iinc_dup,
+    _if_icmp_locals,
+    _array_load_locals,
+    _iload_add,
+    _if_icmp_load,
+]
+
+
+def boundaries(method):
+    """
+    indexes of instructions which cannot be inside of a fused sequence
+    """
+    targets = set(method.labels[label] for label in method.code_labels)
+    for ins in method.code:
+        if isinstance(ins, (instructions.InsJump, instructions.InsBranch)):
+            targets.add(ins.argument.value)
+    return targets
+
+
+def fuse(method):
+    """
+    replace method code with code using superinstructions, returns the method
+    """
+    code = method.code
+    targets = boundaries(method)
+    fused_code = []
+    index_map = {}
+    i = 0
+    while i < len(code):
+        index_map[i] = len(fused_code)
+        for pattern in PATTERNS:
+            fused = pattern(code, i)
+            if fused is not None and not targets.intersection(range(i + 1, i + len(fused.parts))):
+                fused_code.append(fused)
+                i += len(fused.parts)
+                break
+        else:
+            fused_code.append(code[i])
+            i += 1
+    method.relocate([ins.retarget(index_map) for ins in fused_code], index_map)
+    return method
@@ -3,11 +3,12 @@ import operator
 from collections import OrderedDict
 
 from . import opcodes
-from .value_containers import ValueInt, ValueFloat, ValueIntArrayRef, ValueFloatArrayRef
+from .value_containers import array_types, float_value, int_value, new_raw_array
 from .exceptions import InstructionException, ValueException
 
 
 class Instruction():
+    __slots__ = ()
     opcode = None
 
     def __str__(self):
@@ -19,16 +20,29 @@ class Instruction():
     def __eq__(self, other):
         return self.opcode == other.opcode
 
+    def expand(self):
+        """
+        instructions available in code this instruction stands for
+        """
+        return [self]
+
+    def retarget(self, index_map):
+        """
+        instruction with jump target moved according to index_map {old index: new index}
+        """
+        return self
+
 
 class InsNoArgument(Instruction):
-    pass
+    __slots__ = ()
 
 
 class InsReturn(InsNoArgument):
-    pass
+    __slots__ = ()
 
 
 class InsArgument(Instruction):
+    __slots__ = ('argument',)
 
     def __str__(self):
         return "%s <%s>" % (self.__class__.__name__, self.argument)
@@ -43,30 +57,37 @@ class InsArgument(Instruction):
 
 
 class InsArgNumber(InsArgument):
-    pass
+    __slots__ = ()
 
 
 class InsArgInteger(InsArgNumber):
-    pass
+    __slots__ = ()
 
 
 class InsArgFloat(InsArgNumber):
-    pass
+    __slots__ = ()
 
 
 class InsArgILabel(InsArgInteger):
-    pass
+    __slots__ = ()
 
 
 class InsJump(InsArgILabel):
-    pass
+    __slots__ = ()
+
+    def retarget(self, index_map):
+        return self.__class__(int_value(index_map[self.argument.value]))
 
 
 class InsBranch(InsArgILabel):
-    pass
+    __slots__ = ()
+
+    def retarget(self, index_map):
+        return self.__class__(int_value(index_map[self.argument.value]))
 
 
 class InsCompareBase(InsBranch):
+    __slots__ = ()
     opr = lambda a, b, c: None
 
     def execute(self, frame):
@@ -77,14 +98,15 @@ class InsCompareBase(InsBranch):
 
 
 class InsICompareBase(InsCompareBase):
-    pass
+    __slots__ = ()
 
 
 class InsFCompareBase(InsCompareBase):
-    pass
+    __slots__ = ()
 
 
 class InsMathBase(InsNoArgument):
+    __slots__ = ()
     opr = lambda a, b, cs: None
 
     def execute(self, frame):
@@ -95,14 +117,15 @@ class InsMathBase(InsNoArgument):
 
 
 class InsIMathBase(InsMathBase):
-    pass
+    __slots__ = ()
 
 
 class InsFMathBase(InsMathBase):
-    pass
+    __slots__ = ()
 
 
 class InsArrayLoad(InsNoArgument):
+    __slots__ = ()
 
     def execute(self, frame):
         index = frame.stack.pop().value
@@ -111,6 +134,7 @@ class InsArrayLoad(InsNoArgument):
 
 
 class InsArrayStore(InsNoArgument):
+    __slots__ = ()
 
     def execute(self, frame):
         value = frame.stack.pop()
@@ -119,6 +143,43 @@ class InsArrayStore(InsNoArgument):
         arr[index] = value
 
 
+class InsFused(Instruction):
+
+    """
+    superinstruction executing a fixed sequence of instructions stored in parts
+    parts slot is declared by subclasses, InsFusedBranch could not combine it with InsBranch slots otherwise
+    """
+    __slots__ = ()
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def __str__(self):
+        return "%s %s" % (self.__class__.__name__, self.parts)
+
+    def __eq__(self, other):
+        return super().__eq__(other) and self.parts == other.parts
+
+    def expand(self):
+        return list(self.parts)
+
+
+class InsFusedBranch(InsFused, InsBranch):
+
+    """
+    superinstruction ending with a branch, argument is the branch target
+    """
+    __slots__ = ('parts', 'opr')
+
+    def __init__(self, parts):
+        super().__init__(parts)
+        self.argument = parts[-1].argument
+        self.opr = parts[-1].opr
+
+    def retarget(self, index_map):
+        return self.__class__([*self.parts[:-1], self.parts[-1].retarget(index_map)])
+
+
 ###########################################################
 #
 #  INSTRUCTIONS
@@ -131,6 +192,7 @@ class InsIPush(InsArgInteger):
     """
     push integer value onto the stack
     """
+    __slots__ = ()
     opcode = opcodes.IPUSH
 
     def execute(self, frame):
@@ -142,6 +204,7 @@ class InsFPush(InsArgFloat):
     """
     push float value onto the stack
     """
+    __slots__ = ()
     opcode = opcodes.FPUSH
 
     def execute(self, frame):
@@ -153,6 +216,7 @@ class InsILoad(InsArgILabel):
     """
     load integer value from local variable at index
     """
+    __slots__ = ()
     opcode = opcodes.ILOAD
 
     def execute(self, frame):
@@ -164,6 +228,7 @@ class InsFLoad(InsArgILabel):
     """
     load float value from local variable at index
     """
+    __slots__ = ()
     opcode = opcodes.FLOAD
 
     def execute(self, frame):
@@ -175,6 +240,7 @@ class InsIStore(InsArgILabel):
     """
     store integer value to local variable at index
     """
+    __slots__ = ()
     opcode = opcodes.ISTORE
 
     def execute(self, frame):
@@ -186,6 +252,7 @@ class InsFStore(InsArgILabel):
     """
     store float value to local variable at index
     """
+    __slots__ = ()
     opcode = opcodes.FSTORE
 
     def execute(self, frame):
@@ -197,6 +264,7 @@ class InsGoto(InsJump):
     """
     move pointer to position
     """
+    __slots__ = ()
     opcode = opcodes.GOTO
 
     def execute(self, frame):
@@ -208,6 +276,7 @@ class InsIReturn(InsReturn):
     """
     pops value from stack and set it as return value of the code and finishes execution
     """
+    __slots__ = ()
     opcode = opcodes.IRETURN
 
     def execute(self, frame):
@@ -220,6 +289,7 @@ class InsFReturn(InsReturn):
     """
     pops value from stack and set it as return value of the code and finishes execution
     """
+    __slots__ = ()
     opcode = opcodes.FRETURN
 
     def execute(self, frame):
@@ -232,6 +302,7 @@ class InsNop(InsNoArgument):
     """
     no effect, no operation
     """
+    __slots__ = ()
     opcode = opcodes.NOP
 
     def execute(self, frame):
@@ -243,6 +314,7 @@ class InsPop(InsNoArgument):
     """
     pops value from stack and discards it
     """
+    __slots__ = ()
     opcode = opcodes.POP
 
     def execute(self, frame):
@@ -254,12 +326,11 @@ class InsDup(InsNoArgument):
     """
     duplicates value on the stack
     """
+    __slots__ = ()
     opcode = opcodes.DUP
 
     def execute(self, frame):
-        val = frame.stack.pop()
-        frame.stack.append(val)
-        frame.stack.append(val.copy())
+        frame.stack.append(frame.stack[-1])
 
 
 class InsSwap(InsNoArgument):
@@ -267,6 +338,7 @@ class InsSwap(InsNoArgument):
     """
     swaps values on the stack
     """
+    __slots__ = ()
     opcode = opcodes.SWAP
 
     def execute(self, frame):
@@ -281,6 +353,7 @@ class InsIfICmpEq(InsICompareBase):
     """
     if two values are equal, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_ICMPEQ
     opr = operator.eq
 
@@ -290,6 +363,7 @@ class InsIfICmpNe(InsICompareBase):
     """
     if two values are not equal, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_ICMPNE
     opr = operator.ne
 
@@ -299,6 +373,7 @@ class InsIfICmpGe(InsICompareBase):
     """
     if value1 is greater or equal to value2, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_ICMPGE
     opr = operator.ge
 
@@ -308,6 +383,7 @@ class InsIfICmpGt(InsICompareBase):
     """
     if value1 is greater than value2, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_ICMPGT
     opr = operator.gt
 
@@ -317,6 +393,7 @@ class InsIfICmpLe(InsICompareBase):
     """
     if value1 is lower or equal than value2, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_ICMPLE
     opr = operator.le
 
@@ -326,6 +403,7 @@ class InsIfICmpLt(InsICompareBase):
     """
     if value1 is lower than value2, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_ICMPLT
     opr = operator.lt
 
@@ -335,6 +413,7 @@ class InsIfFCmpEq(InsFCompareBase):
     """
     if two values are equal, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_FCMPEQ
     opr = operator.eq
 
@@ -344,6 +423,7 @@ class InsIfFCmpNe(InsFCompareBase):
     """
     if two values are not equal, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_FCMPNE
     opr = operator.ne
 
@@ -353,6 +433,7 @@ class InsIfFCmpGe(InsFCompareBase):
     """
     if value1 is greater or equal to value2, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_FCMPGE
     opr = operator.ge
 
@@ -362,6 +443,7 @@ class InsIfFCmpGt(InsFCompareBase):
     """
     if value1 is greater than value2, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_FCMPGT
     opr = operator.gt
 
@@ -371,6 +453,7 @@ class InsIfFCmpLe(InsFCompareBase):
     """
     if value1 is lower or equal than value2, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_FCMPLE
     opr = operator.le
 
@@ -380,6 +463,7 @@ class InsIfFCmpLt(InsFCompareBase):
     """
     if value1 is lower than value2, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IF_FCMPLT
     opr = operator.lt
 
@@ -389,6 +473,7 @@ class InsIfNonNull(InsBranch):
     """
     if value is not null, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IFNONNULL
 
     def execute(self, frame):
@@ -402,6 +487,7 @@ class InsIfNull(InsBranch):
     """
     if value is null, move pointer to <var>
     """
+    __slots__ = ()
     opcode = opcodes.IFNULL
 
     def execute(self, frame):
@@ -415,6 +501,7 @@ class InsIAdd(InsIMathBase):
     """
     add two integers, push result to stack
     """
+    __slots__ = ()
     opcode = opcodes.IADD
     opr = operator.add
 
@@ -424,6 +511,7 @@ class InsISub(InsIMathBase):
     """
     subsctract two integers, push result to stack
     """
+    __slots__ = ()
     opcode = opcodes.ISUB
     opr = operator.sub
 
@@ -433,6 +521,7 @@ class InsIMul(InsIMathBase):
     """
     multiply two integers, push result to stack
     """
+    __slots__ = ()
     opcode = opcodes.IMUL
     opr = operator.mul
 
@@ -442,6 +531,7 @@ class InsIDiv(InsIMathBase):
     """
     divide two integers, push result to stack
     """
+    __slots__ = ()
     opcode = opcodes.IDIV
     opr = operator.floordiv
 
@@ -451,6 +541,7 @@ class InsFAdd(InsFMathBase):
     """
     add two floats, push result to stack
     """
+    __slots__ = ()
     opcode = opcodes.FADD
     opr = operator.add
 
@@ -460,6 +551,7 @@ class InsFSub(InsFMathBase):
     """
     subsctract two floats, push result to stack
     """
+    __slots__ = ()
     opcode = opcodes.FSUB
     opr = operator.sub
 
@@ -469,6 +561,7 @@ class InsFMul(InsFMathBase):
     """
     multiply two floats, push result to stack
     """
+    __slots__ = ()
     opcode = opcodes.FMUL
     opr = operator.mul
 
@@ -478,6 +571,7 @@ class InsFDiv(InsFMathBase):
     """
     divide two floats, push result to stack
     """
+    __slots__ = ()
     opcode = opcodes.FDIV
     opr = operator.truediv
 
@@ -487,12 +581,13 @@ class InsFloat2Int(InsNoArgument):
     """
     converts float to int
     """
+    __slots__ = ()
     opcode = opcodes.F2I
 
     def execute(self, frame):
         val1 = frame.stack.pop()
         pval = int(val1.value)
-        frame.stack.append(ValueInt(pval))
+        frame.stack.append(int_value(pval))
 
 
 class InsInt2Float(InsNoArgument):
@@ -500,12 +595,13 @@ class InsInt2Float(InsNoArgument):
     """
     converts int to float
     """
+    __slots__ = ()
     opcode = opcodes.I2F
 
     def execute(self, frame):
         val1 = frame.stack.pop()
         pval = float(val1.value)
-        frame.stack.append(ValueFloat(pval))
+        frame.stack.append(float_value(pval))
 
 
 class InsNewArray(InsArgInteger):
@@ -513,22 +609,19 @@ class InsNewArray(InsArgInteger):
     """
     makes an array of size value1 with type <var>
     """
+    __slots__ = ('array_type',)
     opcode = opcodes.NEWARRAY
 
     def __init__(self, arg=None):
         super().__init__(arg)
-        if self.argument.value == 0:
-            self.array_type = ValueIntArrayRef
-        elif self.argument.value == 1:
-            self.array_type = ValueFloatArrayRef
+        if self.argument.value in (0, 1):
+            self.array_type = array_types[self.argument.value]
         else:
             raise InstructionException('newarray can accept only type 0 or 1, received %s' % self.argument.value)
 
     def execute(self, frame):
         size = frame.stack.pop().value
-        arr = self.array_type()
-        arr.allocate(asize=size)
-        frame.stack.append(arr)
+        frame.stack.append(self.array_type(new_raw_array(self.array_type, size)))
 
 
 class InsALoad(InsArgILabel):
@@ -536,6 +629,7 @@ class InsALoad(InsArgILabel):
     """
     load array reference from local variable <var>
     """
+    __slots__ = ()
     opcode = opcodes.ALOAD
 
     def execute(self, frame):
@@ -547,6 +641,7 @@ class InsAStore(InsArgILabel):
     """
     store array reference to local variable <var>
     """
+    __slots__ = ()
     opcode = opcodes.ASTORE
 
     def execute(self, frame):
@@ -558,6 +653,7 @@ class InsIALoad(InsArrayLoad):
     """
     load an int from an array
     """
+    __slots__ = ()
     opcode = opcodes.IALOAD
 
 
@@ -566,6 +662,7 @@ class InsFALoad(InsArrayLoad):
     """
     load an float from an array
     """
+    __slots__ = ()
     opcode = opcodes.FALOAD
 
 
@@ -574,11 +671,12 @@ class InsArrayLength(InsNoArgument):
     """
     returns length of an array
     """
+    __slots__ = ()
     opcode = opcodes.ARRAYLENGTH
 
     def execute(self, frame):
         arr = frame.stack.pop()
-        frame.stack.append(ValueInt(arr.length))
+        frame.stack.append(int_value(arr.length))
 
 
 class InsIAStore(InsArrayStore):
@@ -586,6 +684,7 @@ class InsIAStore(InsArrayStore):
     """
     store an int to array index
     """
+    __slots__ = ()
     opcode = opcodes.IASTORE
 
 
@@ -594,6 +693,7 @@ class InsFAStore(InsArrayStore):
     """
     store an float to array index
     """
+    __slots__ = ()
     opcode = opcodes.FASTORE
 
 
@@ -602,6 +702,7 @@ class InsAReturn(InsReturn):
     """
     pops value from stack and set it as return value of the code and finishes execution
     """
+    __slots__ = ()
     opcode = opcodes.ARETURN
 
     def execute(self, frame):
@@ -609,6 +710,121 @@ class InsAReturn(InsReturn):
         frame.return_value = frame.stack.pop()
 
 
+###########################################################
+#
+#  SUPERINSTRUCTIONS
+#
+###########################################################
+
+
+class InsIIncDup(InsFused):
+
+    """
+    iload <var>; ipush <c>; iadd; dup; istore <var>
+    increments integer local variable and pushes the new value
+    """
+    __slots__ = ('parts', 'index', 'increment')
+    opcode = opcodes.IINC_DUP
+
+    def __init__(self, parts):
+        super().__init__(parts)
+        loads = [p for p in parts if p.opcode == opcodes.ILOAD]
+        pushes = [p for p in parts if p.opcode == opcodes.IPUSH]
+        self.index = loads[0].argument.value
+        self.increment = pushes[0].argument
+
+    def execute(self, frame):
+        val = frame.variables[self.index] + self.increment
+        frame.variables[self.index] = val
+        frame.stack.append(val)
+
+
+class InsILoadAdd(InsFused):
+
+    """
+    iload <var>; ipush <c>; iadd or isub, or ipush <c>; iload <var>; iadd
+    pushes local variable plus or minus constant
+    """
+    __slots__ = ('parts', 'index', 'increment')
+    opcode = opcodes.ILOAD_ADD
+
+    def __init__(self, parts):
+        super().__init__(parts)
+        load, push = sorted(parts[:2], key=lambda p: p.opcode != opcodes.ILOAD)
+        self.index = load.argument.value
+        if parts[2].opcode == opcodes.ISUB:
+            self.increment = int_value(-push.argument.value)
+        else:
+            self.increment = push.argument
+
+    def execute(self, frame):
+        frame.stack.append(frame.variables[self.index] + self.increment)
+
+
+class InsArrayLoadLocals(InsFused):
+
+    """
+    aload <array>; iload <index>; iaload or faload
+    pushes array element, both array and index are local variables
+    """
+    __slots__ = ('parts', 'array_index', 'index')
+
+    def __init__(self, parts):
+        super().__init__(parts)
+        self.array_index = parts[0].argument.value
+        self.index = parts[1].argument.value
+
+    def execute(self, frame):
+        frame.stack.append(frame.variables[self.array_index][frame.variables[self.index].value])
+
+
+class InsIALoadLocals(InsArrayLoadLocals):
+    __slots__ = ()
+    opcode = opcodes.IALOAD_LOCALS
+
+
+class InsFALoadLocals(InsArrayLoadLocals):
+    __slots__ = ()
+    opcode = opcodes.FALOAD_LOCALS
+
+
+class InsIfICmpLocals(InsFusedBranch):
+
+    """
+    iload <var1>; iload <var2>; if_icmp<cond> <target>
+    compares two integer local variables
+    """
+    __slots__ = ('index1', 'index2')
+    opcode = opcodes.IF_ICMP_LOCALS
+
+    def __init__(self, parts):
+        super().__init__(parts)
+        self.index1 = parts[0].argument.value
+        self.index2 = parts[1].argument.value
+
+    def execute(self, frame):
+        if self.opr(frame.variables[self.index1].value, frame.variables[self.index2].value):
+            frame.pc = self.argument.value - 1
+
+
+class InsIfICmpLoad(InsFusedBranch):
+
+    """
+    iload <var>; if_icmp<cond> <target>
+    compares value on the stack with integer local variable
+    """
+    __slots__ = ('index',)
+    opcode = opcodes.IF_ICMP_LOAD
+
+    def __init__(self, parts):
+        super().__init__(parts)
+        self.index = parts[0].argument.value
+
+    def execute(self, frame):
+        if self.opr(frame.stack.pop().value, frame.variables[self.index].value):
+            frame.pc = self.argument.value - 1
+
+
 keywords = OrderedDict([
     ('ipush', InsIPush),
     ('fpush', InsFPush),
@@ -668,8 +884,8 @@ keywords = OrderedDict([
 
 def contain_value(inst, value):
     if issubclass(inst, InsArgInteger):
-        return ValueInt(value)
+        return int_value(int(value))
     elif issubclass(inst, InsArgFloat):
-        return ValueFloat(value)
+        return float_value(float(value))
     else:
         raise ValueException('instruction %s cannot contain value int or float' % inst)
@@ -1,8 +1,17 @@
 # -*- coding: utf8 -*-
+import itertools
+import types
 
 
 class Method():
 
+    """
+    parsed function, verified is True once the method passed the verifier, assigning any
+    other attribute makes it False. verified method is frozen, its code and variables are
+    tuples and labels a read only mapping, so it cannot be changed in place
+    """
+    __slots__ = ('code', 'verified', 'variables', 'argument_count', 'return_type', 'function_name', 'labels')
+
     def __init__(self, _code=None, _variables=None, _argument_count=0, _return_type=None):
         if not _variables:
             _variables = []
@@ -14,3 +23,50 @@ class Method():
         self.return_type = _return_type
         self.function_name = None
         self.labels = {}
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name != 'verified':
+            object.__setattr__(self, 'verified', False)
+
+    def __getstate__(self):
+        state = dict((name, getattr(self, name)) for name in self.__slots__)
+        state['labels'] = dict(self.labels)
+        return state
+
+    def __setstate__(self, state):
+        """
+        restore pickled or copied method, verified one stays verified and frozen
+        """
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+        if self.verified:
+            object.__setattr__(self, 'labels', types.MappingProxyType(self.labels))
+
+    def freeze(self):
+        """
+        mark method verified, code, variables and labels become immutable
+        """
+        self.code = tuple(self.code)
+        self.variables = tuple(self.variables)
+        self.labels = types.MappingProxyType(dict(self.labels))
+        self.verified = True
+
+    @property
+    def code_labels(self):
+        """
+        labels pointing to instructions
+        every variable has exactly one label and those are defined before labels in code
+        """
+        return list(itertools.islice(self.labels, len(self.variables), None))
+
+    def relocate(self, code, index_map):
+        """
+        replace code, move labels in code according to index_map {old index: new index}
+        the method has to be verified again
+        """
+        labels = dict(self.labels)
+        for label in self.code_labels:
+            labels[label] = index_map[labels[label]]
+        self.labels = labels
+        self.code = code
@@ -47,3 +47,11 @@ FASTORE = 44
 ARETURN = 45
 
 TOTAL = 45
+
+# superinstructions, produced by the fusion pass only, not available in code
+IINC_DUP = 46
+ILOAD_ADD = 47
+IALOAD_LOCALS = 48
+FALOAD_LOCALS = 49
+IF_ICMP_LOCALS = 50
+IF_ICMP_LOAD = 51
@@ -0,0 +1,168 @@
+# -*- coding: utf-8  -*-
+"""
+optimizer of verified method code
+
+    - removes unreachable basic blocks
+    - folds constant pushes feeding math and conversion instructions into one push
+    - removes nop, dup; pop and swap; swap
+
+rewrites never span a jump target or a label, so they are local to a basic
+block. removed instructions are compacted away and every jump target and
+code label is moved to the new index of its instruction
+"""
+import bisect
+import math
+
+from . import opcodes
+from .analysis.controlflow import ControlFlowAnalyzer
+from .analysis.verifier import verify_method
+from .fusion import boundaries
+from .instructions import InsFPush, InsIMathBase, InsFMathBase, InsIPush
+from .value_containers import float_value, int_value
+
+
+PUSHES = (opcodes.IPUSH, opcodes.FPUSH)
+
+# pairs of instructions without any effect
+NO_EFFECT = [
+    (opcodes.DUP, opcodes.POP),
+    (opcodes.SWAP, opcodes.SWAP),
+]
+
+
+def _push(value):
+    if isinstance(value, float):
+        return InsFPush(float_value(value))
+    return InsIPush(int_value(value))
+
+
+def _fold_math(ins, a, b):
+    if ins.opcode in (opcodes.IDIV, opcodes.FDIV) and b == 0:
+        # keep division by zero to fail at runtime
+        return None
+    return ins.opr(a, b)
+
+
+def _fold_conversion(ins, a):
+    if ins.opcode == opcodes.I2F:
+        return float(a)
+    if ins.opcode == opcodes.F2I and math.isfinite(a):
+        return int(a)
+    return None
+
+
+class Rewriter():
+
+    """
+    appends instructions one by one and applies rewrites on the end of the code built so far
+    """
+
+    def __init__(self, targets):
+        self.targets = targets
+        # items are [old index, instruction, is jump target]
+        self.out = []
+        self.target_pending = False
+        self.changed = False
+
+    def append(self, index, ins):
+        is_target = index in self.targets or self.target_pending
+        self.target_pending = False
+        self.out.append([index, ins, is_target])
+        while self.rewrite():
+            self.changed = True
+
+    def tail(self, n):
+        """
+        last n instructions, when none but the first of them is a jump target
+        """
+        if len(self.out) < n or any(item[2] for item in self.out[len(self.out) - n + 1:]):
+            return None
+        return [item[1] for item in self.out[-n:]]
+
+    def replace(self, n, ins):
+        """
+        replace last n instructions by ins, or remove them when ins is None
+        """
+        first = self.out[-n]
+        del self.out[-n:]
+        if ins is not None:
+            self.out.append([first[0], ins, first[2]])
+        elif first[2]:
+            # jumps to removed instructions continue to the next instruction
+            self.target_pending = True
+
+    def rewrite(self):
+        if not self.out:
+            return False
+        last = self.out[-1][1]
+        if last.opcode == opcodes.NOP:
+            self.replace(1, None)
+            return True
+        pair = self.tail(2)
+        if pair is not None and (pair[0].opcode, pair[1].opcode) in NO_EFFECT:
+            self.replace(2, None)
+            return True
+        if pair is not None and pair[0].opcode in PUSHES:
+            value = _fold_conversion(pair[1], pair[0].argument.value)
+            if value is not None:
+                self.replace(2, _push(value))
+                return True
+        triple = self.tail(3)
+        if triple is not None and triple[0].opcode in PUSHES and triple[1].opcode in PUSHES and \
+                isinstance(triple[2], (InsIMathBase, InsFMathBase)):
+            value = _fold_math(triple[2], triple[0].argument.value, triple[1].argument.value)
+            if value is not None and (isinstance(value, int) or math.isfinite(value)):
+                self.replace(3, _push(value))
+                return True
+        return False
+
+
+def reachable(method):
+    """
+    indexes of instructions in basic blocks reachable from the method start
+    """
+    bbs = ControlFlowAnalyzer().analyze(method)
+    if not bbs:
+        return set()
+    seen = set()
+    todo = [bbs[0]]
+    while todo:
+        bb = todo.pop()
+        if id(bb) in seen:
+            continue
+        seen.add(id(bb))
+        todo.extend(bb.sucessors)
+    return set(i for bb in bbs if id(bb) in seen for i in bb.instruction_indexes)
+
+
+def compact(method, rewriter):
+    """
+    replace method code with rewritten code, returns True when code changed
+    """
+    old_length = len(method.code)
+    firsts = [item[0] for item in rewriter.out]
+    # removed instructions are mapped to the next kept one
+    index_map = dict((i, bisect.bisect_left(firsts, i)) for i in range(old_length + 1))
+    code = [item[1].retarget(index_map) for item in rewriter.out]
+    method.relocate(code, index_map)
+    return rewriter.changed or len(code) != old_length
+
+
+def optimize_once(method):
+    live = reachable(method)
+    rewriter = Rewriter(boundaries(method))
+    for i, ins in enumerate(method.code):
+        if i in live:
+            rewriter.append(i, ins)
+    return compact(method, rewriter)
+
+
+def optimize(method):
+    """
+    optimize verified method in place and verify the result, returns the method
+    """
+    verify_method(method)
+    while optimize_once(method):
+        pass
+    verify_method(method)
+    return method
@@ -0,0 +1,83 @@
+# -*- coding: utf-8  -*-
+"""
+parallel execution of many independent runs of one method in a process pool
+
+the method is verified in the calling process and shipped to every worker once
+by the pool initializer, workers decode it for the engine and keep a single
+executor, argument tuples are sent to workers in chunks
+"""
+import collections
+import concurrent.futures
+import itertools
+import os
+
+from .engine import VM
+from .exceptions import RuntimeException
+
+
+# executor of the worker process, set by _init_worker
+_execute = None
+
+
+def _init_worker(method, engine):
+    global _execute
+    vm = VM(engine=engine)
+    vm.load_method(method)
+    _execute = vm.executor()
+
+
+def _run_chunk(chunk):
+    return [_execute(args) for args in chunk]
+
+
+def chunks(iterable, size):
+    """
+    split iterable into lists of at most size items
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_many(method, args_iter, workers=None, chunksize=64, ordered=True, engine='interpreter', mp_context=None):
+    """
+    run method for every tuple of arguments from args_iter in worker processes and yield the results
+    arguments are expected as produced from VM.convert_args, results are the same as from VM.run
+    results are yielded in order of arguments, or as soon as their chunk finishes when ordered is False
+    args_iter is consumed lazily, at most two chunks per worker are in flight
+    mp_context, when given, is the multiprocessing context starting the workers, e.g. spawn
+    """
+    if chunksize < 1:
+        raise RuntimeException('chunksize must be at least 1, received %s' % chunksize)
+    workers = workers or os.cpu_count() or 1
+    vm = VM(engine=engine)
+    vm.load_method(method)
+    vm.verify()
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                                                  initializer=_init_worker, initargs=(method, engine))
+    pending = collections.deque()
+    try:
+        for chunk in chunks(args_iter, chunksize):
+            pending.append(pool.submit(_run_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield from _finished(pending, ordered)
+        while pending:
+            yield from _finished(pending, ordered)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _finished(pending, ordered):
+    """
+    results of the oldest chunk, or of any finished chunk when not ordered
+    """
+    if ordered:
+        future = pending.popleft()
+    else:
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        future = done.pop()
+        pending.remove(future)
+    return future.result()
@@ -0,0 +1,251 @@
+# -*- coding: utf-8  -*-
+"""
+loaded program shared by concurrent runs
+
+Program is a verified method decoded for one engine, it is not changed after
+construction. everything a single run changes lives in its own Frame, so one
+Program can be run from many threads or asyncio tasks at once without locking
+"""
+import asyncio
+import itertools
+
+from . import blocks
+from . import dispatch
+from . import value_containers
+from .analysis import bounds
+from .analysis.verifier import verify_method
+from .exceptions import RuntimeException
+from .frame import Frame
+
+
+ENGINES = ('interpreter', 'dispatch', 'unboxed', 'blocks')
+UNBOXED_ENGINES = ('unboxed', 'blocks')
+
+
+def check_options(engine, arrays):
+    if engine not in ENGINES:
+        raise RuntimeException('unknown engine %s, choose one of %s' % (engine, ', '.join(ENGINES)))
+    if arrays not in value_containers.array_backends:
+        raise RuntimeException('unknown array backend %s, choose one of %s' %
+                               (arrays, ', '.join(value_containers.array_backends)))
+
+
+def check_arguments_count(method, args):
+    if len(args) != method.argument_count:
+        raise RuntimeException('number of function arguments (%s) does not match number of passed arguments (%s)' %
+                               (method.argument_count, len(args)))
+
+
+def contain_arguments(method, arrays, args):
+    """
+    assign values from argument received to actual variables inside VM
+    """
+    check_arguments_count(method, args)
+    variables = []
+    for arg_value, loc_var in itertools.zip_longest(args, method.variables):
+        if loc_var is None:
+            raise RuntimeException('more args than local vars')
+        variables.append(loc_var.__class__(arrays.import_value(loc_var, arg_value)))
+    return variables
+
+
+def unbox_arguments(method, arrays, args):
+    """
+    raw values of arguments and empty local variables for unboxed execution
+    """
+    check_arguments_count(method, args)
+    variables = [None] * len(method.variables)
+    for i, arg_value in enumerate(args):
+        lv = method.variables[i]
+        variables[i] = arrays.import_value(lv, arg_value)
+    return variables
+
+
+def interpret(frame, tracer=None):
+    """
+    reference interpreter, executes instructions of the frame one by one until finished
+    """
+    if tracer is not None:
+        while not frame.finished:
+            ins = frame.instructions[frame.pc]
+            tracer(frame.pc, ins, frame.stack)
+            ins.execute(frame)
+            frame.pc += 1
+    else:
+        while not frame.finished:
+            frame.instructions[frame.pc].execute(frame)
+            frame.pc += 1
+
+
+def interpret_metered(frame, table, fuel, tracer=None):
+    """
+    same as interpret, charges fuel cost of every basic block before it runs
+    table is (lengths, costs) of the rest of the block from every pc as from blocks.block_table
+    """
+    instructions = frame.instructions
+    lengths, costs = table
+    remaining = fuel
+    try:
+        while not frame.finished:
+            pc = frame.pc
+            cost = costs[pc]
+            if cost > remaining:
+                raise dispatch.out_of_fuel(remaining, pc, cost)
+            remaining -= cost
+            for _ in range(lengths[pc]):
+                ins = instructions[frame.pc]
+                if tracer is not None:
+                    tracer(frame.pc, ins, frame.stack)
+                ins.execute(frame)
+                frame.pc += 1
+    finally:
+        frame.fuel_used += fuel - remaining
+
+
+def interpret_steps(frame, steps):
+    """
+    execute at most steps instructions of the frame, returns True when the frame finished
+    """
+    instructions = frame.instructions
+    while steps > 0 and not frame.finished:
+        instructions[frame.pc].execute(frame)
+        frame.pc += 1
+        steps -= 1
+    return frame.finished
+
+
+class Program():
+
+    """
+    method verified and decoded for engine
+    """
+
+    def __init__(self, method, engine='interpreter', arrays='array', verify=True):
+        check_options(engine, arrays)
+        self.method = method
+        self.engine = engine
+        self.arrays = value_containers.array_backends[arrays]()
+        self.unboxed = engine in UNBOXED_ENGINES
+        if verify:
+            verify_method(method)
+        # array accesses proven in bounds are not checked by the decoded engines
+        safe = bounds.safe_accesses(method) if engine != 'interpreter' else ()
+        # code is run without tracer, traced_code with one
+        if engine == 'blocks':
+            self.code = blocks.decode(method, safe)
+            self.traced_code = dispatch.decode(method, dispatch.unboxed_handlers, safe)
+        elif engine == 'unboxed':
+            self.code = self.traced_code = dispatch.decode(method, dispatch.unboxed_handlers, safe)
+        elif engine == 'dispatch':
+            self.code = self.traced_code = dispatch.decode(method, safe=safe)
+        else:
+            self.code = self.traced_code = None
+        self._block_table = None
+
+    @property
+    def block_table(self):
+        """
+        lengths and fuel costs of basic blocks for metered execution, computed on first use
+        """
+        if self._block_table is None:
+            self._block_table = blocks.block_table(self.method)
+        return self._block_table
+
+    def arguments(self, args):
+        """
+        local variables of a new run for arguments as produced from VM.convert_args
+        """
+        if self.unboxed:
+            return unbox_arguments(self.method, self.arrays, args)
+        return contain_arguments(self.method, self.arrays, args)
+
+    def new_frame(self, args):
+        """
+        execution context of a single run
+        """
+        return Frame(self.method, self.arguments(args))
+
+    def execute(self, frame, tracer=None, fuel=None):
+        """
+        run frame until finished
+        tracer, when given, is called as tracer(pc, ins, stack) before every instruction
+        fuel, when given, limits number of executed instructions, it is charged per basic block
+        and OutOfFuelException is raised before a block which does not fit in the rest
+        """
+        if fuel is not None:
+            self.execute_metered(frame, tracer, fuel)
+        elif self.engine == 'blocks' and tracer is None:
+            self.to_block_start(frame)
+            blocks.execute(self.code, frame)
+        elif self.engine != 'interpreter':
+            dispatch.execute(self.code if tracer is None else self.traced_code, frame, tracer)
+        else:
+            interpret(frame, tracer)
+
+    def to_block_start(self, frame, fuel=None):
+        """
+        blocks engine continues only from the start of a block, frame stopped elsewhere
+        (restored from a snapshot of another engine) is stepped instruction by instruction until it gets there
+        with fuel the rest of the block is charged before it runs, as by the other engines, returns fuel left
+        """
+        block_index = self.code.block_index
+        if fuel is not None and not frame.finished and block_index[frame.pc] < 0:
+            cost = self.block_table[1][frame.pc]
+            if cost > fuel:
+                raise dispatch.out_of_fuel(fuel, frame.pc, cost)
+            frame.fuel_used += cost
+            fuel -= cost
+        while not frame.finished and block_index[frame.pc] < 0:
+            dispatch.execute_steps(self.traced_code, frame, 1)
+        return fuel
+
+    def execute_metered(self, frame, tracer, fuel):
+        if self.engine == 'blocks' and tracer is None:
+            fuel = self.to_block_start(frame, fuel)
+            if not frame.finished:
+                blocks.execute_metered(self.code, frame, fuel)
+        elif self.engine != 'interpreter':
+            dispatch.execute_metered(self.code if tracer is None else self.traced_code, frame,
+                                     self.block_table, fuel, tracer)
+        else:
+            interpret_metered(frame, self.block_table, fuel, tracer)
+
+    def execute_steps(self, frame, steps):
+        """
+        continue running frame for at most steps instructions, basic blocks for blocks engine
+        returns True when the frame finished
+        """
+        if self.engine == 'blocks':
+            self.to_block_start(frame)
+            return blocks.execute_steps(self.code, frame, steps)
+        elif self.engine != 'interpreter':
+            return dispatch.execute_steps(self.code, frame, steps)
+        return interpret_steps(frame, steps)
+
+    def result(self, frame):
+        """
+        return value of finished frame as Value* of method return type
+        """
+        value = frame.return_value if self.unboxed else frame.return_value.value
+        return_type = self.method.return_type
+        return value_containers.box(return_type, self.arrays.export_value(return_type, value))
+
+    def run(self, *args, tracer=None, fuel=None):
+        """
+        run program in a new frame and return the result
+        """
+        frame = self.new_frame(args)
+        self.execute(frame, tracer, fuel)
+        return self.result(frame)
+
+    async def run_async(self, *args, slice=10000):
+        """
+        run program in a new frame, yields to event loop after every slice of instructions
+        (basic blocks for blocks engine), cancellation of the task stops the run between slices
+        """
+        if slice < 1:
+            raise RuntimeException('slice must be at least 1, received %s' % slice)
+        frame = self.new_frame(args)
+        while not self.execute_steps(frame, slice):
+            await asyncio.sleep(0)
+        return self.result(frame)
@@ -0,0 +1,221 @@
+# -*- coding: utf-8  -*-
+"""
+binary snapshots of a running frame
+
+a snapshot stores pc, stack, local variables and arrays of a frame, so the run
+can be continued later by the same program, possibly in another process.
+layout, all numbers little endian:
+
+    header      magic b'TSBS', version, flags, sha256 of the method, pc,
+                fuel used, number of arrays, variables and stack items
+    arrays      typecode, length and raw little endian items of every array,
+                arrays shared by several references are stored once
+    values      variables, stack and return value of finished frame,
+                each value is a tag byte followed by its payload
+
+boxed frames store the Value* class of every value in front of its tag,
+a snapshot can only be loaded by a program of the same representation
+"""
+import hashlib
+import struct
+import sys
+from array import array
+
+from .exceptions import SnapshotException
+from .frame import Frame
+from .value_containers import ValueInt, ValueFloat, ValueIntArrayRef, ValueFloatArrayRef
+
+
+MAGIC = b'TSBS'
+VERSION = 1
+
+BOXED = 1
+FINISHED = 2
+
+HEADER = struct.Struct('<4sHH32sqQIII')
+LENGTH = struct.Struct('<Q')
+
+# value tags
+NONE = 0
+INT = 1
+FLOAT = 2
+ARRAY = 3
+BIGINT = 4
+
+INT64 = struct.Struct('<q')
+FLOAT64 = struct.Struct('<d')
+INDEX = struct.Struct('<I')
+
+# Value* classes of boxed frames
+CLASSES = [ValueInt, ValueFloat, ValueIntArrayRef, ValueFloatArrayRef]
+CLASS_CODES = dict((c, i) for i, c in enumerate(CLASSES))
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def method_hash(method):
+    """
+    sha256 digest identifying method code and variables
+    """
+    parts = [str(method.function_name), str(method.argument_count), method.return_type.__class__.__name__]
+    parts.extend(v.__class__.__name__ for v in method.variables)
+    parts.extend(str(ins) for ins in method.code)
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).digest()
+
+
+class Writer():
+
+    def __init__(self, boxed):
+        self.boxed = boxed
+        self.arrays = []
+        self.array_ids = {}
+        self.values = bytearray()
+
+    def array_index(self, arr):
+        key = id(arr)
+        if key not in self.array_ids:
+            self.array_ids[key] = len(self.arrays)
+            self.arrays.append(arr)
+        return self.array_ids[key]
+
+    def value(self, v):
+        out = self.values
+        if self.boxed:
+            out.append(CLASS_CODES[v.__class__])
+            v = v.value
+        if v is None:
+            out.append(NONE)
+        elif isinstance(v, float):
+            out.append(FLOAT)
+            out += FLOAT64.pack(v)
+        elif isinstance(v, int):
+            if INT64_MIN <= v <= INT64_MAX:
+                out.append(INT)
+                out += INT64.pack(v)
+            else:
+                data = v.to_bytes((v.bit_length() + 8) // 8, 'little', signed=True)
+                out.append(BIGINT)
+                out += LENGTH.pack(len(data)) + data
+        else:
+            out.append(ARRAY)
+            out += INDEX.pack(self.array_index(v))
+
+    def array_table(self):
+        out = bytearray()
+        for arr in self.arrays:
+            if isinstance(arr, memoryview):
+                # numpy backed arrays are stored as plain arrays
+                arr = array('d' if arr.format == 'd' else 'q', arr.tobytes())
+            if sys.byteorder != 'little':
+                arr = array(arr.typecode, arr)
+                arr.byteswap()
+            out += arr.typecode.encode('ascii') + LENGTH.pack(len(arr)) + arr.tobytes()
+        return out
+
+
+def dumps(program, frame):
+    """
+    snapshot of frame running program as bytes
+    """
+    boxed = not program.unboxed
+    writer = Writer(boxed)
+    for v in frame.variables:
+        writer.value(v)
+    for v in frame.stack:
+        writer.value(v)
+    flags = BOXED if boxed else 0
+    if frame.finished:
+        flags |= FINISHED
+        writer.value(frame.return_value)
+    arrays = writer.array_table()
+    header = HEADER.pack(MAGIC, VERSION, flags, method_hash(program.method), frame.pc, frame.fuel_used,
+                         len(writer.arrays), len(frame.variables), len(frame.stack))
+    return header + bytes(arrays) + bytes(writer.values)
+
+
+class Reader():
+
+    def __init__(self, data, offset, boxed):
+        self.data = data
+        self.offset = offset
+        self.boxed = boxed
+        self.arrays = []
+
+    def unpack(self, fmt):
+        return fmt.unpack(self.take(fmt.size))[0]
+
+    def take(self, size):
+        if self.offset + size > len(self.data):
+            raise SnapshotException('snapshot is truncated')
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def array_table(self, count):
+        for _ in range(count):
+            typecode = bytes(self.take(1)).decode('ascii', 'replace')
+            if typecode not in ('q', 'd'):
+                raise SnapshotException('unknown array typecode %r' % typecode)
+            arr = array(typecode)
+            arr.frombytes(self.take(self.unpack(LENGTH) * arr.itemsize))
+            if sys.byteorder != 'little':
+                arr.byteswap()
+            self.arrays.append(arr)
+
+    def value(self):
+        cls = None
+        if self.boxed:
+            code = self.take(1)[0]
+            if code >= len(CLASSES):
+                raise SnapshotException('unknown value class %d' % code)
+            cls = CLASSES[code]
+        tag = self.take(1)[0]
+        if tag == NONE:
+            v = None
+        elif tag == INT:
+            v = self.unpack(INT64)
+        elif tag == FLOAT:
+            v = self.unpack(FLOAT64)
+        elif tag == BIGINT:
+            v = int.from_bytes(self.take(self.unpack(LENGTH)), 'little', signed=True)
+        elif tag == ARRAY:
+            index = self.unpack(INDEX)
+            if index >= len(self.arrays):
+                raise SnapshotException('array %d is not in snapshot' % index)
+            v = self.arrays[index]
+        else:
+            raise SnapshotException('unknown value tag %d' % tag)
+        return v if cls is None else cls(v)
+
+
+def loads(program, data):
+    """
+    frame of program restored from snapshot made by dumps
+    """
+    data = memoryview(data).cast('B')
+    if len(data) < HEADER.size:
+        raise SnapshotException('snapshot is truncated')
+    magic, version, flags, digest, pc, fuel_used, n_arrays, n_variables, n_stack = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotException('not a snapshot')
+    if version != VERSION:
+        raise SnapshotException('unsupported snapshot version %d, expected %d' % (version, VERSION))
+    if digest != method_hash(program.method):
+        raise SnapshotException('snapshot belongs to a different method')
+    boxed = bool(flags & BOXED)
+    if boxed == program.unboxed:
+        raise SnapshotException('snapshot of %s frame cannot be loaded by %s engine' %
+                                ('boxed' if boxed else 'unboxed', program.engine))
+    reader = Reader(data, HEADER.size, boxed)
+    reader.array_table(n_arrays)
+    frame = Frame(program.method, [reader.value() for _ in range(n_variables)])
+    frame.stack.extend(reader.value() for _ in range(n_stack))
+    frame.pc = pc
+    frame.fuel_used = fuel_used
+    if flags & FINISHED:
+        frame.finished = True
+        frame.return_value = reader.value()
+    if reader.offset != len(data):
+        raise SnapshotException('unexpected data after snapshot')
+    return frame
@@ -0,0 +1,60 @@
+# -*- coding: utf-8  -*-
+import json
+import sys
+
+from .value_containers import Value
+
+
+class Tracer():
+
+    """
+    trace sink called before every executed instruction
+    any callable accepting (pc, ins, stack) can be used as a tracer
+    """
+
+    def __call__(self, pc, ins, stack):
+        raise NotImplementedError()
+
+
+class TextTracer(Tracer):
+
+    """
+    writes one human readable line per instruction
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stderr
+
+    def __call__(self, pc, ins, stack):
+        self.stream.write("pc {!s:<7}{!s:<28}stack {}\n".format(pc, ins, stack))
+
+
+class JsonTracer(Tracer):
+
+    """
+    writes one json object per line and instruction
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stderr
+
+    def __call__(self, pc, ins, stack):
+        record = {'pc': pc, 'ins': str(ins), 'stack': [plain(v) for v in stack]}
+        self.stream.write(json.dumps(record) + '\n')
+
+
+def plain(v):
+    """
+    convert boxed or unboxed runtime value into json serializable value
+    """
+    if isinstance(v, Value):
+        v = v.value
+    if isinstance(v, (int, float)) or v is None:
+        return v
+    return [plain(i) for i in v]
+
+
+tracers = {
+    'text': TextTracer,
+    'json': JsonTracer
+}
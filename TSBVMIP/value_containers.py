@@ -1,10 +1,24 @@
 # -*- coding: utf-8  -*-
+import functools
+import math
+from array import array
 
-from .exceptions import ValueException
+from .exceptions import ArrayIndexException, ArrayValueException, ValueException
 from . import value_types
 
+try:
+    import numpy
+except ImportError:  # numpy array backend is optional
+    numpy = None
+
 
 class Value():
+
+    """
+    immutable boxed value, operations return new or interned instances
+    and never change the value of an existing one
+    """
+    __slots__ = ('value',)
     vtype = None
 
     def __init__(self, value=None):
@@ -17,12 +31,6 @@ class Value():
     def is_none(self):
         return self.value is None
 
-    def set_value(self, v):
-        self.value = v
-
-    def copy(self):
-        return self.__class__(self.value)
-
     def __str__(self):
         return "%s(%s)" % (self.__class__.__name__, self.value)
 
@@ -31,67 +39,119 @@ class Value():
 
 
 class ValueInt(Value):
+    __slots__ = ()
     vtype = value_types.INT
 
     def __add__(self, other):
-        return ValueInt(self.value + other.value)
+        return int_value(self.value + other.value)
 
     def __sub__(self, other):
-        return ValueInt(self.value - other.value)
+        return int_value(self.value - other.value)
 
     def __mul__(self, other):
-        return ValueInt(self.value * other.value)
+        return int_value(self.value * other.value)
 
     def __floordiv__(self, other):
-        return ValueInt(self.value // other.value)
+        return int_value(self.value // other.value)
 
 
 class ValueFloat(Value):
+    __slots__ = ()
     vtype = value_types.FLOAT
 
     def __add__(self, other):
-        return ValueFloat(self.value + other.value)
+        return float_value(self.value + other.value)
 
     def __sub__(self, other):
-        return ValueFloat(self.value - other.value)
+        return float_value(self.value - other.value)
 
     def __mul__(self, other):
-        return ValueFloat(self.value * other.value)
+        return float_value(self.value * other.value)
 
     def __truediv__(self, other):
-        return ValueFloat(self.value / other.value)
+        return float_value(self.value / other.value)
+
+
+SMALL_INT_MIN = -256
+SMALL_INT_MAX = 1024
+VALUE_CACHE_SIZE = 4096
+
+SMALL_INTS = [ValueInt(i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+
+# integral floats of the small int range and common fractions, zeros are kept apart
+# because 0.0 and -0.0 are equal dictionary keys
+COMMON_FLOATS = dict((v, ValueFloat(v)) for v in
+                     [float(i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1) if i] +
+                     [sign * f for f in (0.5, 0.25, 0.75, 0.1) for sign in (1, -1)])
+FLOAT_ZERO = ValueFloat(0.0)
+FLOAT_NEGATIVE_ZERO = ValueFloat(-0.0)
+
+_cached_int = functools.lru_cache(maxsize=VALUE_CACHE_SIZE)(ValueInt)
+_cached_float = functools.lru_cache(maxsize=VALUE_CACHE_SIZE)(ValueFloat)
+
+
+def int_value(value):
+    """
+    ValueInt of value, preallocated for small ints, recently used ones are cached
+    """
+    if SMALL_INT_MIN <= value <= SMALL_INT_MAX:
+        return SMALL_INTS[value - SMALL_INT_MIN]
+    return _cached_int(value)
+
+
+def float_value(value):
+    """
+    ValueFloat of value, preallocated for common floats, recently used ones are cached
+    """
+    cached = COMMON_FLOATS.get(value)
+    if cached is not None:
+        return cached
+    if value == 0.0:
+        return FLOAT_NEGATIVE_ZERO if math.copysign(1.0, value) < 0 else FLOAT_ZERO
+    return _cached_float(value)
 
 
 class ValueReference(Value):
-    pass
+    __slots__ = ()
 
 
 class ArrayObjectRef(ValueReference):
+
+    """
+    reference to array of numbers stored in compact array.array of typecode,
+    elements are boxed into element_type only when accessed through the reference
+    """
+    __slots__ = ('_size',)
     vtype = value_types.ARRAY
-    _size = 0
+    typecode = None
+    element_type = None
+    element_value = None
 
     def __init__(self, value=None):
         super().__init__(value)
-        if value is not None:
-            self._size = len(value)
+        self._size = len(value) if value is not None else 0
 
     def allocate(self, asize=None):
-        if asize < 1:
-            raise ValueException('arrayobject must have size more than 0')
+        """
+        initialize empty reference with a zeroed array, references to existing arrays never change
+        """
         if self.value is not None:
             raise ValueException('arrayobject already initialized')
+        self.value = new_raw_array(self, asize)
         self._size = asize
 
     def __getitem__(self, i):
-        return self.value[i]
+        if not 0 <= i < self._size:
+            raise index_error(i, self.value)
+        return self.element_value(self.value[i])
 
     def __setitem__(self, k, v):
-        self.value[k] = v
-
-    def set_value(self, v):
-        super().set_value(v)
-        if self.value is not None:
-            self._size = len(self.value)
+        if not 0 <= k < self._size:
+            raise index_error(k, self.value)
+        try:
+            self.value[k] = v.value
+        except (OverflowError, ValueError):
+            raise element_error(v.value)
 
     @property
     def length(self):
@@ -99,20 +159,23 @@ class ArrayObjectRef(ValueReference):
 
 
 class ValueIntArrayRef(ArrayObjectRef):
+    __slots__ = ()
     vtype = value_types.INT_ARRAY
-
-    def allocate(self, asize=None):
-        super().allocate(asize)
-        self.value = [ValueInt()] * asize
+    typecode = 'q'
+    element_type = ValueInt
+    element_value = staticmethod(int_value)
 
 
 class ValueFloatArrayRef(ArrayObjectRef):
+    __slots__ = ()
     vtype = value_types.FLOAT_ARRAY
+    typecode = 'd'
+    element_type = ValueFloat
+    element_value = staticmethod(float_value)
 
-    def allocate(self, asize=None):
-        super().allocate(asize)
-        self.value = [ValueFloat()] * asize
 
+# array types by newarray argument
+array_types = [ValueIntArrayRef, ValueFloatArrayRef]
 
 types = {
     'int': ValueInt,
@@ -122,14 +185,126 @@ types = {
 }
 
 
+# buffer formats with the same memory layout as array typecodes
+BUFFER_FORMATS = {
+    'q': ('q', '@q', 'l', '@l'),
+    'd': ('d', '@d'),
+}
+
+
+def typed_array(array_class, value, convert):
+    """
+    copy value into array.array of the array class typecode
+    buffers of the same layout are copied in one piece, other iterables element by element
+    """
+    typecode = array_class.typecode
+    try:
+        view = memoryview(value)
+    except TypeError:
+        pass
+    else:
+        if view.ndim == 1 and view.c_contiguous and view.itemsize == 8 and view.format in BUFFER_FORMATS[typecode]:
+            arr = array(typecode)
+            arr.frombytes(view.cast('B'))
+            return arr
+    try:
+        try:
+            return array(typecode, value)
+        except TypeError:
+            return array(typecode, (convert(v) for v in value))
+    except OverflowError as e:
+        raise ValueError('array element out of range: %s' % e)
+
+
 def convert_values(container_class, value):
     if container_class.vtype == value_types.INT:
         return int(value)
     elif container_class.vtype == value_types.FLOAT:
         return float(value)
     elif container_class.vtype == value_types.INT_ARRAY:
-        return [ValueInt(int(v)) for v in value]
+        return typed_array(ValueIntArrayRef, value, int)
     elif container_class.vtype == value_types.FLOAT_ARRAY:
-        return [ValueFloat(float(v)) for v in value]
+        return typed_array(ValueFloatArrayRef, value, float)
     else:
         raise ValueException('cannot convert type %s value %s' % (container_class.vtype, value))
+
+
+def index_error(index, array):
+    return ArrayIndexException('array index %d out of bounds <0, %d)' % (index, len(array)))
+
+
+def element_error(value):
+    return ArrayValueException('value %s does not fit in array element' % value)
+
+
+def new_raw_array(array_type, asize):
+    """
+    allocate array for unboxed execution
+    """
+    if asize < 1:
+        raise ValueException('arrayobject must have size more than 0')
+    return array(array_type.typecode, [0]) * asize
+
+
+def box(container_class, value):
+    """
+    wrap raw python value from unboxed execution into Value* class of the container
+    """
+    cls = container_class.__class__
+    if cls is ValueInt:
+        return int_value(value)
+    if cls is ValueFloat:
+        return float_value(value)
+    return cls(value)
+
+
+class ArrayBackend():
+
+    """
+    converts values passed into VM.run and values returned from it
+    default backend passes values as they are
+    """
+    name = 'array'
+
+    def import_value(self, container_class, value):
+        return value
+
+    def export_value(self, container_class, value):
+        return value
+
+
+class NumpyArrayBackend(ArrayBackend):
+
+    """
+    accepts numpy.ndarray for array arguments and returns arrays as ndarray views
+    int64/float64 contiguous arrays are used in place through memoryview, so raw values
+    read by the VM are python int/float and stores write directly into the caller's ndarray
+    """
+    name = 'numpy'
+    dtypes = {'q': 'int64', 'd': 'float64'}
+
+    def __init__(self):
+        if numpy is None:
+            raise ValueException('numpy array backend requires numpy to be installed')
+
+    def import_value(self, container_class, value):
+        if not isinstance(container_class, ArrayObjectRef) or not isinstance(value, numpy.ndarray):
+            return value
+        dtype = numpy.dtype(self.dtypes[container_class.typecode])
+        if value.ndim != 1:
+            raise ValueException('array argument must be one dimensional, received %d dimensions' % value.ndim)
+        if not numpy.can_cast(value.dtype, dtype, 'safe'):
+            raise ValueException('cannot pass %s array as %s' % (value.dtype, container_class.vtype))
+        # no copy for native byte order contiguous arrays of the same dtype
+        return memoryview(numpy.ascontiguousarray(value, dtype=dtype))
+
+    def export_value(self, container_class, value):
+        if not isinstance(container_class, ArrayObjectRef) or value is None:
+            return value
+        return numpy.frombuffer(value, dtype=self.dtypes[container_class.typecode])
+
+
+array_backends = {
+    'array': ArrayBackend,
+    'numpy': NumpyArrayBackend
+}
@@ -2,12 +2,15 @@
 import os
 import sys
 import argparse
+import logging as log
 
 if sys.version_info < (3, 0):
     raise Exception('need Python 3k to run')
 
+from TSBVMIP import cache
 from TSBVMIP import engine
 from TSBVMIP import value_types
+from TSBVMIP import trace
 
 
 # just to be sure, exit if not run as main
@@ -16,17 +19,21 @@ if __name__ != '__main__':
     exit()
 
 
-m = engine.VM()
-
 # load code file argument first and check if it exists
 parser = argparse.ArgumentParser()
 parser.add_argument(
     'codefile', help='File path containing code you want to run')
+parser.add_argument(
+    '--trace', choices=sorted(trace.tracers), help='print every executed instruction in given format')
+parser.add_argument(
+    '--no-cache', action='store_true', help='always parse and verify the code file, skip the disk cache')
 args, unknown = parser.parse_known_args()
 file_path = args.codefile
 if not os.path.exists(file_path):
     print('file %s does not exists' % file_path)
 
+m = engine.VM(cache=None if args.no_cache else cache.DiskCache())
+
 # load the actual code
 m.load_file_code(file_path)
 
@@ -51,4 +58,6 @@ for i, lvt in enumerate(m.args_types):
 args = parser.parse_args()
 
 # arguments parsed ok, run
-print('RETURN', m.run_cmd(args))
+log.basicConfig(format='%(levelname)s %(message)s', level=log.DEBUG)
+tracer = trace.tracers[args.trace]() if args.trace else None
+print('RETURN', m.run_cmd(args, tracer=tracer))
@@ -0,0 +1,42 @@
+# -*- coding: utf-8  -*-
+import argparse
+import logging as log
+import random
+import timeit
+
+from TSBVMIP import engine
+
+
+# benchmark programs with arguments, as passed from the command line
+PROGRAMS = [
+    ('data/sum.yaml', lambda size: [1, size]),
+    ('data/bubblesort.yaml', lambda size: [[random.randint(-size, size) for _ in range(size // 50)]]),
+]
+
+MEASURED = engine.ENGINES + ('compiled',)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--size', type=int, default=2000, help='problem size')
+parser.add_argument('--repeat', type=int, default=3, help='best of number of runs')
+parser.add_argument('--engine', action='append', choices=MEASURED,
+                    help='engine to measure, can be repeated, default all')
+parser.add_argument('--superinstructions', action='store_true', help='fuse instruction sequences after loading')
+parser.add_argument('--optimize', action='store_true', help='run optimizer after loading')
+args = parser.parse_args()
+
+log.disable(log.CRITICAL)
+random.seed(args.size)
+
+for fname, make_args in PROGRAMS:
+    pargs = make_args(args.size)
+    for name in args.engine or MEASURED:
+        if name == 'compiled':
+            vm = engine.VM(superinstructions=args.superinstructions, optimize=args.optimize)
+            vm.load_file_code(fname)
+            run = vm.compile()
+        else:
+            vm = engine.VM(engine=name, superinstructions=args.superinstructions, optimize=args.optimize)
+            vm.load_file_code(fname)
+            run = vm.run
+        seconds = min(timeit.repeat(lambda: run(*vm.convert_args(pargs)), number=1, repeat=args.repeat))
+        print('{!s:<25}{!s:<15}{:.4f}s'.format(fname, name, seconds))
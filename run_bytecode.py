@@ -0,0 +1,25 @@
+# -*- coding: utf-8  -*-
+"""
+compile code file into .tsbc bytecode and compare the time of loading both
+"""
+import argparse
+import os
+import timeit
+
+from TSBVMIP import bytecode, code_parser
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('codefile', help='YAML code file to compile')
+parser.add_argument('output', nargs='?', help='bytecode file, default codefile with .tsbc suffix')
+parser.add_argument('--repeat', type=int, default=3, help='best of number of loads')
+args = parser.parse_args()
+
+output = args.output or os.path.splitext(args.codefile)[0] + code_parser.BYTECODE_SUFFIX
+method = code_parser.parse_file(args.codefile)
+bytecode.dump(method, output)
+print('{} instructions written to {}, {} bytes'.format(len(method.code), output, os.path.getsize(output)))
+
+for fname in (args.codefile, output):
+    seconds = min(timeit.repeat(lambda: code_parser.parse_file(fname), number=1, repeat=args.repeat))
+    print('{!s:<40}{:.4f}s'.format(fname, seconds))
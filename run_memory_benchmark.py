@@ -0,0 +1,132 @@
+# -*- coding: utf-8  -*-
+"""
+memory taken by runtime and analysis objects
+
+every measured object is compared with a plain object keeping the same
+attributes in per-instance __dict__, the layout all of them had before
+__slots__, then a generated program is loaded and verified, and loaded from a file
+through the YAML document tree and by the streaming parser
+"""
+import argparse
+import os
+import tempfile
+import timeit
+import tracemalloc
+
+import yaml
+
+from TSBVMIP import code_parser
+from TSBVMIP.analysis.controlflow import BasicBlock
+from TSBVMIP.analysis.frame import Frame as AnalysisFrame
+from TSBVMIP.analysis.interpreter import BasicVerifier
+from TSBVMIP.analysis.values import BasicValue
+from TSBVMIP.analysis.verifier import Verifier
+from TSBVMIP.frame import Frame
+from TSBVMIP.instructions import InsIAdd, InsIPush
+from TSBVMIP.method import Method
+from TSBVMIP.value_containers import ValueInt, ValueIntArrayRef
+
+
+class Plain():
+
+    def __init__(self, **attributes):
+        for name, value in attributes.items():
+            setattr(self, name, value)
+
+
+METHOD = Method()
+
+# label, factory of the slotted object, factory of plain object with the same content
+MEASURED = [
+    ('ValueInt', lambda: ValueInt(1), lambda: Plain(value=1)),
+    ('ValueIntArrayRef', lambda: ValueIntArrayRef(None), lambda: Plain(value=None, _size=0)),
+    ('InsIPush', lambda: InsIPush(ValueInt(1)), lambda: Plain(argument=ValueInt(1))),
+    ('InsIAdd', lambda: InsIAdd(), lambda: Plain()),
+    ('BasicValue', lambda: BasicValue(None), lambda: Plain(type=None)),
+    ('BasicBlock', lambda: BasicBlock(), lambda: Plain(instruction_indexes=[], sucessors=[], predecessors=[])),
+    ('analysis Frame', lambda: AnalysisFrame(), lambda: Plain(locals=[], local_types=[], stack=[], return_value=None)),
+    ('Frame', lambda: Frame(METHOD, None), lambda: Plain(method=METHOD, instructions=METHOD.code, variables=None,
+                                                        stack=[], pc=0, finished=False, return_value=None,
+                                                        fuel_used=0)),
+    ('Method', lambda: Method(), lambda: Plain(code=[], variables=[], argument_count=0, return_type=None,
+                                               function_name=None, labels={})),
+]
+
+
+def allocated(factory, count):
+    """
+    bytes allocated by count objects made by factory
+    """
+    tracemalloc.start()
+    keep = [factory() for _ in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+    return size
+
+
+def instance_sizes(count):
+    print('{:<20}{:>12}{:>12}'.format('bytes per object', '__slots__', '__dict__'))
+    for label, slotted, plain in MEASURED:
+        print('{:<20}{:>12.1f}{:>12.1f}'.format(label, allocated(slotted, count) / count,
+                                                allocated(plain, count) / count))
+
+
+def generated_program(size):
+    ins = []
+    for i in range(size // 4):
+        ins.extend([{'iload': 'a'}, {'ipush': i}, 'iadd', {'istore': 'a'}])
+    ins.extend([{'iload': 'a'}, 'ireturn'])
+    return {'func': {'name': 'generated', 'type': 'int', 'args': [{'label': 'a', 'type': 'int'}]}, 'ins': ins}
+
+
+def program_memory(size):
+    data = generated_program(size)
+    tracemalloc.start()
+    method = code_parser.process_yaml(data)
+    loaded = tracemalloc.get_traced_memory()[0]
+    verifier = Verifier(BasicVerifier())
+    verifier.verify(method)
+    verified, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('program of {} instructions'.format(len(method.code)))
+    print('{:<20}{:>12.1f} MB'.format('loaded', loaded / 2 ** 20))
+    print('{:<20}{:>12.1f} MB'.format('verified', verified / 2 ** 20))
+    print('{:<20}{:>12.1f} MB'.format('peak', peak / 2 ** 20))
+
+
+def stream_memory(size):
+    fd, fname = tempfile.mkstemp(suffix='.yaml')
+    with os.fdopen(fd, 'w') as f:
+        yaml.safe_dump(generated_program(size), f)
+    print('{:<20}{:>12}{:>12}'.format('loading file', 'result', 'peak'))
+    try:
+        for label, load in [('YAML tree', lambda f: code_parser.process_yaml(yaml.load(f, Loader=code_parser.YAML_LOADER))),
+                            ('stream', code_parser.parse_stream)]:
+            with open(fname) as f:
+                tracemalloc.start()
+                method = load(f)
+                size, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            del method
+            print('{:<20}{:>9.1f} MB{:>9.1f} MB'.format(label, size / 2 ** 20, peak / 2 ** 20))
+    finally:
+        os.remove(fname)
+
+
+def attribute_access():
+    slotted = ValueInt(1)
+    plain = Plain(value=1)
+    print('{:<20}{:>12.4f}s{:>11.4f}s'.format('attribute read', timeit.timeit(lambda: slotted.value, number=10 ** 6),
+                                             timeit.timeit(lambda: plain.value, number=10 ** 6)))
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--size', type=int, default=100000, help='number of instructions of generated program')
+parser.add_argument('--count', type=int, default=100000, help='number of objects per class')
+args = parser.parse_args()
+
+instance_sizes(args.count)
+attribute_access()
+program_memory(args.size)
+stream_memory(args.size)
@@ -1,15 +1,19 @@
 from setuptools import setup
 from codecs import open  # To use a consistent encoding
 from os import path
+import re
 
 here = path.abspath(path.dirname(__file__))
 
 with open(path.join(here, 'README.md'), encoding='utf-8') as f:
     long_description = f.read()
 
+with open(path.join(here, 'TSBVMIP', '__init__.py'), encoding='utf-8') as f:
+    version = re.search(r"__version__ = '([^']+)'", f.read()).group(1)
+
 setup(
     name='TSBVMIP',
-    version='0.0.1',
+    version=version,
     description='tiny Stackbased-Virtual-Machine-in-Python',
     long_description=long_description,
     url='https://github.com/lukleh/Tiny-Stackbased-Virtual-Machine-in-Python',
@@ -25,6 +29,7 @@ setup(
     ],
     tests_require=['pytest'],
     install_requires=['pyyaml'],
+    extras_require={'numpy': ['numpy']},
     keywords='virtual machine stack',
     packages=['TSBVMIP'],
 )
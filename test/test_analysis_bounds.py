@@ -0,0 +1,137 @@
+# -*- coding: utf-8  -*-
+import pytest
+
+from TSBVMIP import blocks, compiler, dispatch, fusion, opcodes
+from TSBVMIP.analysis import bounds
+from TSBVMIP.code_parser import parse_file, parse_string
+from TSBVMIP.engine import VM, ENGINES
+from TSBVMIP.exceptions import ArrayIndexException
+
+
+HEADER = """
+func:
+    name: f
+    args:
+        - label: a
+          type: intarray
+        - label: n
+          type: int
+    type: int
+lvars:
+    - label: i
+      type: int
+    - label: s
+      type: int
+ins:
+"""
+
+SUM_ARRAY = ['ipush: 0', 'istore: i', 'ipush: 0', 'istore: s',
+             'label: loop', 'iload: i', 'aload: a', 'arraylength', 'if_icmpge: end',
+             'iload: s', 'aload: a', 'iload: i', 'iaload', 'iadd', 'istore: s',
+             'aload: a', 'iload: i', 'iload: s', 'iastore',
+             'iload: i', 'ipush: 1', 'iadd', 'istore: i', 'goto: loop',
+             'label: end', 'iload: s', 'ireturn']
+
+# reads a[n] without any check of n
+LOAD_ARGUMENT = ['aload: a', 'iload: n', 'iaload', 'ireturn']
+
+
+def source(ins):
+    return HEADER + ''.join('    - %s\n' % i for i in ins)
+
+
+def accesses(m):
+    return set(pc for pc, ins in enumerate(m.code) if ins.opcode in bounds.ACCESSES)
+
+
+def test_loop_accesses_are_safe():
+    m = parse_string(source(SUM_ARRAY))
+    assert bounds.safe_accesses(m) == accesses(m)
+    assert len(accesses(m)) == 2
+
+
+def test_fused_loop_accesses_are_safe():
+    m = fusion.fuse(parse_string(source(SUM_ARRAY)))
+    assert opcodes.IALOAD_LOCALS in [ins.opcode for ins in m.code]
+    assert bounds.safe_accesses(m) == accesses(m)
+
+
+# loop guards fused into iload; iload; if_icmp and iload; if_icmp
+LOCALS_GUARD = ['aload: a', 'arraylength', 'istore: s', 'ipush: 0', 'istore: i',
+                'label: loop', 'iload: i', 'iload: s', 'if_icmpge: end',
+                'aload: a', 'iload: i', 'ipush: 7', 'iastore',
+                'iload: i', 'ipush: 1', 'iadd', 'istore: i', 'goto: loop',
+                'label: end', 'ipush: 0', 'ireturn']
+LOAD_GUARD = ['ipush: 0', 'istore: i',
+              'label: loop', 'aload: a', 'arraylength', 'iload: i', 'if_icmple: end',
+              'aload: a', 'iload: i', 'iaload', 'pop',
+              'iload: i', 'ipush: 1', 'iadd', 'istore: i', 'goto: loop',
+              'label: end', 'ipush: 0', 'ireturn']
+
+
+@pytest.mark.parametrize('ins, opcode', [(LOCALS_GUARD, opcodes.IF_ICMP_LOCALS), (LOAD_GUARD, opcodes.IF_ICMP_LOAD)],
+                         ids=['locals', 'load'])
+def test_fused_guard_accesses_are_safe(ins, opcode):
+    m = parse_string(source(ins))
+    assert bounds.safe_accesses(m) == accesses(m)
+    assert len(accesses(m)) == 1
+    fused = fusion.fuse(parse_string(source(ins)))
+    assert opcode in [i.opcode for i in fused.code]
+    assert bounds.safe_accesses(fused) == accesses(fused)
+    assert len(accesses(fused)) == 1
+
+
+def test_unproven_accesses():
+    assert bounds.safe_accesses(parse_string(source(LOAD_ARGUMENT))) == frozenset()
+    # bubblesort reads past the end of an empty array
+    assert bounds.safe_accesses(parse_file('data/bubblesort.yaml')) == frozenset()
+    assert bounds.safe_accesses(parse_file('data/sum.yaml')) == frozenset()
+
+
+def test_decode_skips_checks():
+    m = parse_string(source(SUM_ARRAY))
+    safe = bounds.safe_accesses(m)
+    for table in (dispatch.handlers, dispatch.unboxed_handlers):
+        code = dispatch.decode(m, table, safe)
+        assert all('unchecked' in code[pc].__qualname__ for pc in safe)
+        code = dispatch.decode(m, table)
+        assert not any('unchecked' in code[pc].__qualname__ for pc in safe)
+    assert 'index_error' not in blocks.decode(m, safe).source
+    assert 'index_error' in blocks.decode(m).source
+    assert 'index_error' not in compiler.generate_source(m)
+    assert 'index_error' in compiler.generate_source(parse_string(source(LOAD_ARGUMENT)))
+
+
+@pytest.mark.parametrize('superinstructions', [False, True])
+def test_unchecked_results(superinstructions):
+    for name in ENGINES:
+        vm = VM(engine=name, superinstructions=superinstructions)
+        vm.load_string_code(source(SUM_ARRAY))
+        assert vm.run(*vm.convert_args([[1, 2, 3, 4], 0])).value == 10
+        assert vm.compile()(*vm.convert_args([[1, 2, 3, 4], 0])).value == 10
+
+
+@pytest.mark.parametrize('index', [-1, 4, 100])
+def test_out_of_bounds(index):
+    for name in ENGINES:
+        vm = VM(engine=name)
+        vm.load_string_code(source(LOAD_ARGUMENT))
+        args = vm.convert_args([[1, 2, 3, 4], index])
+        pytest.raises(ArrayIndexException, vm.run, *args)
+        pytest.raises(ArrayIndexException, vm.compile(), *args)
+
+
+def test_store_out_of_bounds():
+    for name in ENGINES:
+        vm = VM(engine=name)
+        vm.load_string_code(source(['aload: a', 'iload: n', 'ipush: 7', 'iastore', 'ipush: 0', 'ireturn']))
+        args = vm.convert_args([[1, 2], -1])
+        pytest.raises(ArrayIndexException, vm.run, *args)
+        pytest.raises(ArrayIndexException, vm.compile(), *args)
+
+
+def test_bubblesort_empty_array():
+    for name in ENGINES:
+        vm = VM(engine=name, superinstructions=True)
+        vm.load_file_code('data/bubblesort.yaml')
+        pytest.raises(ArrayIndexException, vm.run, *vm.convert_args([[]]))
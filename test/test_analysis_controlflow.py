@@ -118,3 +118,14 @@ def test_basic_block_onejumpforward():
     assert anz.basic_blocks == [BasicBlock(instruction_indexes=[0], sucessors=[None]),
                                 BasicBlock(instruction_indexes=[1, 2], sucessors=[None]),
                                 BasicBlock(instruction_indexes=[3, 4], predecessors=[None, None])]
+
+
+def test_basic_block_jump_target_ends_block():
+    m = Method()
+    anz = controlflow.ControlFlowAnalyzer()
+    m.code.append(instructions.InsNop())
+    m.code.append(instructions.InsGoto(value_containers.ValueInt(1)))
+    m.code.append(instructions.InsNop())
+    m.code.append(instructions.InsIReturn())
+    anz.analyze(m)
+    assert [bb.instruction_indexes for bb in anz.basic_blocks] == [[0], [1], [2, 3]]
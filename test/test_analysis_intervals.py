@@ -0,0 +1,168 @@
+# -*- coding: utf-8  -*-
+import pytest
+
+from TSBVMIP import fusion
+from TSBVMIP.analysis import intervals
+from TSBVMIP.analysis.frame import Frame
+from TSBVMIP.code_parser import parse_file, parse_string
+from TSBVMIP.exceptions import VerifyException
+
+
+HEADER = """
+func:
+    name: f
+    args:
+        - label: a
+          type: intarray
+        - label: n
+          type: int
+    type: int
+lvars:
+    - label: i
+      type: int
+    - label: s
+      type: int
+ins:
+"""
+
+SUM_ARRAY = ['ipush: 0', 'istore: i', 'ipush: 0', 'istore: s',
+             'label: loop', 'iload: i', 'aload: a', 'arraylength', 'if_icmpge: end',
+             'iload: s', 'aload: a', 'iload: i', 'iaload', 'iadd', 'istore: s',
+             'iload: i', 'ipush: 1', 'iadd', 'istore: i', 'goto: loop',
+             'label: end', 'iload: s', 'ireturn']
+
+
+def method(ins):
+    return parse_string(HEADER + ''.join('    - %s\n' % i for i in ins))
+
+
+def at(m, frames, opcode_name, n=0):
+    """
+    frame before n-th instruction of the name
+    """
+    indexes = [i for i, ins in enumerate(m.code) if ins.__class__.__name__ == opcode_name]
+    return frames[indexes[n]]
+
+
+def in_bounds(array, index):
+    bound = index.bound(array.key) if array.key is not None else None
+    return index.lo is not None and index.lo >= 0 and \
+        ((bound is not None and bound <= -1) or (index.hi is not None and index.hi < array.lo))
+
+
+def test_constants():
+    m = method(['ipush: 3', 'ipush: 4', 'imul', 'ipush: 5', 'isub', 'ipush: 2', 'idiv', 'ireturn'])
+    frames = intervals.analyze(m)
+    result = frames[-1].stack[-1]
+    assert (result.lo, result.hi) == (3, 3)
+    assert intervals.fits_int64(result)
+
+
+def test_division():
+    m = method(['iload: n', 'ipush: 10', 'if_icmpgt: end', 'iload: n', 'ipush: -10', 'if_icmplt: end',
+                'ipush: 100', 'iload: n', 'idiv', 'ireturn', 'label: end', 'ipush: 0', 'ireturn'])
+    frames = intervals.analyze(m)
+    n = frames[8].stack[-1]
+    assert (n.lo, n.hi) == (-10, 10)
+    quotient = frames[9].stack[-1]
+    assert (quotient.lo, quotient.hi) == (-100, 100)
+
+
+def test_arguments_are_unbounded():
+    m = method(['iload: n', 'ipush: 1', 'iadd', 'ireturn'])
+    value = intervals.analyze(m)[-1].stack[-1]
+    assert value.lo is None and value.hi is None
+    assert not intervals.fits_int64(value)
+
+
+def test_loop_in_bounds():
+    m = method(SUM_ARRAY)
+    frames = intervals.analyze(m)
+    frame = at(m, frames, 'InsIALoad')
+    array, index = frame.stack[-2:]
+    assert in_bounds(array, index)
+    # loop counter is widened but stays below array length
+    counter = frames[m.labels['loop']].locals[2]
+    assert counter.lo == 0 and counter.hi is None
+    assert counter.bound(array.key) == 0
+
+
+def test_widening_terminates():
+    m = method(['ipush: 0', 'istore: i', 'label: loop', 'iload: i', 'ipush: 3', 'iadd', 'istore: i',
+                'iload: i', 'iload: n', 'if_icmpne: loop', 'iload: i', 'ireturn'])
+    frames = intervals.analyze(m)
+    counter = frames[m.labels['loop']].locals[2]
+    assert (counter.lo, counter.hi) == (0, None)
+
+
+def test_new_array():
+    m = method(['ipush: 10', 'newarray: 0', 'astore: a', 'ipush: 0', 'istore: i',
+                'label: loop', 'iload: i', 'ipush: 10', 'if_icmpge: end',
+                'aload: a', 'iload: i', 'iload: i', 'iastore',
+                'iload: i', 'ipush: 1', 'iadd', 'istore: i', 'goto: loop',
+                'label: end', 'aload: a', 'iload: i', 'ipush: 1', 'isub', 'iaload', 'ireturn'])
+    frames = intervals.analyze(m)
+    frame = at(m, frames, 'InsIAStore')
+    array, index = frame.stack[-3:-1]
+    assert (array.lo, array.hi) == (10, 10)
+    assert (index.lo, index.hi) == (0, 9)
+    assert in_bounds(array, index)
+    # widened counter is not narrowed after the loop
+    frame = at(m, frames, 'InsIALoad')
+    assert (frame.stack[-1].lo, frame.stack[-1].hi) == (9, None)
+
+
+def test_path_never_taken():
+    m = method(['ipush: 1', 'ipush: 2', 'if_icmpeq: dead', 'ipush: 0', 'ireturn',
+                'label: dead', 'ipush: 1', 'ireturn'])
+    frames = intervals.analyze(m)
+    assert frames[m.labels['dead']] is None
+    assert frames[3] is not None
+
+
+def test_bubblesort_empty_array():
+    # bubblesort reads past the end of empty arrays, accesses cannot be proven in bounds
+    m = parse_file('data/bubblesort.yaml')
+    frames = intervals.analyze(m)
+    frame = at(m, frames, 'InsIALoad')
+    assert not in_bounds(*frame.stack[-2:])
+    index = frames[m.labels['endloop']].locals[1]
+    assert index.length_of == frames[0].locals[0].key
+
+
+def test_fused_code():
+    m = fusion.fuse(method(SUM_ARRAY))
+    frames = intervals.analyze(m)
+    assert all(f is not None for f in frames)
+
+
+def test_types_verified():
+    pytest.raises(VerifyException, intervals.analyze, method(['fpush: 1.0', 'ireturn']))
+
+
+def test_refine():
+    interpreter = intervals.IntervalInterpreter()
+    array = interpreter.new_value(intervals.value_types.INT_ARRAY)
+    length = interpreter.unary_operation(parse_string(HEADER + '    - arraylength\n').code[0], array)
+    i = intervals.new_int(0, 5)
+    below, _ = intervals.refine(i, length, 'lt')
+    assert below.bound(array.key) == -1
+    assert intervals.refine(intervals.new_int(3, 3), intervals.new_int(3, 3), 'ne') is None
+    equal, same = intervals.refine(i, intervals.new_int(2, 9), 'eq')
+    assert equal is same and (equal.lo, equal.hi) == (2, 5)
+    assert intervals.refine(intervals.new_int(4, 4), intervals.new_int(0, 2), 'le') is None
+
+
+def test_merge_keeps_sharing_only_in_both_frames():
+    interpreter = intervals.IntervalInterpreter()
+    shared = intervals.new_int(0, 1)
+    frame1 = Frame()
+    frame1.add_local(shared)
+    frame1.add_local(shared)
+    frame2 = Frame()
+    frame2.add_local(intervals.new_int(0, 1))
+    frame2.add_local(intervals.new_int(1, 1))
+    # same intervals, but locals are not known to be equal anymore
+    assert frame1.merge(frame2, interpreter) is True
+    assert frame1.locals[0] is not frame1.locals[1]
+    assert frame1.merge(frame2, interpreter) is False
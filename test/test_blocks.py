@@ -0,0 +1,49 @@
+# -*- coding: utf-8  -*-
+import fixtures
+
+from TSBVMIP import blocks
+from TSBVMIP.engine import VM
+from TSBVMIP.code_parser import parse_string
+from TSBVMIP.frame import Frame
+from TSBVMIP.value_containers import ValueInt, ValueIntArrayRef, convert_values
+
+
+def run_engine(engine, fname, args):
+    m = VM(engine=engine)
+    m.load_file_code(fname)
+    return m.run(*m.convert_args(args))
+
+
+def test_data_sum():
+    for args in [[1, 5], [3, 3], [-4, 10]]:
+        assert run_engine('blocks', 'data/sum.yaml', args) == run_engine('interpreter', 'data/sum.yaml', args)
+
+
+def test_data_bubblesort():
+    for data in [[5, 5, 1, -8, 2], [1], [3, 2, 1]]:
+        expected = run_engine('interpreter', 'data/bubblesort.yaml', [data])
+        assert run_engine('blocks', 'data/bubblesort.yaml', [data]) == expected
+    ret = run_engine('blocks', 'data/bubblesort.yaml', [[5, 5, 1, -8, 2]])
+    assert ret == ValueIntArrayRef(convert_values(ValueIntArrayRef, [-8, 1, 2, 5, 5]))
+
+
+def test_decode():
+    m = parse_string(fixtures.load('sum.code'))
+    code = blocks.decode(m)
+    assert len(code) == 4
+    assert code.sizes == [4, 6, 6, 2]
+    assert code.block_index[0] == 0
+    assert code.block_index[10] == 2
+    assert code.source.startswith('def block0(stack, variables):')
+    frame = Frame(m, [2, 4, None, None])
+    blocks.execute(code, frame)
+    assert frame.finished is True
+    assert frame.return_value == 9
+
+
+def test_tracer_falls_back_to_instructions():
+    steps = []
+    vm = VM(engine='blocks')
+    vm.load_file_code('data/sum.yaml')
+    assert vm.run(1, 2, tracer=lambda pc, ins, stack: steps.append(pc)) == ValueInt(3)
+    assert steps[:3] == [0, 1, 2]
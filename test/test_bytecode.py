@@ -0,0 +1,99 @@
+# -*- coding: utf-8  -*-
+import math
+import struct
+
+import pytest
+
+import fixtures
+from TSBVMIP import bytecode, fusion, opcodes, snapshot
+from TSBVMIP.code_parser import parse_file, parse_string
+from TSBVMIP.engine import VM, ENGINES
+from TSBVMIP.exceptions import BytecodeException
+from TSBVMIP.value_containers import ValueInt
+
+
+FILES = ['data/sum.yaml', 'data/sum_v2.yaml', 'data/bubblesort.yaml']
+
+PUSHES = """
+func:
+    name: pushes
+    args: []
+    type: float
+ins:
+    - ipush: 123456789012345678901234567890
+    - pop
+    - ipush: -9223372036854775808
+    - pop
+    - fpush: -0.0
+    - fpush: 0.0
+    - fadd
+    - fpush: 1.5
+    - fadd
+    - freturn
+"""
+
+
+@pytest.mark.parametrize('fname', FILES)
+def test_round_trip(fname):
+    method = parse_file(fname)
+    loaded = bytecode.loads(bytecode.dumps(method))
+    assert loaded.code == method.code
+    assert loaded.labels == method.labels
+    assert list(loaded.labels) == list(method.labels)
+    assert [v.__class__ for v in loaded.variables] == [v.__class__ for v in method.variables]
+    assert loaded.argument_count == method.argument_count
+    assert loaded.return_type.__class__ is method.return_type.__class__
+    assert loaded.function_name == method.function_name
+    # snapshots of the original method can be resumed by the loaded one
+    assert snapshot.method_hash(loaded) == snapshot.method_hash(method)
+
+
+def test_constants():
+    method = parse_string(PUSHES)
+    loaded = bytecode.loads(bytecode.dumps(method))
+    assert [ins.argument.value for ins in loaded.code if hasattr(ins, 'argument')] == \
+        [123456789012345678901234567890, -9223372036854775808, -0.0, 0.0, 1.5]
+    assert math.copysign(1, loaded.code[4].argument.value) == -1
+
+
+def test_load_file(tmpdir):
+    fname = str(tmpdir.join('sum.tsbc'))
+    bytecode.dump(parse_file('data/sum.yaml'), fname)
+    for name in ENGINES:
+        vm = VM(engine=name, superinstructions=True)
+        vm.load_file_code(fname)
+        assert vm.run(1, 10) == ValueInt(55)
+
+
+def test_shared_instructions():
+    code = bytecode.Bytecode(bytecode.dumps(parse_string(fixtures.load('sum.code'))))
+    assert code.decoded == {}
+    method = code.method()
+    assert len(method.code) == 18
+    # equal records are decoded once and share one object
+    assert method.code[0] is method.code[2]
+    assert method.code[6] is method.code[13]
+    assert len(code.decoded) == len(set(map(id, method.code)))
+
+
+def test_fused_code():
+    method = fusion.fuse(parse_file('data/bubblesort.yaml'))
+    pytest.raises(BytecodeException, bytecode.dumps, method)
+
+
+def test_bad_data(tmpdir):
+    data = bytecode.dumps(parse_file('data/sum.yaml'))
+    pytest.raises(BytecodeException, bytecode.loads, b'')
+    pytest.raises(BytecodeException, bytecode.loads, b'TSBS' + data[4:])
+    pytest.raises(BytecodeException, bytecode.loads, data[:-1])
+    pytest.raises(BytecodeException, bytecode.loads, data + b'\0')
+    pytest.raises(BytecodeException, bytecode.loads, data[:4] + struct.pack('<H', 2) + data[6:])
+    # unknown opcode in the last record
+    pytest.raises(BytecodeException, bytecode.loads, data[:-5] + bytecode.CODE.pack(200, 0))
+    # operands out of range of variables, code and array types
+    length = len(parse_file('data/sum.yaml').code)
+    for opcode, operand in ((opcodes.ILOAD, 99), (opcodes.GOTO, length), (opcodes.NEWARRAY, 7)):
+        pytest.raises(BytecodeException, bytecode.loads, data[:-5] + bytecode.CODE.pack(opcode, operand))
+    empty = tmpdir.join('empty.tsbc')
+    empty.write('')
+    pytest.raises(BytecodeException, bytecode.load, str(empty))
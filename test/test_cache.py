@@ -0,0 +1,188 @@
+# -*- coding: utf-8  -*-
+import os
+import time
+
+import pytest
+
+from TSBVMIP import bytecode, cache, engine, opcodes
+from TSBVMIP.analysis.verifier import Verifier
+from TSBVMIP.engine import VM
+from TSBVMIP.exceptions import RuntimeException, VerifyException
+from TSBVMIP.value_containers import ValueInt
+
+
+def source(fname='data/sum.yaml'):
+    with open(fname, 'rb') as f:
+        return f.read()
+
+
+def no_parsing(*args):
+    raise AssertionError('cached code is parsed again')
+
+
+def test_hit(tmpdir, monkeypatch):
+    disk = cache.DiskCache(str(tmpdir))
+    vm = VM(cache=disk)
+    vm.load_file_code('data/sum.yaml')
+    assert vm.run(1, 5) == ValueInt(15)
+    assert [os.path.basename(e[2]) for e in disk.entries()] == [disk.key(source()) + '.tsbc']
+    # worker restarted, entry is reused
+    monkeypatch.setattr(engine, 'parse_string', no_parsing)
+    vm = VM(engine='blocks', cache=cache.DiskCache(str(tmpdir)), superinstructions=True)
+    vm.load_file_code('data/sum.yaml')
+    assert vm.run(1, 5) == ValueInt(15)
+    vm.load_string_code(source())
+    assert vm.run(1, 5) == ValueInt(15)
+    # entries of other options are separate
+    vm = VM(cache=cache.DiskCache(str(tmpdir)), optimize=True)
+    pytest.raises(AssertionError, vm.load_file_code, 'data/sum.yaml')
+
+
+def test_key(monkeypatch):
+    key = cache.DiskCache.key(source())
+    assert key == cache.DiskCache.key(source().decode('utf-8'))
+    assert key != cache.DiskCache.key(source() + b'\n')
+    assert key != cache.DiskCache.key(source(), optimize=True)
+    monkeypatch.setattr(cache, '__version__', '99')
+    assert key != cache.DiskCache.key(source())
+
+
+def test_optimized_entry(tmpdir):
+    for _ in range(2):
+        vm = VM(cache=cache.DiskCache(str(tmpdir)), optimize=True)
+        vm.load_file_code('data/bubblesort.yaml')
+        assert list(vm.run(*vm.convert_args([[3, 1, 2]])).value) == [1, 2, 3]
+
+
+def test_corrupt_entry(tmpdir):
+    disk = cache.DiskCache(str(tmpdir))
+    key = disk.key(source())
+    with open(disk.path(key), 'wb') as f:
+        f.write(b'TSBC garbage')
+    vm = VM(cache=disk)
+    vm.load_file_code('data/sum.yaml')
+    assert vm.run(1, 5) == ValueInt(15)
+    assert disk.get(key).verified
+
+
+@pytest.mark.parametrize('record', [(opcodes.ILOAD, 99), (opcodes.NEWARRAY, 7)])
+def test_out_of_range_entry(tmpdir, record):
+    disk = cache.DiskCache(str(tmpdir))
+    key = disk.key(source())
+    data = bytecode.dumps(engine.parse_file('data/sum.yaml'))
+    with open(disk.path(key), 'wb') as f:
+        f.write(data[:-5] + bytecode.CODE.pack(*record))
+    assert disk.get(key) is None
+    assert disk.entries() == []
+
+
+@pytest.mark.parametrize('error', [RuntimeException, IndexError])
+def test_failing_entry(tmpdir, monkeypatch, error):
+    disk = cache.DiskCache(str(tmpdir))
+    key = disk.key(source())
+    bytecode.dump(engine.parse_file('data/sum.yaml'), disk.path(key))
+
+    def failing_load(fname):
+        raise error('broken entry')
+    monkeypatch.setattr(bytecode, 'load', failing_load)
+    assert disk.get(key) is None
+    assert disk.entries() == []
+
+
+def test_planted_entry(tmpdir):
+    disk = cache.DiskCache(str(tmpdir))
+    key = disk.key(source())
+    bytecode.dump(engine.parse_file('test/fixtures/bubblesort_verify_bad_stack_height.yaml'), disk.path(key))
+    # entries are verified when loaded, invalid code is dropped and parsed again from the source
+    assert disk.get(key) is None
+    bytecode.dump(engine.parse_file('test/fixtures/bubblesort_verify_bad_stack_height.yaml'), disk.path(key))
+    vm = VM(cache=disk)
+    vm.load_file_code('data/sum.yaml')
+    assert vm.run(1, 5) == ValueInt(15)
+    assert disk.get(key).function_name == vm.method.function_name
+
+
+def test_invalid_code_not_stored(tmpdir):
+    disk = cache.DiskCache(str(tmpdir))
+    vm = VM(cache=disk)
+    pytest.raises(VerifyException, vm.load_file_code, 'test/fixtures/bubblesort_verify_bad_stack_height.yaml')
+    assert disk.entries() == []
+
+
+def test_bytecode_files_skip_cache(tmpdir):
+    disk = cache.DiskCache(str(tmpdir.mkdir('cache')))
+    fname = str(tmpdir.join('sum.tsbc'))
+    bytecode.dump(engine.parse_file('data/sum.yaml'), fname)
+    vm = VM(cache=disk)
+    vm.load_file_code(fname)
+    assert vm.run(1, 5) == ValueInt(15)
+    assert disk.entries() == []
+
+
+def test_evict(tmpdir):
+    disk = cache.DiskCache(str(tmpdir), max_age=3600)
+    method = engine.parse_file('data/sum.yaml')
+    now = time.time()
+    for i, age in enumerate([7200, 30, 20, 10]):
+        disk.put(str(i), method)
+        os.utime(disk.path(str(i)), (now - age, now - age))
+    size = os.path.getsize(disk.path('1'))
+    stale = os.path.join(str(tmpdir), 'unfinished.tmp')
+    with open(stale, 'wb'):
+        pass
+    os.utime(stale, (now - 7200, now - 7200))
+    disk.max_bytes = 2 * size
+    disk.evict()
+    # too old, then least recently used
+    assert sorted(os.path.basename(e[2]) for e in disk.entries()) == ['2.tsbc', '3.tsbc']
+    # reading an entry makes it the most recently used
+    assert disk.get('2') is not None
+    disk.max_bytes = size
+    disk.evict()
+    assert [os.path.basename(e[2]) for e in disk.entries()] == ['2.tsbc']
+
+
+def test_memory_cache(monkeypatch):
+    programs = cache.ProgramCache(maxsize=2)
+    vm = VM(engine='blocks', memory_cache=programs)
+    vm.load_file_code('data/sum.yaml')
+    assert vm.run(1, 5) == ValueInt(15)
+    assert (programs.hits, programs.misses, programs.evictions) == (0, 1, 0)
+    # next request neither parses nor verifies nor decodes
+    monkeypatch.setattr(engine, 'parse_file', no_parsing)
+    monkeypatch.setattr(Verifier, 'verify', no_parsing)
+    other = VM(engine='blocks', memory_cache=programs)
+    other.load_file_code('data/sum.yaml')
+    assert other.method is vm.method
+    assert other.program() is vm.program()
+    assert other.run(1, 10) == ValueInt(55)
+    assert (programs.hits, programs.misses) == (1, 1)
+    monkeypatch.undo()
+    # options are part of the key
+    VM(memory_cache=programs, superinstructions=True).load_file_code('data/sum.yaml')
+    VM(memory_cache=programs).load_string_code(source())
+    assert (programs.hits, programs.misses, programs.evictions) == (1, 3, 1)
+    VM(memory_cache=programs).load_string_code(source().decode('utf-8'))
+    assert (programs.hits, programs.misses, programs.evictions) == (2, 3, 1)
+    assert len(programs) == 2
+
+
+def test_memory_cache_changed_file(tmpdir):
+    programs = cache.ProgramCache()
+    fname = str(tmpdir.join('sum.yaml'))
+    tmpdir.join('sum.yaml').write_binary(source())
+    vm = VM(memory_cache=programs)
+    vm.load_file_code(fname)
+    assert vm.run(1, 5) == ValueInt(15)
+    tmpdir.join('sum.yaml').write_binary(source().replace(b'iload: sum\n    - ireturn', b'ipush: 7\n    - ireturn'))
+    os.utime(fname, ns=(1, 1))
+    vm.load_file_code(fname)
+    assert vm.run(1, 5) == ValueInt(7)
+    assert programs.misses == 2
+
+
+def test_memory_cache_invalid_code():
+    programs = cache.ProgramCache()
+    vm = VM(memory_cache=programs)
+    pytest.raises(VerifyException, vm.load_file_code, 'test/fixtures/bubblesort_verify_bad_stack_height.yaml')
+    assert len(programs) == 0
@@ -0,0 +1,112 @@
+# -*- coding: utf-8  -*-
+import copy
+
+import pytest
+
+from TSBVMIP import compiler
+from TSBVMIP import code_parser as parser
+from TSBVMIP.engine import VM
+from TSBVMIP.exceptions import OutOfFuelException, RuntimeException, ValueException, VerifyException
+from TSBVMIP.value_containers import ValueInt, ValueIntArrayRef, convert_values
+import fixtures
+
+
+clean_code = dict(func={'name': 'n',
+                        'args': [
+                            {'type': 'int', 'label': 'a'},
+                            {'type': 'float', 'label': 'b'}
+                        ],
+                        'type': 'int'},
+                  lvars=[
+                      {'type': 'int', 'label': 'c'},
+                      {'type': 'float', 'label': 'd'}
+])
+
+
+def compile_ins(ins, type='int'):
+    cc = copy.deepcopy(clean_code)
+    cc['func']['type'] = type
+    cc['ins'] = ins
+    return compiler.compile_method(parser.process_yaml(cc))
+
+
+def test_data_sum():
+    vm = VM()
+    vm.load_file_code('data/sum.yaml')
+    compiled = vm.compile()
+    for args in [[1, 5], [3, 3], [-4, 10]]:
+        assert compiled(*vm.convert_args(args)) == vm.run(*vm.convert_args(args))
+    assert compiled(1, 5) == ValueInt(15)
+    pytest.raises(RuntimeException, compiled, 1)
+
+
+def test_data_bubblesort():
+    vm = VM()
+    vm.load_file_code('data/bubblesort.yaml')
+    compiled = vm.compile()
+    for data in [[5, 5, 1, -8, 2], [1], [3, 2, 1]]:
+        assert compiled(*vm.convert_args([data])) == vm.run(*vm.convert_args([data]))
+    ret = compiled(*vm.convert_args([[5, 5, 1, -8, 2]]))
+    assert ret == ValueIntArrayRef(convert_values(ValueIntArrayRef, [-8, 1, 2, 5, 5]))
+
+
+def test_source():
+    source = compiler.generate_source(parser.parse_string(fixtures.load('sum.code')))
+    assert source.startswith('def %s(v0, v1):' % compiler.FUNCTION_NAME)
+    assert 'v2 = v0' in source
+
+
+def test_store_keeps_stack_value():
+    # value loaded on the stack must survive a later store to the same local
+    f = compile_ins([{'iload': 'a'}, {'ipush': 7}, {'istore': 'a'}, {'iload': 'a'}, 'iadd', 'ireturn'])
+    assert f(3, 0.0) == 10
+
+
+def test_swap_dup_across_blocks():
+    f = compile_ins([{'iload': 'a'}, {'ipush': 1}, 'swap', 'dup', {'ipush': 0},
+                     {'if_icmpgt': 'positive'}, 'isub', 'ireturn',
+                     {'label': 'positive'}, 'iadd', 'ireturn'])
+    assert f(5, 0.0) == 6
+    assert f(-5, 0.0) == 6
+    assert f(0, 0.0) == 1
+
+
+def test_float_and_conversions():
+    f = compile_ins([{'fload': 'b'}, {'fpush': 2.0}, 'fdiv', 'f2i', {'iload': 'a'}, 'imul', 'ireturn'])
+    assert f(3, 5.0) == 6
+    f = compile_ins([{'iload': 'a'}, 'i2f', {'fpush': 0.5}, 'fmul', 'freturn'], type='float')
+    assert f(3, 0.0) == 1.5
+
+
+def test_division_is_not_dropped():
+    f = compile_ins([{'iload': 'a'}, {'ipush': 0}, 'idiv', 'pop', {'ipush': 1}, 'ireturn'])
+    pytest.raises(ZeroDivisionError, f, 1, 0.0)
+
+
+def test_newarray():
+    f = compile_ins([{'iload': 'a'}, {'newarray': 1}, 'arraylength', 'ireturn'])
+    assert f(4, 0.0) == 4
+    pytest.raises(ValueException, f, 0, 0.0)
+
+
+def test_verify():
+    pytest.raises(VerifyException, compile_ins, [{'fload': 'b'}, 'ireturn'])
+
+
+def test_metered():
+    vm = VM()
+    vm.load_file_code('data/bubblesort.yaml')
+    compiled = vm.compile(metered=True)
+    assert 'fuel' in compiled.source
+    ret = compiled(*vm.convert_args([[5, 3, 1, 2]]), fuel=1000)
+    assert ret == ValueIntArrayRef(convert_values(ValueIntArrayRef, [1, 2, 3, 5]))
+    vm.run(*vm.convert_args([[5, 3, 1, 2]]), fuel=1000)
+    assert compiled.fuel_used == vm.fuel_used
+    pytest.raises(OutOfFuelException, compiled, *vm.convert_args([[5, 3, 1, 2]]), fuel=compiled.fuel_used - 1)
+    for fuel in (0, 20):
+        pytest.raises(OutOfFuelException, compiled, *vm.convert_args([[5, 3, 1, 2]]), fuel=fuel)
+        pytest.raises(OutOfFuelException, vm.run, *vm.convert_args([[5, 3, 1, 2]]), fuel=fuel)
+        assert compiled.fuel_used == vm.fuel_used
+        assert compiled.fuel_used <= fuel
+    pytest.raises(RuntimeException, compiled, *vm.convert_args([[1]]))
+    assert 'fuel' not in vm.compile().source
@@ -0,0 +1,85 @@
+# -*- coding: utf-8  -*-
+from array import array
+
+import pytest
+
+import fixtures
+
+from TSBVMIP import dispatch
+from TSBVMIP.engine import VM
+from TSBVMIP.code_parser import parse_string
+from TSBVMIP.frame import Frame
+from TSBVMIP.exceptions import RuntimeException
+from TSBVMIP.value_containers import ValueInt, ValueIntArrayRef, ValueFloatArrayRef, convert_values
+
+
+def run_engine(engine, fname, args):
+    m = VM(engine=engine)
+    m.load_file_code(fname)
+    return m.run(*m.convert_args(args))
+
+
+def test_unknown_engine():
+    pytest.raises(RuntimeException, VM, engine='nope')
+
+
+@pytest.mark.parametrize('engine', ['dispatch', 'unboxed'])
+def test_data_sum(engine):
+    for args in [[1, 5], [3, 3], [-4, 10]]:
+        assert run_engine(engine, 'data/sum.yaml', args) == run_engine('interpreter', 'data/sum.yaml', args)
+    assert run_engine(engine, 'data/sum.yaml', [1, 5]) == ValueInt(15)
+
+
+@pytest.mark.parametrize('engine', ['dispatch', 'unboxed'])
+def test_data_bubblesort(engine):
+    for data in [[5, 5, 1, -8, 2], [1], [3, 2, 1]]:
+        expected = run_engine('interpreter', 'data/bubblesort.yaml', [data])
+        assert run_engine(engine, 'data/bubblesort.yaml', [data]) == expected
+    ret = run_engine(engine, 'data/bubblesort.yaml', [[5, 5, 1, -8, 2]])
+    assert ret == ValueIntArrayRef(convert_values(ValueIntArrayRef, [-8, 1, 2, 5, 5]))
+
+
+def test_decode():
+    m = parse_string(fixtures.load('sum.code'))
+    code = dispatch.decode(m)
+    assert len(code) == len(m.code)
+    frame = Frame(m, [ValueInt(2), ValueInt(4), ValueInt(), ValueInt()])
+    dispatch.execute(code, frame)
+    assert frame.finished is True
+    assert frame.return_value == ValueInt(9)
+    assert frame.stack == [ValueInt(5)]
+
+
+def test_unboxed_stack():
+    m = parse_string(fixtures.load('sum.code'))
+    code = dispatch.decode(m, dispatch.unboxed_handlers)
+    frame = Frame(m, [2, 4, None, None])
+    dispatch.execute(code, frame)
+    assert frame.return_value == 9
+    assert frame.stack == [5]
+    assert frame.variables == [2, 4, 9, 4]
+
+
+def test_unboxed_float_array():
+    vm = VM(engine='unboxed')
+    vm.load_string_code("""
+func:
+    name: f
+    args:
+        - label: a
+          type: float
+    type: floatarray
+ins:
+    - ipush: 2
+    - newarray: 1
+    - dup
+    - ipush: 1
+    - fload: a
+    - fpush: 0.5
+    - fmul
+    - fastore
+    - areturn
+""")
+    ret = vm.run(*vm.convert_args([3]))
+    assert ret.__class__ is ValueFloatArrayRef
+    assert ret.value == array('d', [0.0, 1.5])
@@ -1,11 +1,19 @@
 # -*- coding: utf-8  -*-
+import operator
+
 import pytest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import fixtures
 
 from TSBVMIP import value_containers
-from TSBVMIP import engine, frame, method
-from TSBVMIP.exceptions import RuntimeException
+from TSBVMIP import blocks, engine, frame, fusion, method, optimizer
+from TSBVMIP.analysis.verifier import Verifier
+from TSBVMIP.exceptions import ArrayValueException, OutOfFuelException, RuntimeException
 
 
 def test_empty_vm():
@@ -34,8 +42,213 @@ def test_ok():
     assert result.__class__ is value_containers.ValueInt
 
 
+def test_unknown_array_backend():
+    pytest.raises(RuntimeException, engine.VM, arrays='list')
+
+
 def test_args():
     vm = engine.VM()
     vm.load_file_code(fixtures.full_path('parse_ok.code'))
     pytest.raises(RuntimeException, vm.run)
     pytest.raises(RuntimeException, vm.run, 1, 1)
+
+
+@pytest.mark.parametrize('name', engine.ENGINES)
+def test_run_batch(name):
+    vm = engine.VM(engine=name)
+    vm.load_file_code('data/sum.yaml')
+    args = [vm.convert_args([1, n]) for n in range(1, 6)]
+    results = vm.run_batch(args)
+    assert [r.value for r in results] == [1, 3, 6, 10, 15]
+    assert vm.batch_stats.runs == 5
+    assert vm.batch_stats.throughput > 0
+    assert vm.frame.finished
+
+
+def test_run_batch_verifies_and_decodes_once(monkeypatch):
+    vm = engine.VM(engine='blocks')
+    vm.load_file_code('data/bubblesort.yaml')
+    calls = []
+    decode = blocks.decode
+    monkeypatch.setattr(blocks, 'decode', lambda *args: calls.append('decode') or decode(*args))
+    monkeypatch.setattr(vm, 'verify', lambda: calls.append('verify'))
+    results = vm.run_batch((vm.convert_args([data]) for data in [[3, 1, 2], [2, 1], [1]]))
+    assert calls == []
+    assert [list(r.value) for r in results] == [[1, 2, 3], [1, 2], [1]]
+    assert calls == ['verify', 'decode']
+
+
+def count_verifications(monkeypatch):
+    calls = []
+    verify = Verifier.verify
+    monkeypatch.setattr(Verifier, 'verify', lambda self, m: calls.append(m) or verify(self, m))
+    return calls
+
+
+@pytest.mark.parametrize('name', engine.ENGINES)
+def test_run_verifies_once(monkeypatch, name):
+    calls = count_verifications(monkeypatch)
+    vm = engine.VM(engine=name)
+    vm.load_file_code('data/sum.yaml')
+    args = vm.convert_args([1, 5])
+    for _ in range(3):
+        assert vm.run(*args) == value_containers.ValueInt(15)
+    assert len(calls) == 1 and vm.method.verified
+    assert vm.program() is vm.program()
+    # replaced code is verified and decoded again
+    program = vm.program()
+    fusion.fuse(vm.method)
+    assert not vm.method.verified
+    assert vm.run(*args) == value_containers.ValueInt(15)
+    assert len(calls) == 2
+    assert vm.program() is not program
+
+
+def test_run_without_verification(monkeypatch):
+    calls = count_verifications(monkeypatch)
+    vm = engine.VM()
+    vm.load_file_code('data/sum.yaml')
+    assert vm.run(*vm.convert_args([1, 5]), verify=False) == value_containers.ValueInt(15)
+    assert list(vm.run_batch([vm.convert_args([1, 5])], verify=False)) == [value_containers.ValueInt(15)]
+    assert calls == [] and not vm.method.verified
+
+
+def test_verified_state():
+    m = engine.parse_file('data/bubblesort.yaml')
+    assert not m.verified
+    optimizer.optimize(m)
+    assert m.verified
+    # verified method cannot be changed in place
+    pytest.raises(TypeError, operator.setitem, m.code, 0, m.code[1])
+    pytest.raises(TypeError, operator.setitem, m.labels, 'x', 0)
+    pytest.raises(TypeError, operator.setitem, m.variables, 0, m.variables[1])
+    for name in ('code', 'labels', 'variables', 'argument_count', 'return_type'):
+        m.freeze()
+        setattr(m, name, getattr(m, name))
+        assert not m.verified, name
+
+
+def test_run_batch_empty():
+    vm = engine.VM()
+    vm.load_file_code('data/sum.yaml')
+    assert list(vm.run_batch([])) == []
+    assert vm.batch_stats.runs == 0
+    assert vm.batch_stats.throughput == 0.0
+
+
+@pytest.mark.parametrize('superinstructions', [False, True])
+def test_fuel(superinstructions):
+    used = set()
+    for name in engine.ENGINES:
+        vm = engine.VM(engine=name, superinstructions=superinstructions)
+        vm.load_file_code('data/bubblesort.yaml')
+        ret = vm.run(*vm.convert_args([[5, 3, 1, 2]]), fuel=10000)
+        assert list(ret.value) == [1, 2, 3, 5]
+        used.add(vm.fuel_used)
+        with pytest.raises(OutOfFuelException):
+            vm.run(*vm.convert_args([[5, 3, 1, 2]]), fuel=vm.fuel_used - 1)
+        assert vm.fuel_used < min(used)
+        assert not vm.frame.finished
+    # fuel counts instructions regardless of engine and fusion
+    assert used == {296}
+
+
+@pytest.mark.parametrize('name', engine.ENGINES)
+def test_fuel_resume(name):
+    vm = engine.VM(engine=name)
+    vm.load_file_code('data/sum.yaml')
+    program = vm.program()
+    frame = program.new_frame((1, 100))
+    runs = 0
+    while True:
+        runs += 1
+        try:
+            program.execute(frame, fuel=50)
+            break
+        except OutOfFuelException:
+            pass
+    assert runs > 5
+    assert program.result(frame) == value_containers.ValueInt(5050)
+    unmetered = vm.run(1, 100, fuel=10 ** 6)
+    assert unmetered == value_containers.ValueInt(5050)
+    assert frame.fuel_used == vm.fuel_used
+
+
+@pytest.mark.parametrize('name', engine.ENGINES)
+def test_fuel_resume_inside_block(name):
+    vm = engine.VM(engine=name)
+    vm.load_file_code('data/sum.yaml')
+    program = vm.program()
+    frame = program.new_frame((1, 100))
+    assert not program.execute_steps(frame, 3)
+    program.execute(frame, fuel=10 ** 6)
+    assert program.result(frame) == value_containers.ValueInt(5050)
+    if name != 'blocks':
+        # only the instructions left in the block are charged
+        vm.run(1, 100, fuel=10 ** 6)
+        assert frame.fuel_used + 3 == vm.fuel_used
+
+
+# stores v into a[0] .. a[n - 1], n is checked against the array only when the bound is arraylength
+STORE = """
+func:
+    name: store
+    args:
+        - label: a
+          type: intarray
+        - label: v
+          type: int
+        - label: n
+          type: int
+    type: intarray
+lvars:
+    - label: i
+      type: int
+ins:
+    - ipush: 0
+    - istore: i
+    - label: loop
+    - iload: i
+    - %s
+    - if_icmpge: end
+    - aload: a
+    - iload: i
+    - iload: v
+    - iastore
+    - iload: i
+    - ipush: 1
+    - iadd
+    - istore: i
+    - goto: loop
+    - label: end
+    - aload: a
+    - areturn
+"""
+CHECKED = STORE % 'iload: n'
+UNCHECKED = STORE % 'aload: a\n    - arraylength'
+
+
+def test_convert_args_out_of_range():
+    vm = engine.VM()
+    vm.load_string_code(CHECKED)
+    pytest.raises(RuntimeException, vm.convert_args, [[2 ** 70, 1], 0, 0])
+
+
+def array_argument(arrays, data):
+    return numpy.array(data, dtype='int64') if arrays == 'numpy' else value_containers.convert_values(
+        value_containers.ValueIntArrayRef, data)
+
+
+@pytest.mark.parametrize('arrays', ['array', pytest.param('numpy', marks=pytest.mark.skipif(
+    numpy is None, reason='numpy is not installed'))])
+@pytest.mark.parametrize('source', [CHECKED, UNCHECKED])
+@pytest.mark.parametrize('superinstructions', [False, True])
+@pytest.mark.parametrize('name', engine.ENGINES)
+def test_store_out_of_range(name, superinstructions, source, arrays):
+    vm = engine.VM(engine=name, superinstructions=superinstructions, arrays=arrays)
+    vm.load_string_code(source)
+    result = vm.run(array_argument(arrays, [1, 2]), 2 ** 63 - 1, 2)
+    assert list(result.value) == [2 ** 63 - 1] * 2
+    for value in (2 ** 63, -2 ** 70):
+        pytest.raises(ArrayValueException, vm.run, array_argument(arrays, [1, 2]), value, 2)
+        pytest.raises(ArrayValueException, vm.compile(), array_argument(arrays, [1, 2]), value, 2)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8  -*-
+import copy
+
+import pytest
+
+import fixtures
+
+from TSBVMIP import fusion
+from TSBVMIP import instructions
+from TSBVMIP import opcodes
+from TSBVMIP import code_parser as parser
+from TSBVMIP.engine import VM, ENGINES
+from TSBVMIP.analysis.verifier import Verifier
+from TSBVMIP.analysis.interpreter import BasicVerifier
+from TSBVMIP.exceptions import VerifyException
+from TSBVMIP.value_containers import ValueInt
+
+
+clean_code = dict(func={'name': 'n',
+                        'args': [
+                            {'type': 'int', 'label': 'a'},
+                            {'type': 'int', 'label': 'b'}
+                        ],
+                        'type': 'int'},
+                  lvars=[
+                      {'type': 'int', 'label': 'c'},
+                      {'type': 'intarray', 'label': 'd'}
+])
+
+
+def test_fuse_bubblesort():
+    m = parser.parse_string(fixtures.load('bubblesort.code'))
+    length = len(m.code)
+    fusion.fuse(m)
+    assert len(m.code) < length * 3 // 4
+    ops = [ins.opcode for ins in m.code]
+    assert opcodes.IINC_DUP in ops
+    assert opcodes.IALOAD_LOCALS in ops
+    assert opcodes.ILOAD_ADD in ops
+    assert opcodes.IF_ICMP_LOAD in ops
+    assert Verifier(BasicVerifier()).verify(m)
+    # labels and branch targets moved to the same instructions
+    assert m.labels['newpass'] == 3
+    assert m.labels['startloop'] == 7
+    assert m.code[m.labels['startloop']].opcode == opcodes.IINC_DUP
+    assert m.labels['array'] == 0 and m.labels['length'] == 3
+
+
+def test_fuse_keeps_jump_targets():
+    cc = copy.deepcopy(clean_code)
+    cc['ins'] = [{'iload': 'a'}, {'label': 'x'}, {'iload': 'b'}, {'if_icmplt': 'x'}, {'iload': 'a'}, 'ireturn']
+    m = parser.process_yaml(cc)
+    fusion.fuse(m)
+    assert m.code[0] == instructions.InsILoad(ValueInt(0))
+    assert m.code[1].opcode == opcodes.IF_ICMP_LOAD
+    assert m.code[1].argument.value == 1
+    assert m.labels['x'] == 1
+
+
+def test_fused_if_icmp_locals():
+    cc = copy.deepcopy(clean_code)
+    cc['ins'] = [{'iload': 'a'}, {'iload': 'b'}, {'if_icmpgt': 'greater'},
+                 {'iload': 'b'}, 'ireturn',
+                 {'label': 'greater'}, {'iload': 'a'}, 'ireturn']
+    for engine in ENGINES:
+        vm = VM(engine=engine, superinstructions=True)
+        vm.load_method(parser.process_yaml(copy.deepcopy(cc)))
+        assert vm.method.code[0].opcode == opcodes.IF_ICMP_LOCALS
+        assert vm.method.code[0].argument.value == 3
+        assert vm.run(7, 3).value == 7
+        assert vm.run(2, 3).value == 3
+        assert vm.compile()(2, 9).value == 9
+
+
+def test_verifier_checks_parts():
+    cc = copy.deepcopy(clean_code)
+    cc['ins'] = [{'aload': 'd'}, {'iload': 'a'}, 'faload', 'pop', {'iload': 'a'}, 'ireturn']
+    m = fusion.fuse(parser.process_yaml(cc))
+    assert m.code[0].opcode == opcodes.FALOAD_LOCALS
+    pytest.raises(VerifyException, Verifier(BasicVerifier()).verify, m)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_data(engine):
+    for fname, args in [('data/sum.yaml', [1, 10]), ('data/bubblesort.yaml', [[5, 5, 1, -8, 2, 0]])]:
+        vm = VM(engine=engine, superinstructions=True)
+        vm.load_file_code(fname)
+        expected = VM()
+        expected.load_file_code(fname)
+        assert vm.run(*vm.convert_args(args)) == expected.run(*expected.convert_args(args))
+        assert vm.compile()(*vm.convert_args(args)) == expected.run(*expected.convert_args(args))
@@ -389,7 +389,7 @@ def test_iaload():
     frm.stack.append(value_containers.ValueInt(1))
     VM.exec_frame(frm, ins())
     sv = frm.stack.pop()
-    assert sv.is_none
+    assert sv == vt(0)
     assert sv.__class__ == vt
 
 
@@ -408,7 +408,7 @@ def test_faload():
     frm.stack.append(value_containers.ValueInt(1))
     VM.exec_frame(frm, ins())
     sv = frm.stack.pop()
-    assert sv.is_none
+    assert sv == vt(0)
     assert sv.__class__ == vt
 
 
@@ -424,7 +424,7 @@ def test_iastore():
     frm.stack.append(value_containers.ValueInt(5))
     VM.exec_frame(frm, ins())
     assert arr[0] == vt(5)
-    assert arr[1].is_none
+    assert arr[1].value == 0
     assert arr[1].__class__ == vt
 
 
@@ -440,7 +440,7 @@ def test_fastore():
     frm.stack.append(value_containers.ValueFloat(5.0))
     VM.exec_frame(frm, ins())
     assert arr[0] == vt(5.0)
-    assert arr[1].is_none
+    assert arr[1].value == 0
     assert arr[1].__class__ == vt
 
 
@@ -0,0 +1,93 @@
+# -*- coding: utf-8  -*-
+import pytest
+
+from TSBVMIP import engine
+from TSBVMIP.exceptions import ValueException
+from TSBVMIP.value_containers import ValueFloatArrayRef, ValueIntArrayRef
+
+numpy = pytest.importorskip('numpy')
+
+
+FILL_FLOATS = """
+func:
+    name: fill
+    args:
+        - label: a
+          type: floatarray
+    type: floatarray
+ins:
+    - aload: a
+    - ipush: 0
+    - fpush: 2.5
+    - fastore
+    - aload: a
+    - areturn
+"""
+
+NEW_ARRAY = """
+func:
+    name: new
+    args:
+        - label: n
+          type: int
+    type: intarray
+ins:
+    - iload: n
+    - newarray: 0
+    - dup
+    - ipush: 0
+    - ipush: 7
+    - iastore
+    - areturn
+"""
+
+
+@pytest.mark.parametrize('name', engine.ENGINES + ('compiled',))
+def test_bubblesort_in_place(name):
+    vm = engine.VM(engine='interpreter' if name == 'compiled' else name, arrays='numpy')
+    vm.load_file_code('data/bubblesort.yaml')
+    run = vm.compile() if name == 'compiled' else vm.run
+    data = numpy.array([5, 5, 1, -8, 2], dtype=numpy.int64)
+    ret = run(data)
+    assert ret.__class__ is ValueIntArrayRef
+    assert isinstance(ret.value, numpy.ndarray)
+    assert ret.value.tolist() == [-8, 1, 2, 5, 5]
+    # the argument buffer is sorted in place, result is a view of it
+    assert data.tolist() == [-8, 1, 2, 5, 5]
+    assert numpy.shares_memory(ret.value, data)
+
+
+@pytest.mark.parametrize('name', engine.ENGINES)
+def test_float_array(name):
+    vm = engine.VM(engine=name, arrays='numpy')
+    vm.load_string_code(FILL_FLOATS)
+    data = numpy.zeros(3)
+    ret = vm.run(data)
+    assert ret.__class__ is ValueFloatArrayRef
+    assert data.tolist() == [2.5, 0.0, 0.0]
+    assert numpy.shares_memory(ret.value, data)
+
+
+@pytest.mark.parametrize('name', engine.ENGINES)
+def test_new_array_exported(name):
+    vm = engine.VM(engine=name, arrays='numpy')
+    vm.load_string_code(NEW_ARRAY)
+    ret = vm.run(3)
+    assert ret.value.dtype == numpy.int64
+    assert ret.value.tolist() == [7, 0, 0]
+
+
+def test_converted_arguments():
+    vm = engine.VM(arrays='numpy')
+    vm.load_file_code('data/bubblesort.yaml')
+    # safe casts and non contiguous arrays are copied, lists still go through convert_args
+    assert vm.run(numpy.array([3, 1, 2], dtype=numpy.int32)).value.tolist() == [1, 2, 3]
+    assert vm.run(numpy.arange(6)[::-2]).value.tolist() == [1, 3, 5]
+    assert vm.run(*vm.convert_args([[2, 1]])).value.tolist() == [1, 2]
+
+
+def test_rejected_arguments():
+    vm = engine.VM(arrays='numpy')
+    vm.load_file_code('data/bubblesort.yaml')
+    pytest.raises(ValueException, vm.run, numpy.array([1.5, 2.0]))
+    pytest.raises(ValueException, vm.run, numpy.zeros((2, 2), dtype=numpy.int64))
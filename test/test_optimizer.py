@@ -0,0 +1,104 @@
+# -*- coding: utf-8  -*-
+import pytest
+
+from TSBVMIP import optimizer
+from TSBVMIP.code_parser import parse_string
+from TSBVMIP.engine import VM, ENGINES
+from TSBVMIP.exceptions import VerifyException
+from TSBVMIP.value_containers import ValueFloat, ValueInt
+
+
+HEADER = """
+func:
+    name: f
+    args:
+        - label: a
+          type: int
+    type: %s
+ins:
+"""
+
+
+def method(ins, type='int'):
+    return parse_string(HEADER % type + ''.join('    - %s\n' % i for i in ins))
+
+
+def opcodes(m):
+    return [str(ins) for ins in m.code]
+
+
+def test_fold_constants():
+    m = optimizer.optimize(method(['ipush: 2', 'ipush: 3', 'imul', 'ipush: 4', 'iadd', 'iload: a', 'iadd', 'ireturn']))
+    assert opcodes(m) == ['InsIPush <ValueInt(10)>', 'InsILoad <ValueInt(0)>', 'InsIAdd', 'InsIReturn']
+
+
+def test_fold_conversions():
+    m = optimizer.optimize(method(['ipush: 7', 'i2f', 'fpush: 2.0', 'fdiv', 'f2i', 'ireturn']))
+    assert opcodes(m) == ['InsIPush <ValueInt(3)>', 'InsIReturn']
+    m = optimizer.optimize(method(['ipush: 7', 'ipush: 2', 'idiv', 'i2f', 'freturn'], 'float'))
+    assert opcodes(m) == ['InsFPush <ValueFloat(3.0)>', 'InsFReturn']
+
+
+def test_division_by_zero_is_kept():
+    m = optimizer.optimize(method(['ipush: 7', 'ipush: 0', 'idiv', 'ireturn']))
+    assert len(m.code) == 4
+
+
+def test_no_effect():
+    m = optimizer.optimize(method(['iload: a', 'nop', 'dup', 'pop', 'ipush: 1', 'swap', 'swap', 'isub', 'nop', 'ireturn']))
+    assert opcodes(m) == ['InsILoad <ValueInt(0)>', 'InsIPush <ValueInt(1)>', 'InsISub', 'InsIReturn']
+
+
+def test_leading_nop():
+    m = optimizer.optimize(method(['nop', 'nop', 'ipush: 1', 'ireturn']))
+    assert opcodes(m) == ['InsIPush <ValueInt(1)>', 'InsIReturn']
+    vm = VM(optimize=True)
+    vm.load_method(method(['nop', 'ipush: 1', 'ireturn']))
+    assert vm.run(0) == ValueInt(1)
+
+
+def test_unreachable():
+    m = method(['iload: a', 'goto: end', 'label: dead', 'ipush: 1', 'goto: dead',
+                'label: end', 'ireturn'])
+    optimizer.optimize(m)
+    assert opcodes(m) == ['InsILoad <ValueInt(0)>', 'InsGoto <ValueInt(2)>', 'InsIReturn']
+    assert m.labels['end'] == 2
+    assert m.labels['dead'] == 2
+
+
+def test_jump_targets():
+    # jump into the middle of a sequence blocks folding, removed target nop moves the jump to the next instruction
+    m = method(['ipush: 1', 'label: loop', 'ipush: 2', 'iadd', 'dup', 'iload: a', 'if_icmplt: next',
+                'ireturn', 'label: next', 'nop', 'goto: loop'])
+    optimizer.optimize(m)
+    assert opcodes(m)[:3] == ['InsIPush <ValueInt(1)>', 'InsIPush <ValueInt(2)>', 'InsIAdd']
+    assert m.labels['loop'] == 1
+    assert m.code[m.labels['next']].opcode == m.code[-1].opcode
+    assert str(m.code[-1]) == 'InsGoto <ValueInt(1)>'
+
+
+def test_verify():
+    pytest.raises(VerifyException, optimizer.optimize, method(['fpush: 1.0', 'ireturn']))
+
+
+@pytest.mark.parametrize('fname', ['data/sum.yaml', 'data/bubblesort.yaml'])
+def test_data_unchanged_results(fname):
+    args = [1, 20] if 'sum' in fname else [[5, -1, 3, 3, 0]]
+    expected = None
+    for name in ENGINES:
+        vm = VM(engine=name, optimize=True)
+        vm.load_file_code(fname)
+        ret = vm.run(*vm.convert_args(args))
+        plain = VM(engine=name)
+        plain.load_file_code(fname)
+        assert ret == plain.run(*plain.convert_args(args))
+        expected = expected or ret
+        assert ret == expected
+
+
+def test_optimize_then_fuse():
+    vm = VM(engine='blocks', optimize=True, superinstructions=True)
+    vm.load_string_code(HEADER % 'float' + ''.join('    - %s\n' % i for i in
+                                                   ['ipush: 2', 'ipush: 2', 'imul', 'iload: a', 'iadd', 'i2f', 'freturn']))
+    assert len(vm.method.code) == 3
+    assert vm.run(3) == ValueFloat(7.0)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8  -*-
+import copy
+import multiprocessing
+import operator
+import pickle
+
+import pytest
+
+from TSBVMIP import parallel
+from TSBVMIP.code_parser import parse_file, parse_string
+from TSBVMIP.analysis.verifier import verify_method
+from TSBVMIP.engine import VM
+from TSBVMIP.exceptions import RuntimeException, VerifyException
+
+
+def test_chunks():
+    assert list(parallel.chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(parallel.chunks([], 3)) == []
+
+
+@pytest.mark.parametrize('engine', ['interpreter', 'blocks'])
+def test_run_many_ordered(engine):
+    method = parse_file('data/sum.yaml')
+    args = ((1, n) for n in range(1, 21))
+    results = parallel.run_many(method, args, workers=2, chunksize=3, engine=engine)
+    assert [r.value for r in results] == [n * (n + 1) // 2 for n in range(1, 21)]
+
+
+def test_run_many_spawn():
+    method = parse_file('data/sum.yaml')
+    results = parallel.run_many(method, [(1, n) for n in range(1, 5)], workers=1,
+                                mp_context=multiprocessing.get_context('spawn'))
+    assert [r.value for r in results] == [1, 3, 6, 10]
+
+
+def test_verified_method_is_copied():
+    method = verify_method(parse_file('data/bubblesort.yaml'))
+    for other in (pickle.loads(pickle.dumps(method)), copy.deepcopy(method)):
+        assert other.verified
+        assert other.code == method.code
+        assert list(other.labels.items()) == list(method.labels.items())
+        pytest.raises(TypeError, operator.setitem, other.labels, 'x', 0)
+    unverified = pickle.loads(pickle.dumps(parse_file('data/sum.yaml')))
+    assert not unverified.verified
+    unverified.labels['x'] = 0
+
+
+def test_run_many_unordered():
+    vm = VM()
+    vm.load_file_code('data/bubblesort.yaml')
+    data = [[3, 1, 2], [5, 4], [1], [9, 8, 7, 6]]
+    args = [vm.convert_args([d]) for d in data]
+    results = parallel.run_many(vm.method, args, workers=2, chunksize=1, ordered=False)
+    assert sorted(list(r.value) for r in results) == sorted(sorted(d) for d in data)
+
+
+def test_run_many_errors():
+    method = parse_file('data/sum.yaml')
+    pytest.raises(RuntimeException, list, parallel.run_many(method, [(1,)], workers=1))
+    pytest.raises(RuntimeException, list, parallel.run_many(method, [(1, 2)], chunksize=0))
+    bad = parse_string("""
+func:
+    name: bad
+    args:
+        - label: a
+          type: int
+    type: int
+ins:
+    - iload: a
+    - fpush: 1.0
+    - iadd
+    - ireturn
+""")
+    # verification happens before any worker is started
+    pytest.raises(VerifyException, next, parallel.run_many(bad, [(1,)], workers=1))
@@ -1,8 +1,11 @@
 # -*- coding: utf-8  -*-
 
 import copy
+import io
+import re
 
 import pytest
+import yaml
 
 import fixtures
 import TSBVMIP.instructions as ins
@@ -130,3 +133,171 @@ def test_instructions():
 def test_whole():
     m = parser.parse_string(fixtures.load('parse_ok.code'))
     assert m
+
+
+NATIVE_FILES = ['data/sum.yaml', 'data/sum_v2.yaml', 'data/bubblesort.yaml',
+                'test/fixtures/func.code', 'test/fixtures/variables.code', 'test/fixtures/instructions.code',
+                'test/fixtures/parse_ok.code', 'test/fixtures/sum.code', 'test/fixtures/bubblesort.code']
+
+SMALL = """func:
+  name: f
+  args: []
+  type: %s
+ins:
+- %s
+- %s
+"""
+
+
+def yaml_method(data):
+    return parser.process_yaml(yaml.safe_load(data))
+
+
+def same_method(m1, m2):
+    assert m1.code == m2.code
+    assert list(m1.labels.items()) == list(m2.labels.items())
+    assert m1.variables == m2.variables
+    assert (m1.function_name, m1.argument_count) == (m2.function_name, m2.argument_count)
+    assert m1.return_type.__class__ is m2.return_type.__class__
+
+
+@pytest.mark.parametrize('fname', NATIVE_FILES)
+def test_native(fname):
+    with open(fname) as f:
+        data = f.read()
+    same_method(parser.parse_native(data), yaml_method(data))
+    # windows line ends
+    same_method(parser.parse_native(data.replace('\n', '\r\n')), yaml_method(data))
+
+
+def test_native_forward_labels():
+    m = parser.parse_native(SMALL % ('int', 'goto: end', 'label: end\n- ipush: 1\n- ireturn'))
+    assert m.code[0] == ins.InsGoto(ValueInt(1))
+    assert list(m.labels.items()) == [('end', 1)]
+
+
+@pytest.mark.parametrize('value', ['0x10', '010', '1_000', '"3"', '-.5', '1e5', '1.0e+5', '.5', 'yes', '~'])
+def test_yaml_fallback(value):
+    data = SMALL % ('float', 'fpush: %s' % value, 'freturn')
+    try:
+        expected = yaml_method(data)
+    except Exception as e:
+        with pytest.raises(e.__class__) as info:
+            parser.parse_string(data)
+        assert str(info.value) == str(e)
+    else:
+        same_method(parser.parse_string(data), expected)
+
+
+def test_not_native():
+    pytest.raises(parser.NotNative, parser.parse_native, 'func: {name: f, args: [], type: int}\nins: [ireturn]')
+    pytest.raises(parser.NotNative, parser.parse_native, SMALL % ('int', 'ipush: "1"', 'ireturn'))
+    pytest.raises(parser.NotNative, parser.parse_native, SMALL % ('int', 'ipush:\t1', 'ireturn'))
+    m = parser.parse_string('func: {name: f, args: [], type: int}\nins: [{ipush: 1}, ireturn]')
+    assert m.code == [ins.InsIPush(ValueInt(1)), ins.InsIReturn()]
+
+
+@pytest.mark.parametrize('items', [
+    ('ipush: 1', 'label: end'),
+    ('goto: nowhere', 'ireturn'),
+    ('label: a', 'label: b'),
+    ('label: 1', 'ireturn'),
+    ('iadd: 1', 'ireturn'),
+    ('ipush', 'ireturn'),
+    ('ipush: 1.5', 'ireturn'),
+    ('ipush: x', 'ireturn'),
+    ('unknown', 'ireturn'),
+])
+def test_native_errors(items):
+    data = SMALL % (('int',) + items)
+    with pytest.raises(Exception) as expected:
+        yaml_method(data)
+    with pytest.raises(expected.value.__class__) as info:
+        parser.parse_string(data)
+    assert str(info.value) == str(expected.value)
+
+
+class OneWay(io.StringIO):
+
+    def seekable(self):
+        return False
+
+
+@pytest.mark.parametrize('fname', NATIVE_FILES)
+def test_stream(fname):
+    with open(fname) as f:
+        data = f.read()
+    with open(fname) as f:
+        same_method(parser.parse_stream(f), yaml_method(data))
+    same_method(parser.parse_stream(OneWay(data)), yaml_method(data))
+    same_method(parser.parse_file(fname), yaml_method(data))
+    # YAML events
+    same_method(parser.EventParser(io.StringIO(data)).parse(), yaml_method(data))
+
+
+@pytest.mark.parametrize('data', [
+    'func: {name: f, args: [], type: int}\nins: [{ipush: 1}, {label: end}, ireturn]',
+    'ins:\n- goto: end\n- label: end\n- ipush: 1\n- ireturn\n'
+    'func:\n  name: f\n  args: [{label: a, type: int}]\n  type: int\nlvars: [{label: x, type: float}]\n',
+    'func: {name: f, args: [], type: int}\nins: [{goto: end}, {label: end}, {ipush: 1}, ireturn]\n'
+    'lvars: [{label: x, type: float}]\n',
+])
+def test_stream_yaml(data):
+    expected = yaml_method(data)
+    same_method(parser.parse_stream(io.StringIO(data)), expected)
+    same_method(parser.EventParser(io.StringIO(data)).parse(), expected)
+
+
+def test_stream_not_seekable():
+    flow = 'func: {name: f, args: [], type: int}\nins: [ireturn]'
+    pytest.raises(ParserException, parser.parse_stream, OneWay(flow))
+
+
+def bubblesort(old, new):
+    with open('data/bubblesort.yaml') as f:
+        data = f.read()
+    assert old in data
+    return data.replace(old, new, 1)
+
+
+def outcome(parse, data):
+    try:
+        m = parse(data)
+    except Exception as e:
+        # YAML errors name the file instead of a string
+        return e.__class__, re.sub(r'in "[^"]*", line', 'in "<source>", line', str(e))
+    return [str(i) for i in m.code], list(m.labels.items()), m.function_name
+
+
+@pytest.mark.parametrize('data', [
+    bubblesort('- isub', '- isub 1'),
+    bubblesort('- ipush: 1', '- ipush: x'),
+    bubblesort('- ipush: 1', '- ipush: "1"'),
+    bubblesort('- ipush: 1', '- ipush: 1.5'),
+    bubblesort('- isub', '- isub: 1'),
+    bubblesort('- label: endloop', '- label: loop'),
+    bubblesort('    - iload: length', '  - iload: length'),
+    bubblesort('ins:', 'ins:\n    - goto: nowhere'),
+    # YAML keeps the last of repeated keys
+    'func: {name: f, args: [], type: int}\nins: [ireturn]\nfunc: {name: g, args: [], type: float}\n',
+    'func: &f {name: f, args: [], type: int}\nins: [{ipush: 1}, ireturn]\nlvars: []\nx: *f\n',
+    'func: {name: f, args: [], type: int}\nins: [ireturn]\n---\nins: [ireturn]\n',
+], ids=['no instruction', 'no integer', 'quoted integer', 'float integer', 'argument', 'duplicate label',
+        'indent', 'undefined label', 'repeated key', 'alias', 'documents'])
+def test_stream_errors(tmpdir, data):
+    fname = str(tmpdir.join('code.yaml'))
+    with open(fname, 'w') as f:
+        f.write(data)
+    expected = outcome(parser.parse_string, data)
+    assert outcome(lambda fname: parser.parse_file(fname), fname) == expected
+    assert outcome(lambda data: parser.EventParser(io.StringIO(data)).parse(), data)[0] in (expected[0], ParserException)
+    # a stream read once reports the same kind of error
+    assert outcome(lambda data: parser.parse_stream(OneWay(data)), data)[0] in (expected[0], ParserException)
+
+
+def test_stream_shares_instructions():
+    m = parser.parse_stream(io.StringIO(fixtures.load('sum.code')))
+    iadds = [i for i in m.code if isinstance(i, ins.InsIAdd)]
+    assert len(iadds) == 2 and iadds[0] is iadds[1]
+    loads = [i for i in m.code if isinstance(i, ins.InsILoad) and i.argument == m.code[0].argument]
+    assert len(loads) == 2 and loads[0] is loads[1]
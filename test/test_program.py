@@ -0,0 +1,135 @@
+# -*- coding: utf-8  -*-
+import asyncio
+import random
+import threading
+
+import pytest
+
+from TSBVMIP.code_parser import parse_file, parse_string
+from TSBVMIP.engine import VM, ENGINES
+from TSBVMIP.exceptions import RuntimeException, VerifyException
+from TSBVMIP.program import Program
+from TSBVMIP.value_containers import ValueInt, ValueIntArrayRef, convert_values
+
+
+def test_run():
+    program = Program(parse_file('data/sum.yaml'))
+    assert program.run(1, 5) == ValueInt(15)
+    assert program.run(1, 10) == ValueInt(55)
+    pytest.raises(RuntimeException, program.run, 1)
+
+
+def test_options():
+    method = parse_file('data/sum.yaml')
+    pytest.raises(RuntimeException, Program, method, engine='jit')
+    pytest.raises(RuntimeException, Program, method, arrays='list')
+
+
+def test_verify():
+    method = parse_string("""
+func:
+    name: bad
+    args:
+        - label: a
+          type: int
+    type: int
+ins:
+    - iload: a
+    - fpush: 1.0
+    - iadd
+    - ireturn
+""")
+    pytest.raises(VerifyException, Program, method)
+
+
+def test_frames_are_independent():
+    program = Program(parse_file('data/sum.yaml'), engine='dispatch')
+    first = program.new_frame((1, 3))
+    second = program.new_frame((1, 4))
+    program.execute(second)
+    program.execute(first)
+    assert program.result(first) == ValueInt(6)
+    assert program.result(second) == ValueInt(10)
+
+
+def test_vm_program():
+    vm = VM(engine='unboxed')
+    vm.load_file_code('data/bubblesort.yaml')
+    program = vm.program()
+    assert program.engine == 'unboxed'
+    ret = program.run(*vm.convert_args([[3, 1, 2]]))
+    assert ret == ValueIntArrayRef(convert_values(ValueIntArrayRef, [1, 2, 3]))
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_threads(engine):
+    program = Program(parse_file('data/bubblesort.yaml'), engine=engine)
+    errors = []
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        try:
+            for _ in range(20):
+                data = [rnd.randint(-100, 100) for _ in range(rnd.randint(1, 30))]
+                ret = program.run(convert_values(ValueIntArrayRef, data))
+                assert list(ret.value) == sorted(data)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_execute_steps(engine):
+    program = Program(parse_file('data/sum.yaml'), engine=engine)
+    frame = program.new_frame((1, 10))
+    slices = 1
+    while not program.execute_steps(frame, 5):
+        slices += 1
+    assert slices > 2
+    assert program.execute_steps(frame, 5)
+    assert program.result(frame) == ValueInt(55)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_run_async_interleaves(engine):
+    program = Program(parse_file('data/sum.yaml'), engine=engine)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0)
+
+    async def main():
+        task = asyncio.ensure_future(ticker())
+        result = await program.run_async(1, 200, slice=10)
+        task.cancel()
+        return result
+
+    assert asyncio.run(main()) == ValueInt(20100)
+    assert len(ticks) > 10
+    pytest.raises(RuntimeException, asyncio.run, program.run_async(1, 2, slice=0))
+
+
+def test_run_async_cancel():
+    vm = VM(engine='blocks')
+    vm.load_file_code('data/bubblesort.yaml')
+    data = vm.convert_args([list(range(300, 0, -1))])
+
+    async def main():
+        task = asyncio.ensure_future(vm.run_async(*data, slice=1))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await vm.run_async(*data)
+
+    ret = asyncio.run(main())
+    assert list(ret.value) == list(range(1, 301))
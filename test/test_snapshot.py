@@ -0,0 +1,119 @@
+# -*- coding: utf-8  -*-
+import struct
+
+import pytest
+
+from TSBVMIP import snapshot
+from TSBVMIP.analysis.controlflow import ControlFlowAnalyzer
+from TSBVMIP.code_parser import parse_file
+from TSBVMIP.engine import ENGINES
+from TSBVMIP.exceptions import OutOfFuelException, SnapshotException
+from TSBVMIP.program import Program
+from TSBVMIP.value_containers import ValueInt, ValueIntArrayRef, convert_values
+
+
+def sort_args(data):
+    return (convert_values(ValueIntArrayRef, data),)
+
+
+def stopped_frame(program, fuel, args):
+    frame = program.new_frame(args)
+    with pytest.raises(OutOfFuelException):
+        program.execute(frame, fuel=fuel)
+    return frame
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_resume(engine):
+    data = [9, -3, 7, 1, 0, 4]
+    program = Program(parse_file('data/bubblesort.yaml'), engine=engine)
+    frame = stopped_frame(program, 60, sort_args(data))
+    blob = snapshot.dumps(program, frame)
+    # restore into a program loaded from scratch, as another process would
+    other = Program(parse_file('data/bubblesort.yaml'), engine=engine)
+    restored = snapshot.loads(other, blob)
+    assert restored.pc == frame.pc
+    assert restored.fuel_used == frame.fuel_used
+    other.execute(restored)
+    assert list(other.result(restored).value) == sorted(data)
+    # snapshot is independent of the original frame
+    program.execute(frame)
+    assert list(program.result(frame).value) == sorted(data)
+
+
+def test_finished_frame():
+    program = Program(parse_file('data/sum.yaml'), engine='unboxed')
+    frame = program.new_frame((1, 10))
+    program.execute(frame)
+    restored = snapshot.loads(program, snapshot.dumps(program, frame))
+    assert restored.finished
+    assert program.result(restored) == ValueInt(55)
+
+
+def test_blocks_resume_inside_block():
+    method = parse_file('data/bubblesort.yaml')
+    unboxed = Program(method, engine='unboxed')
+    frame = unboxed.new_frame(sort_args([3, 2, 1]))
+    unboxed.execute_steps(frame, 9)
+    blocks = Program(method, engine='blocks')
+    assert blocks.code.block_index[frame.pc] < 0
+    restored = snapshot.loads(blocks, snapshot.dumps(unboxed, frame))
+    blocks.execute(restored)
+    assert list(blocks.result(restored).value) == [1, 2, 3]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_metered_resume_inside_block(engine):
+    method = parse_file('data/bubblesort.yaml')
+    program = Program(method, engine=engine)
+    full = program.new_frame(sort_args([3, 2, 1]))
+    program.execute(full, fuel=10 ** 6)
+    # blocks engine steps whole blocks, its frames inside a block come from unboxed snapshots
+    stepping = Program(method, engine='unboxed' if engine == 'blocks' else engine)
+    frame = stepping.new_frame(sort_args([3, 2, 1]))
+    stepping.execute_steps(frame, 9)
+    assert frame.pc not in [bb.start_inst_index for bb in ControlFlowAnalyzer().analyze(method)]
+    restored = snapshot.loads(program, snapshot.dumps(stepping, frame))
+    runs = 0
+    while True:
+        runs += 1
+        assert runs < 100
+        try:
+            program.execute(restored, fuel=30)
+            break
+        except OutOfFuelException:
+            pass
+    assert runs > 1
+    assert list(program.result(restored).value) == [1, 2, 3]
+    assert restored.fuel_used + 9 == full.fuel_used
+
+
+def test_shared_arrays_and_big_ints():
+    program = Program(parse_file('data/bubblesort.yaml'), engine='unboxed')
+    frame = program.new_frame(sort_args([1, 2]))
+    frame.stack.extend([frame.variables[0], 2 ** 100, -2 ** 70, 0.5, None])
+    restored = snapshot.loads(program, snapshot.dumps(program, frame))
+    assert restored.stack[0] is restored.variables[0]
+    assert restored.stack[1:] == [2 ** 100, -2 ** 70, 0.5, None]
+    assert restored.variables[1:] == frame.variables[1:]
+
+
+def test_boxed_values():
+    program = Program(parse_file('data/bubblesort.yaml'), engine='dispatch')
+    frame = stopped_frame(program, 20, sort_args([2, 1]))
+    restored = snapshot.loads(program, snapshot.dumps(program, frame))
+    assert restored.variables == frame.variables
+    assert [v.__class__ for v in restored.variables] == [v.__class__ for v in frame.variables]
+    assert restored.stack == frame.stack
+
+
+def test_errors():
+    program = Program(parse_file('data/bubblesort.yaml'), engine='unboxed')
+    blob = snapshot.dumps(program, stopped_frame(program, 20, sort_args([2, 1])))
+    pytest.raises(SnapshotException, snapshot.loads, Program(parse_file('data/sum.yaml'), engine='unboxed'), blob)
+    pytest.raises(SnapshotException, snapshot.loads, Program(program.method, engine='interpreter'), blob)
+    pytest.raises(SnapshotException, snapshot.loads, program, b'XXXX' + blob[4:])
+    pytest.raises(SnapshotException, snapshot.loads, program, blob[:4] + struct.pack('<H', 99) + blob[6:])
+    pytest.raises(SnapshotException, snapshot.loads, program, blob[:-1])
+    pytest.raises(SnapshotException, snapshot.loads, program, blob[:10])
+    pytest.raises(SnapshotException, snapshot.loads, program, blob + b'\0')
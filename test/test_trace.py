@@ -0,0 +1,49 @@
+# -*- coding: utf-8  -*-
+import io
+import json
+
+import pytest
+
+from TSBVMIP import trace
+from TSBVMIP.engine import VM
+from TSBVMIP.value_containers import ValueInt, ValueIntArrayRef
+
+
+def traced_run(engine, tracer):
+    vm = VM(engine=engine)
+    vm.load_file_code('data/sum.yaml')
+    return vm.run(*vm.convert_args([1, 2]), tracer=tracer)
+
+
+@pytest.mark.parametrize('engine', ['interpreter', 'dispatch', 'unboxed', 'blocks'])
+def test_callback(engine):
+    steps = []
+    ret = traced_run(engine, lambda pc, ins, stack: steps.append((pc, ins.opcode, len(stack))))
+    assert ret == ValueInt(3)
+    assert [pc for pc, _, _ in steps][:6] == [0, 1, 2, 3, 4, 5]
+    assert steps[-1][0] == 17
+    assert steps[-1][2] == 2
+
+
+def test_engines_trace_same():
+    lines = {}
+    for engine in ['interpreter', 'dispatch', 'unboxed']:
+        out = io.StringIO()
+        traced_run(engine, trace.JsonTracer(out))
+        lines[engine] = out.getvalue().splitlines()
+    assert lines['interpreter'] == lines['dispatch'] == lines['unboxed']
+    assert json.loads(lines['interpreter'][1]) == {'pc': 1, 'ins': 'InsIStore <ValueInt(2)>', 'stack': [1]}
+
+
+def test_text_tracer():
+    out = io.StringIO()
+    traced_run('interpreter', trace.TextTracer(out))
+    first = out.getvalue().splitlines()[0]
+    assert first.startswith('pc 0')
+    assert 'InsILoad' in first
+
+
+def test_plain():
+    assert trace.plain(ValueInt(3)) == 3
+    assert trace.plain(ValueIntArrayRef([ValueInt(1), ValueInt(2)])) == [1, 2]
+    assert trace.plain([1.5, None]) == [1.5, None]
@@ -1,8 +1,12 @@
 # -*- coding: utf-8  -*-
+from array import array
 
 import pytest
 
-from TSBVMIP.value_containers import ValueFloat, ValueInt, ValueIntArrayRef, ValueFloatArrayRef, ValueReference, convert_values
+from TSBVMIP import value_containers
+from TSBVMIP.exceptions import ValueException
+from TSBVMIP.value_containers import ValueFloat, ValueInt, ValueIntArrayRef, ValueFloatArrayRef, ValueReference, convert_values, box
+from TSBVMIP.value_containers import array_backends
 
 
 def test_eq():
@@ -22,7 +26,9 @@ def test_array_object():
     arr.allocate(10)
     arr[0] = ValueInt(5)
     assert arr[0] == ValueInt(5)
-    assert arr[1] == ValueInt()
+    assert arr[1] == ValueInt(0)
+    assert arr.value.typecode == 'q'
+    assert ValueFloatArrayRef([0.5])[0] == ValueFloat(0.5)
 
 
 def test_value_int():
@@ -45,13 +51,67 @@ def test_math():
     assert (ValueFloat(10) / ValueFloat(5)) == ValueFloat(2.0)
 
 
+def test_interned_values():
+    assert value_containers.int_value(5) is value_containers.int_value(5)
+    assert ValueInt(1000) + ValueInt(24) is value_containers.int_value(1024)
+    assert value_containers.int_value(10 ** 6) is value_containers.int_value(10 ** 6)
+    assert value_containers.int_value(2 ** 100) == ValueInt(2 ** 100)
+    assert ValueFloat(0.25) * ValueFloat(2.0) is value_containers.float_value(0.5)
+    assert value_containers.float_value(1 / 3) == ValueFloat(1 / 3)
+    # equal keys of different values stay apart
+    assert str(value_containers.float_value(-0.0)) == 'ValueFloat(-0.0)'
+    assert str(value_containers.float_value(0.0)) == 'ValueFloat(0.0)'
+    assert value_containers.float_value(1.0).value.__class__ is float
+    assert ValueIntArrayRef(array('q', [7]))[0] is value_containers.int_value(7)
+
+
+def test_values_are_immutable():
+    a = value_containers.int_value(7)
+    b = a + value_containers.int_value(1)
+    assert a == ValueInt(7) and b == ValueInt(8)
+    assert not hasattr(a, 'set_value')
+    assert box(ValueInt(), 7) is a
+
+
 def test_convert():
     assert convert_values(ValueInt, '1') == 1
     pytest.raises(Exception, convert_values, ValueInt, '1a')
     assert convert_values(ValueFloat, '1.5') == 1.5
     pytest.raises(Exception, convert_values, ValueFloat, '1a')
-    assert convert_values(ValueIntArrayRef, [1, '2', 3]) == [ValueInt(1), ValueInt(2), ValueInt(3)]
+    assert convert_values(ValueIntArrayRef, [1, '2', 3]) == array('q', [1, 2, 3])
     pytest.raises(Exception, convert_values, ValueIntArrayRef, '1a')
-    assert convert_values(ValueFloatArrayRef, [1, '2.0', 3]) == [ValueFloat(1.0), ValueFloat(2.0), ValueFloat(3.0)]
+    assert convert_values(ValueFloatArrayRef, [1, '2.0', 3]) == array('d', [1.0, 2.0, 3.0])
     pytest.raises(Exception, convert_values, ValueFloatArrayRef, '1a')
     pytest.raises(Exception, convert_values, ValueReference, [1, 2])
+
+
+def test_convert_out_of_range():
+    pytest.raises(ValueError, convert_values, ValueIntArrayRef, [2 ** 70, 1])
+    pytest.raises(ValueError, convert_values, ValueIntArrayRef, ['1', str(-2 ** 63 - 1)])
+    assert convert_values(ValueIntArrayRef, [2 ** 63 - 1]) == array('q', [2 ** 63 - 1])
+
+
+def test_box():
+    assert box(ValueInt(), 5) == ValueInt(5)
+    assert box(ValueFloat(), 0.5) == ValueFloat(0.5)
+    assert box(ValueFloatArrayRef(), array('d', [0.5])) == ValueFloatArrayRef(array('d', [0.5]))
+
+
+def test_convert_buffer():
+    ints = array('q', [1, 2, 3])
+    arr = convert_values(ValueIntArrayRef, ints)
+    assert arr == ints
+    assert arr is not ints
+    assert convert_values(ValueFloatArrayRef, memoryview(array('d', [0.5, 1.5]))) == array('d', [0.5, 1.5])
+    # buffer of other layout is converted element by element
+    assert convert_values(ValueFloatArrayRef, ints) == array('d', [1.0, 2.0, 3.0])
+    assert convert_values(ValueIntArrayRef, array('i', [4, 5])) == array('q', [4, 5])
+
+
+def test_array_backends(monkeypatch):
+    backend = array_backends['array']()
+    ints = array('q', [1])
+    assert backend.import_value(ValueIntArrayRef(), ints) is ints
+    assert backend.export_value(ValueIntArrayRef(), ints) is ints
+    monkeypatch.setattr(value_containers, 'numpy', None)
+    pytest.raises(ValueException, array_backends['numpy'])